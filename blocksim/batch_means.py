@@ -0,0 +1,74 @@
+import numpy as np
+
+# Observations averaged in each batch of the MSER-5 truncation rule
+MSER_BATCH_SIZE = 5
+
+
+def mser_truncation(series, batch_size=MSER_BATCH_SIZE) -> int:
+    """The number of initial observations of `series` to discard as the warm-up transient, with
+    the MSER rule (MSER-5 with the default `batch_size`).
+
+    The series is averaged in batches of `batch_size` observations, and the truncation is the
+    number of batches `d` that minimises the standard error of the mean of the remaining
+    batches, ``sum((y[d:] - mean(y[d:]))**2) / (m - d)**2``. Only truncations of up to half the
+    batches are considered, as a larger one means the run is too short to reach a steady state.
+    """
+    series = np.asarray(series, dtype=float)
+    m = len(series) // batch_size
+    if m < 2:
+        return 0
+    y = series[:m * batch_size].reshape(m, batch_size).mean(axis=1)
+    # Sums of the values and of their squares of the suffixes y[d:], for d = 0..m-1
+    sums = np.cumsum(y[::-1])[::-1]
+    squares = np.cumsum((y * y)[::-1])[::-1]
+    remaining = m - np.arange(m)
+    mser = (squares - sums * sums / remaining) / remaining ** 2
+    return int(np.argmin(mser[:m // 2 + 1])) * batch_size
+
+
+def batch_means(series, batches=20, confidence=0.95, truncate=True) -> dict:
+    """Confidence interval of the steady-state mean of an autocorrelated series of one long run
+    (e.g. the latency of each block), with the method of batch means.
+
+    The warm-up transient is discarded (see `mser_truncation`) and the remaining observations
+    are split in `batches` batches of the same size (the first observations that do not fill a
+    batch are discarded too). With batches large enough, the batch means are approximately
+    independent and normal, so the interval is the Student t interval of their mean. The lag-1
+    autocorrelation of the batch means is reported to check it: a high value means the batches
+    are too small for the run.
+
+    :param series: the observations, in the order of the simulation
+    :param int batches: the number of batches
+    :param float confidence: the confidence level of the interval
+    :param bool truncate: discard the warm-up transient
+    """
+    series = np.asarray(series, dtype=float)
+    truncated = mser_truncation(series) if truncate else 0
+    steady = series[truncated:]
+    batch_size = len(steady) // batches if batches > 1 else 0
+    result = {
+        'observations': len(series),
+        'truncated': truncated,
+        'batches': batches,
+        'batch_size': batch_size,
+        'mean': float(steady.mean()) if len(steady) else float('nan'),
+        'half_width': float('inf'),
+        'relative_half_width': float('inf'),
+        'lag1_autocorrelation': float('nan')
+    }
+    if batch_size == 0:
+        return result
+    from scipy.stats import t as student_t
+    # The extra observations are taken from the start, closer to the transient
+    means = steady[len(steady) - batches * batch_size:].reshape(batches, batch_size).mean(axis=1)
+    mean = means.mean()
+    half_width = student_t.ppf((1 + confidence) / 2, batches - 1) * means.std(ddof=1) / np.sqrt(batches)
+    deviations = means - mean
+    variance = np.dot(deviations, deviations)
+    result.update({
+        'mean': float(mean),
+        'half_width': float(half_width),
+        'relative_half_width': float(half_width / abs(mean)) if mean else float('inf'),
+        'lag1_autocorrelation': float(np.dot(deviations[1:], deviations[:-1]) / variance) if variance else 0.0
+    })
+    return result
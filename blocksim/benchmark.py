@@ -0,0 +1,378 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from blocksim.models.chain import Chain
+from blocksim.models.db import BaseDB
+from blocksim.models.network import Connection, Network
+from blocksim.models.ethereum.block import Block, BlockHeader
+from blocksim.models.ethereum.transaction import Transaction
+from blocksim.node_factory import NodeFactory
+from blocksim.report_engine import ReportEngine
+from blocksim.scenario_generator import generate_scenario
+from blocksim.transaction_factory import TransactionFactory
+from blocksim.utils import get_optimum_neighbours, get_random_values, initialize_node_values
+from blocksim.world import SimulationWorld
+
+MACRO_SIZES = (100, 200, 300, 500)
+BLOCKCHAINS = ('ethereum', 'bitcoin')
+# Number of nodes of the scenario used by the micro-benchmarks
+MICRO_NODES = 50
+# Minimum time (seconds) of each timed repetition of a micro-benchmark
+MIN_TIME = 0.2
+# Direction of the metrics, for the comparison. The other metrics are not compared
+HIGHER_IS_BETTER = ('ops_per_sec', 'events_per_sec', 'sim_seconds_per_wall_second')
+LOWER_IS_BETTER = ('us_per_op', 'retained_blocks_per_op', 'peak_traced_kB', 'wall_s', 'peak_rss_MB',
+                   'peak_traced_MB')
+
+
+@contextlib.contextmanager
+def _workdir(input_parameters='input-parameters'):
+    """Runs in a temporary working directory, with the `input-parameters` of the current one,
+    so the reports written by the simulations do not replace the ones of the repository"""
+    input_parameters = os.path.abspath(input_parameters)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.symlink(input_parameters, os.path.join(folder, 'input-parameters'))
+        os.mkdir(os.path.join(folder, 'reports'))
+        os.chdir(folder)
+        try:
+            yield folder
+        finally:
+            os.chdir(cwd)
+
+
+@contextlib.contextmanager
+def _quiet():
+    """The simulator logs every event in the standard output"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _create_world(duration: int, blockchain: str, initial_time=None):
+    return SimulationWorld(
+        duration,
+        int(time.time()) if initial_time is None else initial_time,
+        'input-parameters/config.json',
+        'input-parameters/latency.json',
+        'input-parameters/throughput-received.json',
+        'input-parameters/throughput-sent.json',
+        'input-parameters/delays.json',
+        blockchain)
+
+
+def _create_nodes(folder_path: str, num: int, blockchain: str, duration=3600):
+    input_data = initialize_node_values(folder_path=folder_path, algo='mst', run_id=0, num=num)
+    world = _create_world(duration, blockchain)
+    network = Network(world.env, 'NetworkXPTO')
+    nodes = NodeFactory(world, network).create_nodes_from_read_data(input_data)
+    return world, network, nodes
+
+
+def measure(name: str, prepare, repeat=5, min_time=MIN_TIME):
+    """Measures a micro-benchmark. `prepare(n)` prepares `n` operations and returns the function
+    that runs them, so only the operations are timed.
+
+    The number of operations is calibrated to run for at least `min_time` seconds, and the best
+    of `repeat` repetitions is reported, with the memory blocks retained after the
+    operations (`sys.getallocatedblocks`) and the peak memory traced by `tracemalloc`.
+    """
+    n = 1
+    while True:
+        run = prepare(n)
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or n >= 10**7:
+            break
+        n *= 2 if elapsed < min_time / 10 else 1 + int(min_time / max(elapsed, 1e-9))
+    best = elapsed
+    for _ in range(repeat - 1):
+        run = prepare(n)
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    run = prepare(n)
+    blocks = sys.getallocatedblocks()
+    run()
+    retained_blocks = sys.getallocatedblocks() - blocks
+    run = prepare(n)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'name': name,
+        'operations': n,
+        'us_per_op': best / n * 10**6,
+        'ops_per_sec': n / best,
+        'retained_blocks_per_op': retained_blocks / n,
+        'peak_traced_kB': peak / 1024
+    }
+
+
+def _transaction_hash(n):
+    txs = [Transaction('dest', f'sender{i}', 140, 'sign', i, 2, 1000, 0) for i in range(n)]
+
+    def run():
+        for tx in txs:
+            tx.hash
+    return run
+
+
+def _block_header_hash(n):
+    headers = [BlockHeader(number=i, timestamp=1500000000 + i, coinbase='miner') for i in range(n)]
+
+    def run():
+        for header in headers:
+            header.hash
+    return run
+
+
+def _random_values(distribution, size):
+    def prepare(n):
+        def run():
+            for _ in range(n):
+                get_random_values(distribution, size)
+        return run
+    return prepare
+
+
+def _chain_reorgs(node):
+    """Each operation adds two blocks at the same height: the second one has more difficulty and
+    replaces the first one in the head (a reorg)"""
+    def prepare(n):
+        genesis = Block(BlockHeader())
+        chain = Chain(node.env, node, node.consensus, genesis, BaseDB())
+        blocks = []
+        parent = genesis.header
+        for i in range(1, n + 1):
+            main = Block(BlockHeader(parent.hash, i, i, 'main', 10))
+            side = Block(BlockHeader(parent.hash, i, i, 'side', 10**7))
+            blocks.extend((main, side))
+            parent = side.header
+
+        def run():
+            for block in blocks:
+                chain.add_block(block)
+        return run
+    return prepare
+
+
+def _broadcast(world, nodes):
+    """Broadcasts a new block from a node connected to all the other nodes. The sessions have
+    no listening process, so the reaction of the neighbours is not measured"""
+    env = world.env
+    node = nodes[0]
+    for other in nodes.values():
+        if other.address != node.address:
+            node.active_sessions[other.address] = {
+                'connection': Connection(env, node, other),
+                'knownTxs': {''},
+                'knownBlocks': {''}
+            }
+            env.data['block_propagation'][f'{node.address}_{other.address}'] = {}
+
+    def prepare(n):
+        messages = [node.network_message.new_blocks({f'{i:064x}': i}) for i in range(n)]
+
+        def run():
+            for msg in messages:
+                env.process(node.broadcast(msg))
+                env.run()
+            for session in node.active_sessions.values():
+                session['connection'].store.items.clear()
+        return run
+    return prepare
+
+
+def _report_engine(folder_path, blockchain='ethereum', duration=3600):
+    """Builds the report of a short simulation of the micro-benchmark scenario"""
+    from blocksim.main import report_node_chain
+    world, network, nodes = _create_nodes(folder_path, MICRO_NODES, blockchain, duration)
+    world.env.process(network.start_heartbeat())
+    for node_id, node in nodes.items():
+        node.connect(get_optimum_neighbours(node_id, nodes))
+    TransactionFactory(world).broadcast(10, 40, 15, nodes)
+    world.start_simulation()
+    nodes_list = list(nodes.values())
+    report_node_chain(world, nodes_list)
+
+    def prepare(n):
+        def run():
+            for _ in range(n):
+                ReportEngine(nodes_list, world.env.data)
+        return run
+    return prepare
+
+
+def run_micro(repeat=5):
+    """Runs the micro-benchmarks of the hot paths of the simulator. Returns the results of each one"""
+    results = []
+    with _workdir() as folder, _quiet():
+        scenarios = os.path.join(folder, 'scenarios/')
+        generate_scenario(MICRO_NODES, 0, scenarios, seed=MICRO_NODES, topologies=('mst',))
+        world, _, nodes = _create_nodes(scenarios, MICRO_NODES, 'ethereum')
+        distribution = world.env.delays['block_validation']
+        benchmarks = [
+            ('transaction_hash', _transaction_hash),
+            ('block_header_hash', _block_header_hash),
+            ('get_random_values', _random_values(distribution, 1)),
+            ('get_random_values_batch_1024', _random_values(distribution, 1024)),
+            ('chain_add_block_reorg', _chain_reorgs(nodes[0])),
+            (f'node_broadcast_{MICRO_NODES - 1}_peers', _broadcast(world, nodes)),
+            (f'report_engine_{MICRO_NODES}_nodes', _report_engine(scenarios))
+        ]
+        for name, prepare in benchmarks:
+            result = measure(name, prepare, repeat)
+            results.append(result)
+            print(f'{name}: {result["us_per_op"]:.2f} us/op', file=sys.stderr)
+    return results
+
+
+def _run_scenario(folder_path: str, num: int, blockchain: str, duration: int, allocations: bool):
+    """Runs a macro scenario, in a new process (see `run_macro`)"""
+    from blocksim.main import run_model
+    from blocksim.options import OnWorld
+    worlds = []
+    with _workdir(), _quiet():
+        start = time.perf_counter()
+        run_model(0, 'mst', num, seed=1, duration=duration, blockchain=blockchain, folder_path=folder_path,
+                  observers=[OnWorld(worlds.append)])
+        wall = time.perf_counter() - start
+        env = worlds[0].env
+        # The events scheduled but not processed are still in the queue
+        events = next(env._eid) - len(env._queue)
+        result = {
+            'name': f'{blockchain}_{num}_nodes',
+            'nodes': num,
+            'blockchain': blockchain,
+            'sim_seconds': duration,
+            'events': events,
+            'wall_s': wall,
+            'events_per_sec': events / wall,
+            'sim_seconds_per_wall_second': duration / wall,
+            'peak_rss_MB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        }
+        if allocations:
+            tracemalloc.start()
+            run_model(0, 'mst', num, seed=1, duration=duration, blockchain=blockchain, folder_path=folder_path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result['peak_traced_MB'] = peak / 2**20
+    return result
+
+
+def run_macro(sizes=MACRO_SIZES, blockchains=BLOCKCHAINS, duration=3600, folder_path=None, allocations=False):
+    """Runs the macro scenarios: the simulation of the `mst` topology of each network size, for
+    `duration` simulated seconds, with each blockchain.
+
+    The scenarios are read from `folder_path` (run 0), or generated with
+    `blocksim.scenario_generator` when it is not given. Each simulation runs in a new process,
+    so the peak RSS is its own. With `allocations`, each simulation runs again with `tracemalloc`,
+    to measure the peak of the memory allocated by Python.
+    """
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as folder:
+        if folder_path is None:
+            folder_path = os.path.join(folder, '')
+            for num in sizes:
+                generate_scenario(num, 0, folder_path, seed=num, topologies=('mst',))
+        folder_path = os.path.join(os.path.abspath(folder_path), '')
+        for num in sizes:
+            for blockchain in blockchains:
+                with context.Pool(1) as pool:
+                    result = pool.apply(_run_scenario, (folder_path, num, blockchain, duration, allocations))
+                results.append(result)
+                print(f'{result["name"]}: {result["events_per_sec"]:.0f} events/s, '
+                      f'{result["sim_seconds_per_wall_second"]:.1f} sim s/s, '
+                      f'{result["peak_rss_MB"]:.0f} MB', file=sys.stderr)
+    return results
+
+
+def compare(baseline: dict, results: dict, threshold=0.1):
+    """Compares the results of two benchmark runs. Returns the rows of the comparison
+    ``(benchmark, metric, baseline, result, change, regression)``, where `change` is the relative
+    change of the metric and a regression is a change to worse beyond the `threshold`"""
+    rows = []
+    for section in ('micro', 'macro'):
+        baseline_results = {result['name']: result for result in baseline.get(section, [])}
+        for result in results.get(section, []):
+            base = baseline_results.get(result['name'])
+            if base is None:
+                continue
+            for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+                if metric not in result or metric not in base or not base[metric]:
+                    continue
+                change = (result[metric] - base[metric]) / abs(base[metric])
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                rows.append((f'{section}/{result["name"]}', metric, base[metric], result[metric], change,
+                             worse > threshold))
+    return rows
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the simulator')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='runs the benchmarks')
+    run.add_argument('--micro-only', action='store_true')
+    run.add_argument('--macro-only', action='store_true')
+    run.add_argument('--sizes', type=int, nargs='+', default=list(MACRO_SIZES), help='nodes of the macro scenarios')
+    run.add_argument('--blockchains', nargs='+', choices=BLOCKCHAINS, default=list(BLOCKCHAINS))
+    run.add_argument('--duration', type=int, default=3600, help='simulated seconds of the macro scenarios')
+    run.add_argument('--repeat', type=int, default=5, help='repetitions of the micro-benchmarks')
+    run.add_argument('--allocations', action='store_true',
+                     help='measure the memory allocated by the macro scenarios (runs them twice)')
+    run.add_argument('--scenarios', default=None, help='folder of the macro scenarios (generated by default)')
+    run.add_argument('--output', default='reports/benchmark.json')
+    comparison = commands.add_parser('compare', help='compares the results with a baseline')
+    comparison.add_argument('baseline')
+    comparison.add_argument('results')
+    comparison.add_argument('--threshold', type=float, default=0.1,
+                            help='relative change to worse reported as a regression')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        rows = compare(_read_json(args.baseline), _read_json(args.results), args.threshold)
+        print(f'{"benchmark":<40} {"metric":<28} {"baseline":>12} {"result":>12} {"change":>8}')
+        for benchmark, metric, base, result, change, regression in rows:
+            print(f'{benchmark:<40} {metric:<28} {base:>12.4g} {result:>12.4g} {change:>+8.1%}'
+                  f'{"  REGRESSION" if regression else ""}')
+        regressions = sum(row[-1] for row in rows)
+        print(f'{regressions} regressions beyond {args.threshold:.0%}')
+        return 1 if regressions else 0
+
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'micro': [],
+        'macro': []
+    }
+    if not args.macro_only:
+        results['micro'] = run_micro(args.repeat)
+    if not args.micro_only:
+        results['macro'] = run_macro(args.sizes, args.blockchains, args.duration, args.scenarios, args.allocations)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
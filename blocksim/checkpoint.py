@@ -0,0 +1,291 @@
+import os
+import pickle
+import random
+import signal
+import sys
+import traceback
+import multiprocessing
+import numpy as np
+from blocksim import utils
+
+
+def capture_state(world, network):
+    """Captures the state of the simulation that can be serialized: the simulated time,
+    the monitors (`env.data`), the random number generators and, for each node, the chain,
+    the transaction queue and the known transactions and blocks of each session.
+
+    The pending events of SimPy are Python generators, which cannot be serialized. Only
+    the number of pending events and the time of the next one are captured."""
+    env = world.env
+    nodes = {}
+    for address, node in network._nodes.items():
+        sessions = {}
+        for peer, session in node.active_sessions.items():
+            sessions[peer] = {k: v for k, v in session.items() if k != 'connection'}
+        nodes[address] = {
+            'head': node.chain._head_hash,
+            'chain': node.chain.db.db,
+            'parent_queue': node.chain.parent_queue,
+            'transaction_queue': list(node.transaction_queue._transaction_queue) if node.is_mining else None,
+            'sessions': sessions,
+            'temp_headers': node.temp_headers,
+            'temp_txs': node.temp_txs
+        }
+    queue = env._queue
+    return {
+        'time': env.now,
+        'data': env.data,
+        'pending_events': len(queue),
+        'next_event_time': queue[0][0] if queue else None,
+        'random': get_random_state(),
+        'nodes': nodes
+    }
+
+
+def save_state(state: dict, path: str):
+    with open(path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_state(path: str):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def get_random_state():
+    """Returns the state of all the random number generators used by the simulation"""
+    return {
+        'numpy_generator': utils.rng.bit_generator.state,
+        'numpy_global': np.random.get_state(),
+        'python': random.getstate()
+    }
+
+
+def set_random_state(state: dict):
+    utils.rng.bit_generator.state = state['numpy_generator']
+    np.random.set_state(state['numpy_global'])
+    random.setstate(state['python'])
+
+
+def reseed(seed: int):
+    """Reseeds all the random number generators used by the simulation. The shared NumPy
+    generator is reseeded in place, so the models holding it see the new seed"""
+    utils.rng.bit_generator.state = np.random.default_rng(seed).bit_generator.state
+    np.random.seed(seed)
+    random.seed(seed)
+
+
+class Checkpointer:
+    """Runs a simulation with a checkpoint every `interval` simulated seconds, from which the
+    run is resumed if the simulation crashes.
+
+    A SimPy simulation cannot be written to disk and read back: the pending events and the
+    node processes are Python generators, which cannot be serialized. To resume a run exactly,
+    a checkpoint is a snapshot process: the simulation forks, the child continues the
+    simulation and the parent keeps the state at the checkpoint (including the pending events
+    and the random number generators) while it waits for the child. If the child crashes, the
+    snapshot forks a new child which continues from the checkpoint, up to `max_retries` times.
+    There is one snapshot process per checkpoint, sharing memory copy-on-write, and all of them
+    exit when the simulation finishes. Snapshots need `os.fork` (POSIX only).
+
+    The snapshots only cover the simulation loop (see `run`): the process that finishes the
+    simulation calls `finish` (e.g. the reports) and sends its result to the calling process,
+    which is the only one that returns. Only a crash of the simulation is retried; an error of
+    `finish` is raised by `run`.
+
+    The state that can be serialized (see `capture_state`) is written to `directory` in each
+    checkpoint, to inspect the simulation or to analyse a crashed run. A run cannot be resumed
+    from these files, only from the snapshots.
+
+    :param world: the simulation world
+    :param network: the network of the simulation, used to find the nodes
+    :param float interval: the simulated seconds between checkpoints
+    :param str directory: where the checkpoint states are written. If None, they are not written
+    :param bool snapshots: if the checkpoints keep a snapshot process to resume the run after a crash
+    :param int max_retries: number of times the run is resumed from the same snapshot
+    """
+
+    def __init__(self, world, network, interval: float, directory: str = None, snapshots=True, max_retries=3):
+        self._world = world
+        self._network = network
+        self._interval = interval
+        self._directory = directory
+        self._snapshots = snapshots and hasattr(os, 'fork')
+        self._max_retries = max_retries
+        self._results = None
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def run(self, finish=None):
+        """Runs the simulation until the end and then calls `finish` without arguments. Returns
+        the result of `finish`, which must be picklable.
+
+        The simulation runs in a child process, so a crash before the first checkpoint is
+        resumed from the start. The process group of the child is killed if this process is
+        interrupted, so no snapshot outlives the run."""
+        if not self._snapshots:
+            self._world.start_simulation(self._interval, self._checkpoint)
+            return None if finish is None else finish()
+        receiver, self._results = multiprocessing.get_context('fork').Pipe(duplex=False)
+        try:
+            for attempt in range(self._max_retries + 1):
+                pid = self._fork()
+                if pid == 0:
+                    os.setpgid(0, 0)
+                    self._simulate(finish)
+                try:
+                    os.setpgid(pid, pid)
+                except OSError:
+                    pass
+                try:
+                    exit_code, result = self._wait_result(pid, receiver)
+                except BaseException:
+                    _kill_group(pid)
+                    _reap(pid)
+                    raise
+                if result is not None:
+                    status, value = result
+                    if status == 'error':
+                        raise value
+                    return value
+                # The child is gone, but not necessarily the snapshots it forked
+                _kill_group(pid)
+                self._crashed(exit_code, attempt, 'the start')
+            raise RuntimeError(f'The simulation crashed {self._max_retries + 1} times from the start')
+        finally:
+            receiver.close()
+            self._results.close()
+            self._results = None
+
+    def _fork(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        return os.fork()
+
+    def _simulate(self, finish):
+        """Runs the simulation in a child process, which never returns. The process that
+        finishes it sends the result of `finish` to the calling process"""
+        try:
+            self._world.start_simulation(self._interval, self._checkpoint)
+        except BaseException:
+            traceback.print_exc()
+            _exit(1)
+        try:
+            result = ('ok', None if finish is None else finish())
+        except Exception as error:
+            result = ('error', error)
+        self._send(result)
+        _exit(0)
+
+    def _checkpoint(self, world):
+        if self._directory is not None:
+            path = os.path.join(self._directory, f'checkpoint_{int(world.env.now)}.pkl')
+            save_state(capture_state(world, self._network), path)
+        if self._results is None:
+            return
+        # The parent is the snapshot: it waits for the child, which continues the simulation,
+        # and exits once the result is sent
+        for attempt in range(self._max_retries + 1):
+            pid = self._fork()
+            if pid == 0:
+                return
+            _, status = os.waitpid(pid, 0)
+            exit_code = os.waitstatus_to_exitcode(status)
+            if exit_code == 0:
+                _exit(0)
+            self._crashed(exit_code, attempt, f'the checkpoint at {world.env.now}')
+        self._send(('error', RuntimeError(
+            f'The simulation crashed {self._max_retries + 1} times from the checkpoint at {world.env.now}')))
+        _exit(0)
+
+    def _crashed(self, exit_code: int, attempt: int, checkpoint: str):
+        if attempt < self._max_retries:
+            print(f'Checkpoint: simulation crashed (exit code {exit_code}), resuming from {checkpoint} '
+                  f'({attempt + 1}/{self._max_retries})', file=sys.stderr)
+
+    def _send(self, result):
+        try:
+            self._results.send(result)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            self._results.send(('error', RuntimeError(traceback.format_exc())))
+
+    @staticmethod
+    def _wait_result(pid: int, receiver):
+        """Waits for the result of the simulation or for the exit of the child `pid`. Returns
+        the exit code of the child and the result, which is None if the child crashed"""
+        while not receiver.poll(1):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                exit_code = os.waitstatus_to_exitcode(status)
+                # The result is sent before the child exits
+                return exit_code, receiver.recv() if exit_code == 0 and receiver.poll() else None
+        result = receiver.recv()
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status), result
+
+
+def _exit(exit_code: int):
+    """Exits a process forked by the `Checkpointer`, without running the code of the caller"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(exit_code)
+
+
+def _kill_group(pid: int):
+    """Kills the processes of the simulation forked as `pid` (its process group)"""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _reap(pid: int):
+    try:
+        os.waitpid(pid, 0)
+    except ChildProcessError:
+        pass
+
+
+def fork_replicas(seeds: list, run, processes: int = None, on_reseed=None, streams=None):
+    """Forks the current simulation into one run per seed and returns the results of `run`
+    in each of them, in the order of the `seeds`.
+
+    It is used after the warm-up of a simulation: the runs start from the same state,
+    without repeating the setup, and only differ in the seed of the random number
+    generators. `run` is called without arguments in the forked process and its result
+    must be picklable. At most `processes` runs are executed at the same time (defaults
+    to the number of CPUs). `on_reseed` is called after reseeding, to discard the random
+    values that the models have drawn in advance (e.g. `Network.discard_samples`). The
+    `streams` of a seeded simulation (`blocksim.random_streams.RandomStreams`) are reseeded
+    with the seed of each replica."""
+    context = multiprocessing.get_context('fork')
+    processes = processes or os.cpu_count()
+    results = [None] * len(seeds)
+    running = []
+    pending = list(enumerate(seeds))
+
+    def replica(seed, conn):
+        reseed(seed)
+        if streams is not None:
+            streams.reseed(seed)
+        if on_reseed is not None:
+            on_reseed()
+        conn.send(run())
+        conn.close()
+
+    while pending or running:
+        while pending and len(running) < processes:
+            i, seed = pending.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            sys.stdout.flush()
+            process = context.Process(target=replica, args=(seed, sender))
+            process.start()
+            sender.close()
+            running.append((i, process, receiver))
+        i, process, receiver = running.pop(0)
+        try:
+            results[i] = receiver.recv()
+        except EOFError:
+            raise RuntimeError(f'Replica with seed {seeds[i]} failed') from None
+        process.join()
+    return results
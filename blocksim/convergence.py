@@ -0,0 +1,157 @@
+from math import ceil, sqrt
+import numpy as np
+
+# Confirmations of a block to be final, as in `ReportEngine._get_average_finality_time`
+FINALITY_DELTA = 6
+
+
+class RelativePrecisionRule:
+    """Stopping rule: the half-width of the confidence interval of the mean is below `epsilon`
+    times the mean, with at least `min_samples` values.
+
+    :param float epsilon: the maximum relative half-width
+    :param float confidence: the confidence level of the interval
+    :param int min_samples: the minimum number of values
+    """
+
+    def __init__(self, epsilon=0.05, confidence=0.95, min_samples=30):
+        self.epsilon = epsilon
+        self.confidence = confidence
+        self.min_samples = min_samples
+
+    def __call__(self, values):
+        """Returns if the values converged, their mean and the relative half-width"""
+        n = len(values)
+        if n < max(self.min_samples, 2):
+            return False, float(np.mean(values)) if n else float('nan'), float('inf')
+        from scipy.stats import t as student_t
+        values = np.asarray(values, dtype=float)
+        mean = values.mean()
+        half_width = student_t.ppf((1 + self.confidence) / 2, n - 1) * values.std(ddof=1) / sqrt(n)
+        relative = half_width / abs(mean) if mean else float('inf')
+        return relative <= self.epsilon, float(mean), float(relative)
+
+    def __repr__(self):
+        return f'relative CI half-width <= {self.epsilon} ({self.confidence:.0%} confidence, >= {self.min_samples} values)'
+
+
+class ConvergenceController:
+    """Stops a simulation when the block propagation latency and the finality time have
+    converged, as a SimPy process of the world (see `main.run_model`).
+
+    The controller is notified when the head of a chain changes (`env.convergence`, see
+    `Chain._set_head`) and keeps, for each block, the first time it is the head of each node.
+    Every `interval` simulated seconds it computes:
+
+    * the latency of the blocks created more than `settle_time` seconds before, when no more nodes
+      are expected to receive them: the time to be the head of `alpha` of the nodes that received
+      the block (excluding its miner), as the network-wide latency of `ReportEngine`. As in the
+      report, only the blocks of the longest chain are sampled, not the blocks of forks
+    * the finality time of the blocks of the longest chain: the time between the creation of a
+      block and the creation of the block `FINALITY_DELTA` positions later. Only non-overlapping
+      windows are used, so the values are independent
+
+    The first `warmup_blocks` blocks are discarded. When the stopping `rule` holds for both
+    metrics, the simulation is stopped (`SimulationWorld.stop`) and the reason is recorded in
+    `world.stop_reason`.
+
+    :param world: the `SimulationWorld`
+    :param list nodes: the nodes of the simulation
+    :param rule: the stopping rule, called with the values of a metric. Defaults to
+        `RelativePrecisionRule(epsilon, confidence)`
+    """
+
+    def __init__(self, world, nodes: list, interval=600, epsilon=0.05, confidence=0.95, warmup_blocks=10,
+                 min_blocks=30, settle_time=1800, alpha=0.8, rule=None):
+        self.world = world
+        self.env = world.env
+        self.nodes = nodes
+        self.interval = interval
+        self.warmup_blocks = warmup_blocks
+        self.settle_time = settle_time
+        self.alpha = alpha
+        self.rule = RelativePrecisionRule(epsilon, confidence, min_blocks) if rule is None else rule
+        # First head time of each node, for each block not settled yet (in creation order)
+        self._head_times = {}
+        self._creation = {}
+        self._settled_blocks = 0
+        self.latencies = []
+        self.finality_times = []
+        self.estimates = {}
+
+    def head_changed(self, node, block):
+        header = block.header
+        times = self._head_times.get(header.hash)
+        if times is None:
+            if header.timestamp < self.env.now - self.settle_time:
+                # An old block, already settled
+                return
+            times = self._head_times[header.hash] = {}
+            self._creation[header.hash] = (header.number, header.timestamp, header.coinbase)
+        if node.address not in times:
+            times[node.address] = self.env.now
+
+    def _longest_chain(self):
+        # The first node with the highest head, as `ReportEngine`
+        return max((node.chain for node in self.nodes), key=lambda chain: chain.head.header.number)
+
+    def _settle_blocks(self):
+        limit = self.env.now - self.settle_time
+        chain = self._longest_chain()
+        for block_hash in list(self._head_times):
+            number, created, miner = self._creation[block_hash]
+            if created > limit:
+                break
+            times = self._head_times.pop(block_hash)
+            del self._creation[block_hash]
+            # Only the blocks of the longest chain are sampled, one for each number
+            block = chain.get_block_by_number(number)
+            if block is None or block.header.hash != block_hash:
+                continue
+            self._settled_blocks += 1
+            if self._settled_blocks <= self.warmup_blocks:
+                continue
+            receive_times = sorted(t for address, t in times.items() if address != miner)
+            if receive_times:
+                target = max(ceil(self.alpha * len(receive_times)), 1)
+                self.latencies.append(receive_times[target - 1] - created)
+
+    def _finality_times(self):
+        chain = self._longest_chain()
+        height = chain.head.header.number
+        start = self.warmup_blocks + 1
+        creation = {}
+        for number in range(start, height + 1):
+            block = chain.get_block_by_number(number)
+            if block is not None:
+                creation[number] = block.header.timestamp
+        return [creation[number + FINALITY_DELTA] - creation[number]
+                for number in range(start, height + 1 - FINALITY_DELTA, FINALITY_DELTA)
+                if number in creation and number + FINALITY_DELTA in creation]
+
+    def check(self):
+        """Updates the estimates. Returns the reason to stop, or None when the metrics did not converge"""
+        self._settle_blocks()
+        self.finality_times = self._finality_times()
+        converged = True
+        for name, values in (('latency', self.latencies), ('finality', self.finality_times)):
+            done, mean, relative = self.rule(values)
+            self.estimates[name] = {'mean': mean, 'relative_half_width': relative, 'samples': len(values)}
+            converged = converged and done
+        if not converged:
+            return None
+        latency = self.estimates['latency']
+        finality = self.estimates['finality']
+        return (f'converged after {self.env.now - self.world.start_time:.0f} simulated seconds: '
+                f'latency {latency["mean"]:.2f} (+-{latency["relative_half_width"]:.1%}, {latency["samples"]} blocks), '
+                f'finality {finality["mean"]:.2f} (+-{finality["relative_half_width"]:.1%}, '
+                f'{finality["samples"]} windows), {self.rule}')
+
+    def run(self):
+        """The SimPy process of the controller"""
+        while True:
+            yield self.env.timeout(self.interval)
+            reason = self.check()
+            if reason is not None:
+                self.world.stop(reason)
+                return
@@ -0,0 +1,298 @@
+from math import ceil
+import numpy as np
+from blocksim.links import LinkMatrices, get_links
+from blocksim.topology import request_message_sizes
+from blocksim.utils import AliasTable, get_distribution_mean, get_random_values, rng
+
+
+class Ensemble:
+    """Block propagation model of `K` replicas of the same scenario, simulated in lockstep.
+
+    The replicas share the topology and the inputs and only differ in their random values
+    (the time between blocks, the miners, the orphan blocks and the validation delays).
+    Instead of running the simulation `K` times, the state of all the replicas is kept in
+    NumPy arrays with one row per replica and one column per node, and each block is
+    processed for all the replicas at once.
+
+    The propagation is the model of `FastForward`: each hop takes the block request round
+    trips, with the latency, the transfer delays and the block validation delay. A node adds
+    a block to its chain when it receives it, or when it receives its parent (orphan blocks),
+    and its head is the highest block of its chain (the first one received on ties). A miner
+    builds its block on top of its head. Transactions are not simulated.
+
+    After `run`, the replicas state is in:
+
+    * `receive_times`: the time each node added each block to its chain (blocks x K x N)
+    * `heads`: the head block of each node (K x N)
+    * `forks`: the number of blocks each node added out of its head (K x N), as the
+      `forks_<address>` counters of the simulation
+
+    The block numbers are indices in the arrays of the blocks: `block_times`, `miners`,
+    `parents` and `heights` (blocks x K). Block zero is the genesis block.
+
+    :param links: the latency and throughput between the nodes (`LinkMatrices` or `CoordinateLinks`)
+    :param dict neighbours: the neighbours of each node, in the `sim_data["solutions"]`
+        format (``{node_id: [neighbour ids]}``). Each node sends the blocks to its neighbours
+    :param dict config: the simulation configuration (`env.config`)
+    :param dict delays: the measured delays of the blockchain (`env.delays`)
+    :param hashrates: hashrate of each node (zero for non miners)
+    :param int replicas: the number of replicas `K`
+    :param bool relay_blocks: if the nodes relay the blocks received (see `FastForward`)
+    :param random_state: NumPy generator for all the replicas (defaults to `utils.rng`)
+    """
+
+    def __init__(self, links: LinkMatrices, neighbours: dict, config: dict, delays: dict, hashrates,
+                 replicas: int, relay_blocks=False, random_state=None):
+        self.links = links
+        self.replicas = replicas
+        self._relay_blocks = relay_blocks
+        self._rng = rng if random_state is None else random_state
+        self._delays = delays
+        self._messages = request_message_sizes(config)
+        self._orphan_blocks_probability = config[config['blockchain']]['orphan_blocks_probability']
+        hashrates = np.asarray(hashrates, dtype=float)
+        self._miners = np.flatnonzero(hashrates > 0)
+        self._miners_table = AliasTable(hashrates[self._miners])
+        self._set_links(neighbours)
+        self.receive_times = None
+        self.heads = None
+        self.forks = None
+
+    @classmethod
+    def from_world(cls, world, nodes: dict, neighbours: dict, replicas: int, relay_blocks=False,
+                   random_state=None):
+        """Creates the ensemble for the `nodes` of a simulation, linked to their `neighbours`
+        (the neighbour nodes of each node id, as given to `Node.connect`)"""
+        links = get_links()
+        hashrates = np.zeros(links.n)
+        for node in nodes.values():
+            if node.is_mining:
+                hashrates[links.index[node.address]] = node.hashrate
+        neighbour_ids = {
+            links.index[node.address]: [links.index[neighbour.address] for neighbour in neighbours[node_id]]
+            for node_id, node in nodes.items()}
+        return cls(links, neighbour_ids, world.env.config, world.env.delays, hashrates, replicas,
+                   relay_blocks, random_state)
+
+    def _set_links(self, neighbours: dict):
+        """Builds the arrays of the links, in the order of the neighbours of each node"""
+        announce_size = self._messages[0][0]
+        origins = []
+        destinations = []
+        announce_offsets = []
+        for node_id in sorted(neighbours, key=int):
+            origin = int(node_id)
+            offset = 0.0
+            for neighbour in neighbours[node_id]:
+                if neighbour == origin:
+                    continue
+                origins.append(origin)
+                destinations.append(neighbour)
+                # The announces of a node are uploaded one after the other
+                announce_offsets.append(offset)
+                offset += announce_size * self.links.delays_per_MB[origin, neighbour]
+        self._origins = np.array(origins, dtype=int)
+        self._destinations = np.array(destinations, dtype=int)
+        self._announce_offsets = np.array(announce_offsets)
+        self._latencies = self.links.latencies[self._origins, self._destinations]
+        self._delays_per_MB = self.links.delays_per_MB[self._origins, self._destinations]
+        # The arrival times are reduced by destination with `np.minimum.reduceat`
+        self._by_destination = np.argsort(self._destinations, kind='stable')
+        self._reached, self._reduce_at = np.unique(
+            self._destinations[self._by_destination], return_index=True)
+
+    def _draw_blocks(self, duration: float):
+        """Draws the time and the miner of the blocks of each replica, during `duration`
+        seconds after the start. Returns the arrays (blocks x K) of the block times (infinite
+        after the end of a replica) and the miners"""
+        K = self.replicas
+        distribution = self._delays['time_between_blocks_seconds']
+        n = ceil(1.2 * duration / get_distribution_mean(distribution)) + 32
+        intervals = np.empty((K, 0))
+        while intervals.shape[1] == 0 or intervals.sum(axis=1).min() < duration:
+            batch = get_random_values(distribution, K * n, random_state=self._rng).round(2)
+            intervals = np.hstack((intervals, batch.reshape(K, n)))
+        times = np.cumsum(intervals, axis=1)
+        orphans = self._rng.random(times.shape) < self._orphan_blocks_probability
+        first = self._miners_table.draw(self._rng, times.shape)
+        second = self._miners_table.draw(self._rng, times.shape)
+        if len(self._miners) > 1:
+            # Two different miners, as `Network._select_second_miner`
+            same = second == first
+            while same.any():
+                second[same] = self._miners_table.draw(self._rng, int(same.sum()))
+                same = second == first
+        else:
+            orphans[:] = False
+        block_times = []
+        miners = []
+        for k in range(K):
+            mined = times[k] < duration
+            # An orphan block situation adds the block of the second miner at the same time
+            block_times.append(np.repeat(times[k][mined], 1 + orphans[k][mined]))
+            pairs = np.stack((first[k][mined], second[k][mined]), axis=1)
+            miners.append(pairs[np.stack((np.ones_like(orphans[k][mined]), orphans[k][mined]), axis=1)])
+        n_blocks = max(len(t) for t in block_times)
+        T = np.full((n_blocks, K), np.inf)
+        M = np.zeros((n_blocks, K), dtype=int)
+        for k in range(K):
+            T[:len(block_times[k]), k] = block_times[k]
+            M[:len(miners[k]), k] = self._miners[miners[k]]
+        return T, M
+
+    def _hop_times(self, start, listening, validation_delays):
+        """Returns the time each link destination receives the block (K x links), when
+        the origin of the link has the block at `start` (K x links)"""
+        t = start + self._announce_offsets
+        for size, validate in self._messages:
+            if validate:
+                t = t + validation_delays
+            transfer_delays = size * self._delays_per_MB
+            t = np.maximum(t + transfer_delays + self._latencies, listening) + transfer_delays
+        return t
+
+    def _arrival_times(self, block_times, miners, listening):
+        """Returns the time each node receives the block mined by `miners` at `block_times`,
+        for all the replicas (K x N). The times of the miners are their block times"""
+        K = self.replicas
+        times = np.full((K, self.links.n), np.inf)
+        times[np.arange(K), miners] = block_times
+        # The validation delay of each link is drawn once, as each node validates the block once
+        validation_delays = get_random_values(
+            self._delays['block_validation'], K * len(self._origins),
+            random_state=self._rng).round(4).reshape(K, -1)
+        while True:
+            hops = self._hop_times(times[:, self._origins], listening, validation_delays)
+            received = np.minimum.reduceat(hops[:, self._by_destination], self._reduce_at, axis=1)
+            new_times = times.copy()
+            new_times[:, self._reached] = np.minimum(times[:, self._reached], received)
+            # Without relay, the block only reaches the neighbours of the miner
+            if not self._relay_blocks or np.array_equal(new_times, times):
+                return new_times
+            times = new_times
+
+    def _block_latencies(self, block_times, miners, arrivals, end, alpha):
+        """Latency of the block of each replica, as `ReportEngine._get_network_wide_latency`:
+        the time until the receiver at the `alpha` coverage, or the receive time when there
+        is a single receiver. NaN when the block has no receivers before the end"""
+        K = self.replicas
+        receivers = arrivals.copy()
+        receivers[np.arange(K), miners] = np.inf
+        receivers[receivers >= end] = np.inf
+        receivers.sort(axis=1)
+        count = np.isfinite(receivers).sum(axis=1)
+        index = np.maximum(np.ceil(alpha * count).astype(int) - 2, 0)
+        with np.errstate(invalid='ignore'):
+            latencies = receivers[np.arange(K), index] - block_times
+        latencies[count == 1] = receivers[count == 1, 0]
+        latencies[count == 0] = np.nan
+        return latencies
+
+    def run(self, start: float, duration: float, alpha=0.8):
+        """Simulates `duration` seconds of all the replicas, with the nodes connected at `start`.
+        Returns the block metrics of each replica, as `ReportEngine.get_block_report`"""
+        K = self.replicas
+        N = self.links.n
+        end = start + duration
+        replicas = np.arange(K)
+        T, M = self._draw_blocks(duration)
+        T = np.vstack((np.full((1, K), -np.inf), start + T))
+        M = np.vstack((np.zeros((1, K), dtype=int), M))
+        n_blocks = len(T)
+        A = np.full((n_blocks, K, N), np.inf)
+        A[0] = -np.inf
+        parents = np.full((n_blocks, K), -1)
+        heights = np.zeros((n_blocks, K), dtype=int)
+        latencies = np.full((n_blocks, K), np.nan)
+        listening = start + 3 * self._latencies
+        # Best block of each node among the settled blocks, which every node has added (or
+        # will never add) before the current block time
+        settled = 1
+        best = np.zeros((K, N), dtype=int)
+        best_heights = np.zeros((K, N), dtype=int)
+        best_times = np.full((K, N), -np.inf)
+        for b in range(1, n_blocks):
+            block_times = T[b]
+            active = np.isfinite(block_times)
+            miners = M[b]
+            # Head of the miners: the settled head or a block added since then
+            window = A[settled:b, replicas, miners]
+            window_heights = np.where(window <= block_times, heights[settled:b], -1)
+            head_heights = np.maximum(best_heights[replicas, miners], window_heights.max(axis=0, initial=-1))
+            window_times = np.where(window_heights == head_heights, window, np.inf)
+            first = window_times.argmin(axis=0) if b > settled else np.zeros(K, dtype=int)
+            use_settled = ((best_heights[replicas, miners] == head_heights) &
+                           (best_times[replicas, miners] <= window_times.min(axis=0, initial=np.inf)))
+            parents[b] = np.where(use_settled, best[replicas, miners], settled + first)
+            heights[b] = heights[parents[b], replicas] + 1
+
+            arrivals = self._arrival_times(np.where(active, block_times, np.inf), miners, listening)
+            latencies[b] = self._block_latencies(block_times, miners, arrivals, end, alpha)
+            # A block is added when it is received, or when its parent is added
+            added = np.maximum(arrivals, A[parents[b], replicas])
+            added[replicas, miners] = block_times
+            added[~active] = np.inf
+            A[b] = added
+
+            while settled <= b and np.all((A[settled] <= np.where(active, block_times, np.inf)[:, None]) |
+                                          np.isinf(A[settled])):
+                added = A[settled]
+                better = np.isfinite(added) & (
+                    (heights[settled][:, None] > best_heights) |
+                    ((heights[settled][:, None] == best_heights) & (added < best_times)))
+                best = np.where(better, settled, best)
+                best_heights = np.where(better, heights[settled][:, None], best_heights)
+                best_times = np.where(better, added, best_times)
+                settled += 1
+
+        self.block_times = T
+        self.miners = M
+        self.parents = parents
+        self.heights = heights
+        self.receive_times = A
+        self._replay_chains(end)
+        return [self._metrics(k, latencies[:, k]) for k in range(K)]
+
+    def _replay_chains(self, end: float):
+        """Adds the blocks to the chain of each node in the order they are received, to find
+        the heads and count the forks at the `end`"""
+        K = self.replicas
+        N = self.links.n
+        A = self.receive_times
+        replicas = np.arange(K)[:, None]
+        order = np.argsort(A, axis=0, kind='stable')
+        heads = np.zeros((K, N), dtype=int)
+        forks = np.zeros((K, N), dtype=int)
+        # The genesis block is the first one
+        for blocks in order[1:]:
+            added = A[blocks, replicas, np.arange(N)] < end
+            if not added.any():
+                break
+            parents = self.parents[blocks, replicas]
+            forks += added & (parents != heads)
+            better = added & (self.heights[blocks, replicas] > self.heights[heads, replicas])
+            heads = np.where(better, blocks, heads)
+        self.heads = heads
+        self.forks = forks
+
+    def _metrics(self, k: int, latencies, delta=6):
+        """Block metrics of a replica, with the chain of the node with the highest head,
+        as `ReportEngine`"""
+        head_heights = self.heights[self.heads[k], k]
+        head = self.heads[k, np.argmax(head_heights)]
+        # `ReportEngine` uses the blocks of the chain before the head
+        chain = []
+        block = self.parents[head, k]
+        while block > 0:
+            chain.append(block)
+            block = self.parents[block, k]
+        chain.reverse()
+        chain_latencies = latencies[chain]
+        chain_latencies = chain_latencies[~np.isnan(chain_latencies)]
+        times = self.block_times[chain, k]
+        # Time between the creation of a block and `delta` blocks after it
+        finality_times = times[delta:] - times[:-delta] if len(times) > delta else np.array([])
+        return {
+            'av_block_latency': np.average(chain_latencies) if len(chain_latencies) else np.nan,
+            'av_finality_time': np.average(finality_times) if len(finality_times) else np.nan
+        }
@@ -0,0 +1,155 @@
+from heapq import heappop, heappush
+import numpy as np
+from blocksim.utils import get_latency_delay, get_random_values, get_sent_delay, rng
+
+# Number of block validation delays drawn at once
+VALIDATION_BATCH_SIZE = 4096
+
+
+class FastForward:
+    """Analytic fast-forward engine for the block propagation.
+
+    Instead of simulating every network message, the arrival time of a new block at each
+    node is computed when the block is mined, with a Dijkstra pass over the links. The
+    weight of a link is the time needed to complete the block request round trips, using
+    the same latency, throughput and validation model as `Node.send` and `Node.listening_node`:
+
+    * Ethereum: `new_blocks` -> `get_headers` -> `block_headers` (validated before sending)
+      -> `get_block_bodies` -> `block_bodies`
+    * Bitcoin: `inv` -> `getdata` -> `block` (validated before sending)
+
+    Each message takes the upload delay, the link latency and the download delay, and it is
+    not read before the connection is listening (three times the latency after `connect`).
+    The announces of a node are uploaded one after the other, in the order of its links.
+
+    The heartbeat of the network and the chains of the nodes are not changed: the block is
+    added to the chain of each node at its arrival time, so forks and the `ReportEngine`
+    metrics are computed as in the simulation. The block propagation monitor (`block_propagation`)
+    is filled with the same records. Transactions are not simulated.
+
+    The nodes of the simulator do not relay the blocks they receive (see
+    `ETHNode.broadcast_received_blocks`), so by default a block only reaches the neighbours
+    of its miner. With `relay_blocks` the nodes relay each block as soon as they receive it.
+
+    :param world: the simulation world
+    :param network: the network of the simulation. Its heartbeat notifies the new blocks
+    :param bool relay_blocks: if the nodes relay the blocks received
+    :param random_state: NumPy generator for the validation delays (defaults to `utils.rng`)
+    """
+
+    def __init__(self, world, network, relay_blocks=False, random_state=None):
+        self._world = world
+        self._env = world.env
+        self._relay_blocks = relay_blocks
+        self._rng = rng if random_state is None else random_state
+        self._neighbours = {}
+        self._connected_at = {}
+        self._links = {}
+        self._validation_delays = []
+        network.fast_forward = self
+
+    def connect(self, node, nodes: list):
+        """Links `node` to `nodes`, as `Node.connect` does in the simulation"""
+        neighbours = self._neighbours.setdefault(node.address, [])
+        for other in nodes:
+            if other.address != node.address:
+                neighbours.append(other)
+                self._env.data['block_propagation'].setdefault(f'{node.address}_{other.address}', {})
+        self._connected_at[node.address] = self._env.now
+        self._links.pop(node.address, None)
+
+    def _get_links(self, node):
+        """Returns the neighbours of a node, with the latency, the transfer delay of 1 MB and
+        the time when the connection starts listening of each link"""
+        links = self._links.get(node.address)
+        if links is None:
+            neighbours = self._neighbours.get(node.address, [])
+            latencies = np.array(
+                [get_latency_delay(node.address, other.address) for other in neighbours], dtype=float)
+            delays_per_MB = np.array(
+                [get_sent_delay(1, node.address, other.address) for other in neighbours], dtype=float)
+            listening = self._connected_at.get(node.address, 0.0) + 3 * latencies
+            links = (neighbours, latencies, delays_per_MB, listening)
+            self._links[node.address] = links
+        return links
+
+    def _validate_blocks(self, n: int):
+        """Returns `n` block validation delays, as `Consensus.validate_block`"""
+        while len(self._validation_delays) < n:
+            self._validation_delays.extend(get_random_values(
+                self._env.delays['block_validation'], VALIDATION_BATCH_SIZE,
+                random_state=self._rng).round(4).tolist())
+        delays = self._validation_delays[-n:]
+        del self._validation_delays[-n:]
+        return np.array(delays)
+
+    def _request_messages(self, node, block):
+        """Returns the size (MB) of the messages of the block request round trips and if the
+        block is validated before sending the message"""
+        network_message = node.network_message
+        header = block.header
+        if self._world.blockchain == 'bitcoin':
+            return [
+                (network_message.inv([header.hash], 'block').size, False),
+                (network_message.get_data([header.hash], 'block').size, False),
+                (network_message.block(block).size, True)]
+        return [
+            (network_message.new_blocks({header.hash: header.number}).size, False),
+            (network_message.get_headers(header.number, 1).size, False),
+            (network_message.block_headers([header]).size, True),
+            (network_message.get_block_bodies([header.hash]).size, False),
+            (network_message.block_bodies({header.hash: block.transactions}).size, False)]
+
+    def _hop_times(self, node, start: float, messages: list):
+        """Returns the neighbours of `node`, the time each announce is sent and the time
+        each neighbour receives the block, when `node` announces it at `start`"""
+        neighbours, latencies, delays_per_MB, listening = self._get_links(node)
+        announce_delays = messages[0][0] * delays_per_MB
+        announced = start + np.concatenate(([0.0], np.cumsum(announce_delays)[:-1]))
+        t = announced
+        for size, validate in messages:
+            if validate:
+                t = t + self._validate_blocks(len(t))
+            transfer_delays = size * delays_per_MB
+            t = np.maximum(t + transfer_delays + latencies, listening) + transfer_delays
+        return neighbours, announced.tolist(), t.tolist()
+
+    def _arrival_times(self, miner, block):
+        """Dijkstra pass from the miner. Returns, for each node reached, the arrival time
+        of the block, the node that sent it and the time it was announced"""
+        messages = self._request_messages(miner, block)
+        arrivals = {}
+        best = {miner.address: self._env.now}
+        heap = [(self._env.now, 0, miner)]
+        settled = set()
+        count = 1
+        while heap:
+            t, _, node = heappop(heap)
+            if node.address in settled:
+                continue
+            settled.add(node.address)
+            if node is not miner and not self._relay_blocks:
+                continue
+            neighbours, announced, times = self._hop_times(node, t, messages)
+            for other, announce_time, arrival_time in zip(neighbours, announced, times):
+                if other.address in settled or arrival_time >= best.get(other.address, float('inf')):
+                    continue
+                best[other.address] = arrival_time
+                arrivals[other.address] = (other, arrival_time, node, announce_time)
+                heappush(heap, (arrival_time, count, other))
+                count += 1
+        return arrivals.values()
+
+    def propagate(self, miner, block):
+        """Schedules the arrival of a new `block` mined by `miner` at the other nodes"""
+        now = self._env.now
+        for node, arrival_time, origin, announce_time in self._arrival_times(miner, block):
+            arrival = self._env.timeout(arrival_time - now, (node, block, origin, announce_time))
+            arrival.callbacks.append(self._receive_block)
+
+    def _receive_block(self, event):
+        node, block, origin, announce_time = event.value
+        node.chain.add_block(block)
+        block_hash = block.header.hash[:8]
+        self._env.data['block_propagation'][f'{origin.address}_{node.address}'][block_hash] = (
+            announce_time, self._env.now - announce_time)
@@ -0,0 +1,189 @@
+from time import perf_counter
+from blocksim.models.node import Envelope
+
+# Operations measured by `MessageCounters`
+SEND = 'send'
+BROADCAST = 'broadcast'
+MULTICAST = 'multicast'
+RECEIVE = 'receive'
+HANDLE = 'handle'
+
+
+class NoInstrumentation:
+    """Instrumentation of the simulations that are not measured. The nodes are not changed,
+    so it has no cost during the simulation"""
+
+    enabled = False
+
+    def instrument(self, node):
+        pass
+
+
+class MessageCounters:
+    """Counts the work done by the nodes for each message type (`msg.id`), to see which step of
+    the protocol dominates a simulation.
+
+    When a node is created (see `Node.__init__`), its `send`, `broadcast`, `multicast`,
+    `listening_node` and `_read_envelope` methods are replaced by measured versions, only in
+    that node. For each node, operation and message type it counts:
+
+    * ``messages``: the messages sent (one per destination of a broadcast) or received
+    * ``size``: the size of those messages, in MB
+    * ``events``: the SimPy events scheduled by the operation
+    * ``seconds``: the wall time spent running the operation. The `receive` operation includes
+      the time of the `handle` operation (the `_read_envelope` handler of the message)
+
+    The events are counted by wrapping `env.schedule`, so the counters must be created before
+    the nodes. Use `table` to aggregate them by message type, node or location.
+
+    :param env: the SimPy environment of the simulation
+    """
+
+    enabled = True
+
+    def __init__(self, env):
+        self.env = env
+        # [messages, size, events, seconds] of each (address, location, operation, message id)
+        self.counters = {}
+        self.scheduled = 0
+        schedule = env.schedule
+
+        def counting_schedule(event, priority=1, delay=0):
+            self.scheduled += 1
+            schedule(event, priority, delay)
+        env.schedule = counting_schedule
+
+    def _counter(self, node, operation, msg):
+        key = (node.address, node.location, operation, msg.id)
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = [0, 0.0, 0, 0.0]
+        return counter
+
+    def instrument(self, node):
+        """Replaces the methods of a node by the measured versions"""
+        send = node.send
+        broadcast = node.broadcast
+        multicast = node.multicast
+        listening_node = node.listening_node
+        read_envelope = node._read_envelope
+
+        def measured_send(destination_address, msg):
+            return self._measure(send(destination_address, msg), self._count(node, SEND, msg, 1))
+
+        def measured_broadcast(msg):
+            counter = self._count(node, BROADCAST, msg, len(node.active_sessions))
+            return self._measure(broadcast(msg), counter)
+
+        def measured_multicast(msg, nodes: dict):
+            return self._measure(multicast(msg, nodes), self._count(node, MULTICAST, msg, len(nodes)))
+
+        def measured_listening_node(connection):
+            return self._measure_listening(node, listening_node(connection))
+
+        def measured_read_envelope(envelope):
+            counter = self._counter(node, HANDLE, envelope.msg)
+            scheduled = self.scheduled
+            start = perf_counter()
+            read_envelope(envelope)
+            counter[3] += perf_counter() - start
+            counter[2] += self.scheduled - scheduled
+            counter[0] += 1
+            counter[1] += envelope.msg.size
+
+        node.send = measured_send
+        node.broadcast = measured_broadcast
+        node.multicast = measured_multicast
+        node.listening_node = measured_listening_node
+        node._read_envelope = measured_read_envelope
+
+    def _count(self, node, operation, msg, messages):
+        counter = self._counter(node, operation, msg)
+        counter[0] += messages
+        counter[1] += messages * msg.size
+        return counter
+
+    def _measure(self, process, counter):
+        """Runs the steps of a SimPy process, adding their time and scheduled events to `counter`"""
+        value = None
+        error = None
+        while True:
+            scheduled = self.scheduled
+            start = perf_counter()
+            try:
+                event = process.send(value) if error is None else process.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                counter[3] += perf_counter() - start
+                counter[2] += self.scheduled - scheduled
+            value = error = None
+            try:
+                value = yield event
+            except BaseException as e:
+                error = e
+
+    def _measure_listening(self, node, process):
+        """As `_measure`, for the listening process of a node. Each step is counted for the last
+        message received"""
+        counter = None
+        value = None
+        error = None
+        while True:
+            if isinstance(value, Envelope):
+                counter = self._count(node, RECEIVE, value.msg, 1)
+            scheduled = self.scheduled
+            start = perf_counter()
+            try:
+                event = process.send(value) if error is None else process.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                if counter is not None:
+                    counter[3] += perf_counter() - start
+                    counter[2] += self.scheduled - scheduled
+            value = error = None
+            try:
+                value = yield event
+            except BaseException as e:
+                error = e
+
+    def table(self, by='id'):
+        """Aggregates the counters by message type (`by='id'`), node address (`by='node'`) or
+        location (`by='location'`). Returns ``{(group, operation): [messages, size, events,
+        seconds]}``, where the group is the message id, the node address or the location"""
+        aggregated = {}
+        for (address, location, operation, msg_id), counter in self.counters.items():
+            if by == 'id':
+                key = (msg_id, operation)
+            elif by == 'node':
+                key = (address, operation)
+            elif by == 'location':
+                key = (location, operation)
+            else:
+                raise ValueError(f'Unknown aggregation: {by}')
+            total = aggregated.setdefault(key, [0, 0.0, 0, 0.0])
+            for i, value in enumerate(counter):
+                total[i] += value
+        return aggregated
+
+    def format_table(self, by='id', limit=None):
+        """The aggregated counters as a text table, sorted by the wall time"""
+        rows = sorted(self.table(by).items(), key=lambda row: row[1][3], reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        total_seconds = sum(counter[3] for key, counter in self.table('id').items() if key[1] != HANDLE) or 1
+        lines = [f'{by:<24} {"operation":<10} {"messages":>10} {"MB":>12} {"events":>10} {"seconds":>10} {"time %":>7}']
+        for (group, operation), (messages, size, events, seconds) in rows:
+            lines.append(f'{str(group):<24} {operation:<10} {messages:>10} {size:>12.3f} {events:>10} '
+                         f'{seconds:>10.4f} {100 * seconds / total_seconds:>6.1f}%')
+        return '\n'.join(lines)
+
+    def report(self, nodes=10):
+        """Prints the counters by message type and location, and the `nodes` with more time"""
+        print('Instrumentation by message type (receive includes handle):')
+        print(self.format_table('id'))
+        print('Instrumentation by location:')
+        print(self.format_table('location'))
+        print(f'Instrumentation of the {nodes} nodes with more time:')
+        print(self.format_table('node', nodes))
@@ -0,0 +1,359 @@
+import json
+import os
+import numpy as np
+from blocksim.utils import sim_data
+
+# Files of the link matrices saved by `LinkMatrices.save`
+_ARRAYS = ('latencies', 'throughputs', 'delays_per_MB')
+
+
+class LinkMatrices:
+    """Latency and throughput between all the nodes of a scenario, as dense matrices indexed
+    by the number of each node (the keys of `node_properties`).
+
+    The simulation looks up each link in the `latencies` and `throughputs` dictionaries of
+    `sim_data` (see `utils.get_latency_delay` and `utils.get_sent_or_received_delay`). These
+    matrices hold the same values, to compute delays for many links at once with NumPy.
+    Links without measurements have an infinite latency.
+
+    The matrices can be saved as `.npy` files and loaded as read-only memory maps (see `load`),
+    so the processes of parallel runs share one copy of them in the page cache.
+
+    :param list addresses: address of each node, in the order of the matrices
+    :param latencies: matrix with the latency of each link (seconds)
+    :param delays_per_MB: matrix with the transfer delay of 1 MB in each link (seconds)
+    :param throughputs: matrix with the throughput of each link (Mbps)
+    """
+
+    def __init__(self, addresses: list, latencies, delays_per_MB, throughputs=None):
+        self.addresses = list(addresses)
+        self.index = {address: i for i, address in enumerate(self.addresses)}
+        self.latencies = latencies
+        self.delays_per_MB = delays_per_MB
+        self.throughputs = throughputs
+
+    @property
+    def n(self):
+        return len(self.addresses)
+
+    @classmethod
+    def from_sim_data(cls, data: dict = None):
+        """Builds the matrices from the data read by `utils.initialize_node_values`. If the
+        data was loaded with `mmap_links`, returns its matrices, and with a compact link model
+        (`CoordinateLinks`), its dense matrices"""
+        data = sim_data if data is None else data
+        links = data.get('links')
+        if isinstance(links, LinkMatrices):
+            return links
+        if links is not None:
+            return links.to_matrices()
+        node_properties = data['node_properties']
+        addresses = [node_properties[k]['node_id'] for k in sorted(node_properties, key=int)]
+        index = {address: i for i, address in enumerate(addresses)}
+        latencies = _pairs_matrix(data['latencies'], index)
+        throughputs = _pairs_matrix(data['throughputs'], index)
+        np.fill_diagonal(latencies, 0.0)
+        with np.errstate(divide='ignore'):
+            delays_per_MB = 8 / throughputs
+        np.fill_diagonal(delays_per_MB, 0.0)
+        return cls(addresses, latencies, delays_per_MB, throughputs)
+
+    def save(self, folder: str):
+        """Saves the matrices in `folder`, as `.npy` files and the addresses in `addresses.json`.
+        The files are written with a temporary name and renamed, so a process never loads
+        a partially written file"""
+        os.makedirs(folder, exist_ok=True)
+        for name in _ARRAYS:
+            path = os.path.join(folder, f'{name}.npy')
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(getattr(self, name)))
+            os.replace(tmp_path, path)
+        path = os.path.join(folder, 'addresses.json')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.addresses, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, folder: str, mmap_mode='r'):
+        """Loads the matrices saved in `folder`. By default they are read-only memory maps:
+        the pages are read on demand and shared by all the processes which load them"""
+        with open(os.path.join(folder, 'addresses.json')) as f:
+            addresses = json.load(f)
+        arrays = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode=mmap_mode) for name in _ARRAYS}
+        return cls(addresses, arrays['latencies'], arrays['delays_per_MB'], arrays['throughputs'])
+
+    @classmethod
+    def cached(cls, folder: str, sources: list, read_data):
+        """Loads the matrices saved in `folder`, as memory maps. If they are missing or older
+        than any of the `sources` files, they are built from `read_data()` (the data of
+        `from_sim_data`) and saved first"""
+        saved = [os.path.join(folder, f'{name}.npy') for name in _ARRAYS]
+        saved.append(os.path.join(folder, 'addresses.json'))
+        if not all(os.path.exists(path) for path in saved) or (
+                min(os.path.getmtime(path) for path in saved) < max(os.path.getmtime(path) for path in sources)):
+            cls.from_sim_data(read_data()).save(folder)
+        return cls.load(folder)
+
+    def get_latency(self, origin: str, destination: str) -> float:
+        """Latency of a link, as `utils.get_latency_delay`"""
+        return float(self.latencies[self.index[origin], self.index[destination]])
+
+    def get_throughput(self, origin: str, destination: str) -> float:
+        """Throughput of a link, as `utils.get_sent_or_received_delay`"""
+        return float(self.throughputs[self.index[origin], self.index[destination]])
+
+    def transfer_delays(self, size: float):
+        """Delay to send (or receive) a message of `size` MB in each link"""
+        return size * self.delays_per_MB
+
+
+def _pairs_matrix(pairs: dict, index: dict):
+    """Converts a dictionary with `originAddress_destinationAddress` keys into a matrix.
+    As in the simulation, a pair measured in one direction also holds for the other one"""
+    n = len(index)
+    matrix = np.full((n, n), np.inf)
+    for key, value in pairs.items():
+        # Addresses have an underscore, e.g. loc0_1_loc2_5
+        split = key.split('_')
+        half = len(split) // 2
+        i = index.get('_'.join(split[:half]))
+        j = index.get('_'.join(split[half:]))
+        if i is None or j is None:
+            continue
+        matrix[i, j] = value
+    missing = np.isinf(matrix)
+    matrix[missing] = matrix.T[missing]
+    return matrix
+
+
+def get_links(data: dict = None):
+    """Returns the link model of the data read by `utils.initialize_node_values`: the
+    `CoordinateLinks` or the memory mapped `LinkMatrices` if it was loaded with one, or the
+    `LinkMatrices` built from the latencies and throughputs"""
+    data = sim_data if data is None else data
+    if data.get('links') is not None:
+        return data['links']
+    return LinkMatrices.from_sim_data(data)
+
+
+class _PairValues:
+    """Values of the links of a `CoordinateLinks`, computed when indexed with ``[i, j]`` (two
+    node numbers or two arrays of node numbers), as the matrices of `LinkMatrices`"""
+
+    def __init__(self, function):
+        self._function = function
+
+    def __getitem__(self, key):
+        i, j = key
+        values = self._function(np.asarray(i, dtype=int), np.asarray(j, dtype=int))
+        return values[()] if values.ndim == 0 else values
+
+
+class CoordinateLinks:
+    """Compact link model, with O(N) memory, for networks too large for the pairwise latencies
+    and throughputs (N² keys).
+
+    The latency of a link is the distance between the coordinates of its nodes (an embedding
+    as Vivaldi network coordinates) plus the height of each node (its access latency). With
+    `groups`, the distance is replaced by the latency between the groups of the nodes (e.g.
+    their locations in `loc_names`). The throughput of a link is the lowest access bandwidth
+    of its nodes. Links measured apart can be given in `latency_overrides` and
+    `throughput_overrides`, with the format of the latencies and throughputs of `sim_data`
+    (``{"originAddress_destinationAddress": value}``).
+
+    The values are computed on demand, for one link (`get_latency`, `get_throughput`) or for
+    arrays of links (`latencies[i, j]`, `throughputs[i, j]`, `delays_per_MB[i, j]`, as the
+    matrices of `LinkMatrices`). A loaded model replaces the `LinkMatrices` of the scenario
+    (see `utils.initialize_node_values`).
+
+    :param list addresses: address of each node
+    :param bandwidths: access bandwidth of each node (Mbps)
+    :param coordinates: coordinates of each node (N x dimensions, seconds)
+    :param heights: height of each node (seconds). Defaults to zero
+    :param groups: group of each node, instead of the coordinates
+    :param group_latencies: latency between the groups (groups x groups, seconds)
+    :param dict latency_overrides: latency of some links
+    :param dict throughput_overrides: throughput of some links
+    """
+
+    def __init__(self, addresses: list, bandwidths, coordinates=None, heights=None, groups=None,
+                 group_latencies=None, latency_overrides: dict = None, throughput_overrides: dict = None):
+        if (coordinates is None) == (groups is None):
+            raise ValueError('A coordinate link model needs either coordinates or groups')
+        self.addresses = list(addresses)
+        self.index = {address: i for i, address in enumerate(self.addresses)}
+        self.bandwidths = np.asarray(bandwidths, dtype=float)
+        self.coordinates = None if coordinates is None else np.asarray(coordinates, dtype=float)
+        self.heights = np.zeros(self.n) if heights is None else np.asarray(heights, dtype=float)
+        self.groups = None if groups is None else np.asarray(groups, dtype=int)
+        self.group_latencies = None if group_latencies is None else np.asarray(group_latencies, dtype=float)
+        self.latency_overrides = self._read_overrides(latency_overrides or {})
+        self.throughput_overrides = self._read_overrides(throughput_overrides or {})
+        self.latencies = _PairValues(self._get_latencies)
+        self.throughputs = _PairValues(self._get_throughputs)
+        self.delays_per_MB = _PairValues(self._get_delays_per_MB)
+        # Values of the links used by the simulation, looked up one at a time
+        self._latency_cache = {}
+        self._throughput_cache = {}
+
+    @property
+    def n(self):
+        return len(self.addresses)
+
+    def _read_overrides(self, pairs: dict):
+        """Converts overrides to a sorted array of link keys (origin * N + destination) and
+        their values. As in `_pairs_matrix`, a link given in one direction also holds for the
+        other one"""
+        n = self.n
+        values = {}
+        for key, value in pairs.items():
+            split = key.split('_')
+            half = len(split) // 2
+            i = self.index.get('_'.join(split[:half]))
+            j = self.index.get('_'.join(split[half:]))
+            if i is None or j is None:
+                continue
+            values[i * n + j] = value
+            values.setdefault(j * n + i, value)
+        keys = np.array(sorted(values), dtype=np.int64)
+        return keys, np.array([values[k] for k in keys.tolist()], dtype=float)
+
+    def _apply_overrides(self, overrides, i, j, values):
+        keys, override_values = overrides
+        if len(keys) == 0:
+            return values
+        links = i.astype(np.int64) * self.n + j
+        position = np.minimum(np.searchsorted(keys, links), len(keys) - 1)
+        found = keys[position] == links
+        return np.where(found, override_values[position], values)
+
+    def _get_latencies(self, i, j):
+        if self.groups is not None:
+            distances = self.group_latencies[self.groups[i], self.groups[j]]
+        else:
+            distances = np.sqrt(((self.coordinates[i] - self.coordinates[j]) ** 2).sum(axis=-1))
+        latencies = np.where(i == j, 0.0, distances + self.heights[i] + self.heights[j])
+        return self._apply_overrides(self.latency_overrides, i, j, latencies)
+
+    def _get_throughputs(self, i, j):
+        throughputs = np.where(i == j, np.inf, np.minimum(self.bandwidths[i], self.bandwidths[j]))
+        return self._apply_overrides(self.throughput_overrides, i, j, throughputs)
+
+    def _get_delays_per_MB(self, i, j):
+        return 8 / self._get_throughputs(i, j)
+
+    def get_latency(self, origin: str, destination: str) -> float:
+        """Latency of a link, as `utils.get_latency_delay`"""
+        key = (origin, destination)
+        latency = self._latency_cache.get(key)
+        if latency is None:
+            latency = float(self.latencies[self.index[origin], self.index[destination]])
+            self._latency_cache[key] = latency
+        return latency
+
+    def get_throughput(self, origin: str, destination: str) -> float:
+        """Throughput of a link, as `utils.get_sent_or_received_delay`"""
+        key = (origin, destination)
+        throughput = self._throughput_cache.get(key)
+        if throughput is None:
+            throughput = float(self.throughputs[self.index[origin], self.index[destination]])
+            self._throughput_cache[key] = throughput
+        return throughput
+
+    def to_matrices(self) -> LinkMatrices:
+        """Returns the dense `LinkMatrices` of all the links. Needs O(N²) memory"""
+        i, j = np.divmod(np.arange(self.n * self.n), self.n)
+        latencies = self.latencies[i, j].reshape(self.n, self.n)
+        throughputs = self.throughputs[i, j].reshape(self.n, self.n)
+        delays_per_MB = 8 / throughputs
+        return LinkMatrices(self.addresses, latencies, delays_per_MB, throughputs)
+
+    def save(self, path: str):
+        """Saves the model in a NumPy `.npz` file"""
+        arrays = {'addresses': np.array(self.addresses), 'bandwidths': self.bandwidths, 'heights': self.heights}
+        if self.groups is not None:
+            arrays['groups'] = self.groups
+            arrays['group_latencies'] = self.group_latencies
+        else:
+            arrays['coordinates'] = self.coordinates
+        for name in ('latency_overrides', 'throughput_overrides'):
+            keys, values = getattr(self, name)
+            arrays[f'{name}_keys'] = keys
+            arrays[f'{name}_values'] = values
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads a model saved with `save`"""
+        with np.load(path) as arrays:
+            links = cls(
+                arrays['addresses'].tolist(), arrays['bandwidths'],
+                arrays['coordinates'] if 'coordinates' in arrays else None, arrays['heights'],
+                arrays['groups'] if 'groups' in arrays else None,
+                arrays['group_latencies'] if 'group_latencies' in arrays else None)
+            # The overrides are saved with the node numbers
+            links.latency_overrides = (arrays['latency_overrides_keys'], arrays['latency_overrides_values'])
+            links.throughput_overrides = (arrays['throughput_overrides_keys'], arrays['throughput_overrides_values'])
+        return links
+
+    @classmethod
+    def fit(cls, links: LinkMatrices, dimensions=3, iterations=1000, tolerance=None, random_state=None):
+        """Embeds the measured links of a scenario in coordinates, as the Vivaldi algorithm:
+        each node moves its coordinates along the error of the distance to the other nodes.
+        The bandwidth of a node is the median throughput of its links.
+
+        With a `tolerance` (seconds), the links whose latency error is larger are kept as
+        overrides, as well as the throughputs not given by the bandwidths.
+
+        :param LinkMatrices links: the measured latency and throughput of the links
+        :param int dimensions: the number of dimensions of the coordinates
+        :param int iterations: the number of updates of the coordinates
+        :param float tolerance: the maximum latency error of the links without override
+        :param random_state: NumPy generator for the initial coordinates
+        """
+        random_state = np.random.default_rng() if random_state is None else random_state
+        n = links.n
+        latencies = np.asarray(links.latencies)
+        i, j = np.nonzero(np.isfinite(latencies) & ~np.eye(n, dtype=bool))
+        measured = latencies[i, j]
+        links_per_node = np.maximum(np.bincount(i, minlength=n), 1)
+        scale = np.median(measured) if len(measured) else 1.0
+        coordinates = random_state.normal(0, scale / 10, (n, dimensions))
+        heights = np.zeros(n)
+        for iteration in range(iterations):
+            differences = coordinates[i] - coordinates[j]
+            distances = np.sqrt((differences ** 2).sum(axis=1))
+            errors = distances + heights[i] + heights[j] - measured
+            units = differences / np.maximum(distances, 1e-9)[:, None]
+            # Each node moves along the average force of its links, with a decreasing step
+            step = 0.5 * (1 - iteration / iterations) + 0.05
+            forces = np.stack([np.bincount(i, errors * units[:, d], minlength=n) for d in range(dimensions)], axis=1)
+            coordinates -= step * forces / links_per_node[:, None]
+            heights = np.maximum(heights - step * np.bincount(i, errors, minlength=n) / links_per_node / 2, 0.0)
+
+        throughputs = np.asarray(links.throughputs) if links.throughputs is not None else 8 / np.asarray(links.delays_per_MB)
+        bandwidths = np.array([
+            np.median(row[np.isfinite(row) & (row > 0)]) if np.any(np.isfinite(row) & (row > 0)) else np.inf
+            for row in np.where(np.eye(n, dtype=bool), np.nan, throughputs)])
+        model = cls(links.addresses, bandwidths, coordinates, heights)
+        if tolerance is not None:
+            modelled = model.latencies[i, j]
+            far = np.abs(modelled - measured) > tolerance
+            model.latency_overrides = _override_arrays(i[far], j[far], measured[far], n)
+            t_i, t_j = np.nonzero(np.isfinite(throughputs) & ~np.eye(n, dtype=bool))
+            measured_throughputs = throughputs[t_i, t_j]
+            different = model.throughputs[t_i, t_j] != measured_throughputs
+            model.throughput_overrides = _override_arrays(
+                t_i[different], t_j[different], measured_throughputs[different], n)
+        return model
+
+
+def _override_arrays(i, j, values, n):
+    keys = i.astype(np.int64) * n + j
+    order = np.argsort(keys)
+    return keys[order], np.asarray(values, dtype=float)[order]
@@ -1,18 +1,15 @@
-from pickle import FALSE
 import time
 import os
 from json import dumps as dump_json
-from blocksim.report_engine import ReportEngine
-from blocksim.utils import get_optimum_neighbours, get_random_neighbours, initialize_node_values, update_random_neighbours
-from blocksim.world import SimulationWorld
-from blocksim.node_factory import NodeFactory
-from blocksim.transaction_factory import TransactionFactory
-from blocksim.models.network import Network
+from blocksim.options import check_options
 
 RNS = False
 AV_NEIGHBOURS = 9
 NUMBER_OF_RUNS = 100
 NETWORK_SIZE = 500
+# Maximum relative half-width of the 95% confidence interval of the metrics over the runs.
+# The runs of each algorithm stop when all are met, or after NUMBER_OF_RUNS runs
+PRECISION_TARGETS = {'av_block_latency': 0.02, 'av_finality_time': 0.02}
 
 def write_report(world):
     path = 'output/report.json'
@@ -43,66 +40,268 @@ def report_node_chain(world, nodes_list):
         }
 
 
-def run_model(run_id:int, algo:str, num_nodes:int):
+def run_model(run_id:int, algo:str, num_nodes:int, streaming_workload=False, transaction_trace=None,
+              checkpoints=None, replicas=None, fast_forward=False, relay_blocks=False, seed=None, partitions=None,
+              ensemble=None, mmap_links=False, coordinate_links=False, duration=3600*6, blockchain=None,
+              folder_path='blocksim/out/', config_overrides=None, profiler=None, observers=()):
+    """Runs one simulation. With `streaming_workload` the transactions are streamed during all
+    the simulation, following the `transaction_workload` section of the configuration, instead
+    of being broadcasted in a few batches. With `transaction_trace` the transactions are replayed
+    from a trace file (see `blocksim.workload.TraceWorkload`).
+
+    The execution of the run is changed by the options of `blocksim.options`: `partitions`
+    (`Partitions`), `checkpoints` (`Checkpoints`) and `replicas` (`Replicas`), which cannot be
+    combined with the features they do not support.
+
+    With `fast_forward` the block propagation is computed analytically instead of simulating
+    each message, and transactions are not simulated (see `blocksim.fast_forward.FastForward`).
+    With `relay_blocks` the nodes relay the blocks they receive.
+
+    With a `seed`, each part of the model draws its random values from its own stream (see
+    `blocksim.random_streams.RandomStreams`), so runs with the same seed have the same results:
+    the block intervals, the miners, the validation delays and fork choice of each node, the
+    transactions and the random topology of RNS. The runs of different algorithms with the same
+    seed then see the same random inputs (common random numbers), so they can be compared in
+    pairs (see `blocksim.replications.paired_replications`).
+
+    With `ensemble`, the block propagation of that number of replicas is simulated in lockstep
+    with the model of `fast_forward` (see `blocksim.ensemble.Ensemble`).
+
+    With `mmap_links`, the link matrices are loaded as memory maps shared by the processes of
+    parallel runs, instead of parsing the latencies and throughputs (see
+    `blocksim.utils.initialize_node_values`). With `coordinate_links`, the links are computed
+    from the compact coordinate model of the scenario (see `blocksim.links.CoordinateLinks`).
+
+    The scenario is read from `folder_path` and simulated for `duration` seconds. `blockchain`
+    overrides the blockchain of the configuration, and `config_overrides` the values of its section
+    (see `SimulationWorld`). The `observers` of the run (see `blocksim.options.Observer`) are
+    called at each step of the run, e.g. `OnWorld` to measure the simulation world.
+
+    With the `Instrumentation` observer, the messages sent and received by the nodes are counted,
+    with the events they schedule and the wall time spent on them, and the table of the counters
+    is printed at the end of the run (see `blocksim.instrumentation.MessageCounters`).
+
+    With a `profiler` (`blocksim.profiler.PhaseProfiler`), the wall time, CPU time, memory and top
+    allocators of each phase of the run are measured and written to
+    `reports/profile_{algo}_{num_nodes}_{run_id}.txt`. The phase `cprofile_phase` of the profiler
+    (`input`, `world`, `nodes`, `topology`, `simulation`, `chains` or `reports`) also runs under
+    `cProfile`, and its statistics are written next to the report.
+
+    With the `Trace` observer, the messages, blocks, chain heads and transaction queues of the run
+    are written to a binary trace file, to compute metrics after the run (see `blocksim.trace`).
+
+    With the `Telemetry` observer, the progress of the simulation is reported at an interval of
+    simulated seconds, to the standard error or as JSON lines to a file (see
+    `blocksim.telemetry.TelemetryMonitor`). The monitor can stop a simulation that runs for too long.
+
+    With the `Convergence` observer (with the parameters of
+    `blocksim.convergence.ConvergenceController`), the simulation stops when the block
+    propagation latency and finality estimates converge. The metrics then include
+    the reason the simulation stopped (`stop_reason`) and the simulated time (`simulated_time`).
+
+    With the `BatchMeans` observer, the run is analysed as one long run: the warm-up
+    transient of the series of block latencies and finality times is discarded with the MSER
+    rule and the rest is split in batches, and the metrics include the batch-means confidence
+    interval of each metric (`batch_means`, see `ReportEngine.get_batch_means_report`). One long
+    run then replaces many replications, each with its own setup and warm-up.
+
+    With the `RecordResults` observer, the metrics of the run and the latency and finality time of
+    each block are added to a SQLite database of results (see `blocksim.results_db.ResultsDB`).
+
+    Returns the block and transaction metrics of the run, or a list with the metrics of each replica.
+
+    The modules of the simulation are imported by the first run, and the modules of the optional
+    features only by the runs that use them, so importing this module is fast (e.g. for the
+    workers of `blocksim.workers.warm_pool`)."""
+    from blocksim.models.network import Network
+    from blocksim.node_factory import NodeFactory
+    from blocksim.profiler import NoProfiler
+    from blocksim.report_engine import ReportEngine
+    from blocksim.transaction_factory import TransactionFactory
+    from blocksim.utils import get_optimum_neighbours, get_random_neighbours, initialize_node_values, \
+        update_random_neighbours
+    from blocksim.world import SimulationWorld
+
+    features = {name for name, enabled in (
+        ('partitions', partitions is not None), ('ensemble', ensemble is not None),
+        ('checkpoints', checkpoints is not None), ('replicas', replicas is not None),
+        ('fast_forward', fast_forward)) if enabled}
+    check_options([option for option in (partitions, checkpoints, replicas) if option is not None] + list(observers),
+                  features)
     now = int(time.time())  # Current time
-    duration = 3600*6  # seconds
-
-    input_data = initialize_node_values(algo=algo, run_id=run_id, num=num_nodes)
-
-    world = SimulationWorld(
-        duration,
-        now,
-        'input-parameters/config.json',
-        'input-parameters/latency.json',
-        'input-parameters/throughput-received.json',
-        'input-parameters/throughput-sent.json',
-        'input-parameters/delays.json')
-
-    # Create the network
-    network = Network(world.env, 'NetworkXPTO')
-
-    node_factory = NodeFactory(world, network)
-    # Create all nodes
-    # nodes_list = node_factory.create_nodes(miners, non_miners)
-    nodes_dict = node_factory.create_nodes_from_read_data(input_data)
-    # Start the network heartbeat
-    world.env.process(network.start_heartbeat())
-    # Full Connect all nodes
+    run = {'algo': 'RNS' if RNS else algo, 'num_nodes': num_nodes, 'run_id': run_id, 'seed': seed,
+           'start': now, 'duration': duration}
+    profiler = NoProfiler() if profiler is None else profiler
 
-    neigh = []
-    if RNS:
-        solution = {}
-        for node_id, node in nodes_dict.items():
-           neigh, neigh_ids = get_random_neighbours(AV_NEIGHBOURS, node_id, nodes_dict)
-           solution[node_id] = (neigh_ids, neigh)
-        #    node.connect(neigh)
-        for node_id, node in nodes_dict.items():
-            neigh = update_random_neighbours(node_id, nodes_dict, solution)
-            node.connect(neigh)
-    else:
-        for node_id, node in nodes_dict.items():
-           neigh = get_optimum_neighbours(node_id, nodes_dict)
-           node.connect(neigh)
+    def write_profile():
+        profiler.write_report(f'reports/profile_{algo}_{num_nodes}_{run_id}.txt')
+
+    with profiler.phase('input'):
+        input_data = initialize_node_values(folder_path=folder_path, algo=algo, run_id=run_id, num=num_nodes, mmap_links=mmap_links,
+                                            coordinate_links=coordinate_links)
+
+    with profiler.phase('world'):
+        world = SimulationWorld(
+            duration,
+            now,
+            'input-parameters/config.json',
+            'input-parameters/latency.json',
+            'input-parameters/throughput-received.json',
+            'input-parameters/throughput-sent.json',
+            'input-parameters/delays.json',
+            blockchain,
+            config_overrides)
+        for observer in observers:
+            observer.on_world(world, run)
+
+    with profiler.phase('nodes'):
+        streams = None
+        if seed is not None:
+            from blocksim.random_streams import RandomStreams
+            streams = RandomStreams(seed)
+
+        # Create the network
+        network_class = Network
+        if partitions is not None:
+            from blocksim.parallel import PartitionedNetwork
+            network_class = PartitionedNetwork
+        if streams is None:
+            network = network_class(world.env, 'NetworkXPTO')
+        else:
+            network = network_class(world.env, 'NetworkXPTO', streams.generator('block_intervals'),
+                                    streams.generator('miner_choice'))
+
+        node_factory = NodeFactory(world, network)
+        # Create all nodes
+        # nodes_list = node_factory.create_nodes(miners, non_miners)
+        nodes_dict = node_factory.create_nodes_from_read_data(input_data)
+        if streams is not None:
+            for node in nodes_dict.values():
+                node.set_random_streams(streams)
+        for observer in observers:
+            observer.on_nodes(world, nodes_dict, run)
+        # Start the network heartbeat
+        world.env.process(network.start_heartbeat())
+
+    with profiler.phase('topology'):
+        neighbours = {}
+        neigh = []
+        if RNS:
+            topology_rng = None if streams is None else streams.generator('topology')
+            solution = {}
+            for node_id, node in nodes_dict.items():
+               neigh, neigh_ids = get_random_neighbours(AV_NEIGHBOURS, node_id, nodes_dict, topology_rng)
+               solution[node_id] = (neigh_ids, neigh)
+            #    node.connect(neigh)
+            for node_id, node in nodes_dict.items():
+                neighbours[node_id] = update_random_neighbours(node_id, nodes_dict, solution)
+        else:
+            for node_id, node in nodes_dict.items():
+               neighbours[node_id] = get_optimum_neighbours(node_id, nodes_dict)
+
+    if ensemble is not None:
+        from blocksim.ensemble import Ensemble
+        with profiler.phase('simulation'):
+            lockstep = Ensemble.from_world(
+                world, nodes_dict, neighbours, ensemble, relay_blocks,
+                None if streams is None else streams.generator('ensemble'))
+            metrics = lockstep.run(now, duration)
+        write_profile()
+        return metrics
 
-        
+    workload = None
+    transactions_rng = None if streams is None else streams.generator('transactions')
 
-    transaction_factory = TransactionFactory(world)
-    transaction_factory.broadcast(10, 40, 15, nodes_dict)
+    def start_transactions():
+        nonlocal workload
+        if transaction_trace is not None:
+            from blocksim.workload import TraceWorkload
+            workload = TraceWorkload(world, nodes_dict, transaction_trace, random_state=transactions_rng)
+            world.env.process(workload.run())
+        elif streaming_workload:
+            from blocksim.workload import TransactionWorkload
+            workload = TransactionWorkload.from_config(world, nodes_dict, random_state=transactions_rng)
+            world.env.process(workload.run())
+        else:
+            transaction_factory = TransactionFactory(world, transactions_rng)
+            transaction_factory.broadcast(10, 40, 15, nodes_dict)
 
-    
-    world.start_simulation()
-    
-    
-    report_node_chain(world, list(nodes_dict.values()))
-    reports = ReportEngine(list(nodes_dict.values()), world.env.data)
-    reports.get_txn_report(duration)
+    def report():
+        with profiler.phase('chains'):
+            report_node_chain(world, list(nodes_dict.values()))
+        with profiler.phase('reports'):
+            reports = ReportEngine(list(nodes_dict.values()), world.env.data)
+            metrics = reports.get_block_report()
+            # A stopped simulation does not reach the end
+            simulated_time = duration if world.stop_reason is None else world.env.now - now
+            if not fast_forward:
+                metrics.update(reports.get_txn_report(simulated_time))
+            for observer in observers:
+                observer.on_report(world, reports, metrics, run)
+        return metrics
+
+    def end():
+        for observer in observers:
+            observer.on_end(world, nodes_dict, run)
+        write_profile()
+
+    if partitions is not None:
+        from blocksim.parallel import run_partitioned
+        # The partitions connect their nodes in the worker processes
+        with profiler.phase('simulation'):
+            run_partitioned(world, network, nodes_dict, neighbours, start_transactions, partitions.count,
+                            partitions.by)
+        metrics = report()
+        end()
+        return metrics
+
+    # Full Connect all nodes
+    with profiler.phase('topology'):
+        if fast_forward:
+            from blocksim.fast_forward import FastForward
+            propagation = FastForward(world, network, relay_blocks)
+            for node_id, node in nodes_dict.items():
+                propagation.connect(node, neighbours[node_id])
+        else:
+            for node_id, node in nodes_dict.items():
+                node.connect(neighbours[node_id])
+            # Transactions are not simulated in fast-forward mode
+            start_transactions()
+
+    def finish():
+        if checkpoints is not None:
+            from blocksim.checkpoint import Checkpointer
+            # The reports are made by the process that finishes the simulation, their phases
+            # are measured as part of the simulation
+            with profiler.phase('simulation'):
+                return Checkpointer(world, network, checkpoints.interval, checkpoints.directory).run(report)
+        with profiler.phase('simulation'):
+            world.start_simulation()
+        return report()
+
+    def discard_samples():
+        network.discard_samples()
+        if workload is not None:
+            workload.discard_samples()
+
+    if replicas is not None:
+        from blocksim.checkpoint import fork_replicas
+        with profiler.phase('simulation'):
+            world.env.run(until=now + replicas.warmup)
+        # The replicas run in their own processes, their phases are not measured
+        metrics = fork_replicas(replicas.seeds, finish, on_reseed=discard_samples, streams=streams)
+    else:
+        metrics = finish()
+    end()
 
     # print(nodes_dict)
     # write_report(world)
     xyz = 1
+    return metrics
 
 
 if __name__ == '__main__':
+    from blocksim.replications import SequentialReplications
     xyz = time.time()
     algos = ["mst"]#, "RNS", "CL_PSO", "HPSO", "PPSO", "mst"]
     for algo in algos:
@@ -111,6 +310,13 @@ if __name__ == '__main__':
             # RNS generates its own neighbours, therefore, the value of algo needed to read solution files is 
             # irrelevant. BasePSO has been selected to avoid exceptions. Any other value could have been chosen
             algo = "BasePSO" 
-        for n in range(0, NUMBER_OF_RUNS, 1):
-            run_model(algo=algo, run_id=n, num_nodes=NETWORK_SIZE)
+        replications = SequentialReplications(
+            # The seed of the run n is the same for all the algorithms (common random numbers)
+            lambda n: run_model(algo=algo, run_id=n, num_nodes=NETWORK_SIZE, seed=n),
+            PRECISION_TARGETS, max_runs=NUMBER_OF_RUNS)
+        summary = replications.run()
+        print(f'{algo}: {summary["runs"]} runs, targets met: {summary["converged"]}')
+        for metric, values in summary['metrics'].items():
+            print(f'  {metric}: {values["mean"]:.4f} +- {values["half_width"]:.4f} '
+                  f'({values["relative_half_width"]:.2%}, target {values["target"]:.2%})')
     print(time.time() - xyz)
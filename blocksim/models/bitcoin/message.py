@@ -1,10 +1,103 @@
+from blocksim.models.message import Message
 from blocksim.utils import kB_to_MB
 
+# Type tags of the Bitcoin P2P protocol messages. They do not overlap with the
+# Ethereum tags, so the base node can tell them apart.
+VERSION = 10
+VERACK = 11
+INV_BLOCK = 12
+INV_TX = 13
+GETDATA_BLOCK = 14
+GETDATA_TX = 15
+BLOCK = 16
+TX = 17
+
+
+class Version(Message):
+    __slots__ = ()
+    tag = VERSION
+    id = 'version'
+
+
+class Verack(Message):
+    __slots__ = ()
+    tag = VERACK
+    id = 'verack'
+
+
+class Inv(Message):
+    __slots__ = ('hashes',)
+    id = 'inv'
+    type = None
+
+    def __init__(self, hashes: list, size):
+        super().__init__(size)
+        self.hashes = hashes
+
+
+class InvBlock(Inv):
+    __slots__ = ()
+    tag = INV_BLOCK
+    type = 'block'
+
+
+class InvTx(Inv):
+    __slots__ = ()
+    tag = INV_TX
+    type = 'tx'
+
+
+class GetData(Message):
+    __slots__ = ('hashes',)
+    id = 'getdata'
+    type = None
+
+    def __init__(self, hashes: list, size):
+        super().__init__(size)
+        self.hashes = hashes
+
+
+class GetDataBlock(GetData):
+    __slots__ = ()
+    tag = GETDATA_BLOCK
+    type = 'block'
+
+
+class GetDataTx(GetData):
+    __slots__ = ()
+    tag = GETDATA_TX
+    type = 'tx'
+
+
+class FullBlock(Message):
+    __slots__ = ('block',)
+    tag = BLOCK
+    id = 'block'
+
+    def __init__(self, block, size):
+        super().__init__(size)
+        self.block = block
+
+
+class FullTx(Message):
+    __slots__ = ('tx',)
+    tag = TX
+    id = 'tx'
+
+    def __init__(self, tx, size):
+        super().__init__(size)
+        self.tx = tx
+
+
+_INV_TYPES = {'block': InvBlock, 'tx': InvTx}
+_GETDATA_TYPES = {'block': GetDataBlock, 'tx': GetDataTx}
+
 
 class BTCMessage:
     """Defines a model for the network messages of the Bitcoin blockchain.
 
     For each message its calculated the size, taking into account measurements from the live and public network.
+    The sizes that do not depend on the message content are converted to MB only once, when the node is created.
     """
 
     def __init__(self, origin_node):
@@ -13,58 +106,49 @@ class BTCMessage:
         self._message_size = _env.config['bitcoin']['message_size_kB']
         # In bitcoin the header size has a fixed size https://en.bitcoin.it/wiki/Protocol_documentation#Message_structure
         self._header_size = self._message_size['header']
+        self._version_size = kB_to_MB(self._header_size + self._message_size['version'])
+        self._verack_size = kB_to_MB(self._header_size + self._message_size['verack'])
+        self._tx_size = kB_to_MB(self._header_size + self._message_size['tx'])
+
+    def _transactions_size(self, transactions: list):
+        """Size in kB of a list of transactions. Transactions without a size (e.g. not
+        replayed from a trace) have the size of the configuration"""
+        tx_size = self._message_size['tx']
+        return sum(tx_size if tx.size is None else tx.size for tx in transactions)
 
     def version(self):
         """ When a node creates an outgoing connection, it will immediately advertise its version.
         https://en.bitcoin.it/wiki/Protocol_documentation#version"""
-        return {
-            'id': 'version',
-            'size': kB_to_MB(self._header_size + self._message_size['version'])
-        }
+        return Version(self._version_size)
 
     def verack(self):
         """ The verack message is sent in reply to version. This message consists of only
         a message header with the command string "verack".
         https://en.bitcoin.it/wiki/Protocol_documentation#verack"""
-        return {
-            'id': 'verack',
-            'size': kB_to_MB(self._header_size + self._message_size['verack'])
-        }
+        return Verack(self._verack_size)
 
     def inv(self, hashes: list, _type: str):
         """Allows a node to advertise its knowledge of one or more transactions or blocks
         https://en.bitcoin.it/wiki/Protocol_documentation#inv"""
         num_items = len(hashes)
         inv_size = num_items * self._message_size['inv_vector']
-        return {
-            'id': 'inv',
-            'type': _type,
-            'hashes': hashes,
-            'size': kB_to_MB(self._header_size + inv_size)
-        }
+        return _INV_TYPES[_type](hashes, kB_to_MB(self._header_size + inv_size))
 
     def tx(self, tx):
         """Sends a bitcoin transaction, in reply to getdata
         https://en.bitcoin.it/wiki/Protocol_documentation#tx"""
-        return {
-            'id': 'tx',
-            'tx': tx,
-            'size': kB_to_MB(self._header_size + self._message_size['tx'])
-        }
+        if tx.size is None:
+            return FullTx(tx, self._tx_size)
+        return FullTx(tx, kB_to_MB(self._header_size + tx.size))
 
     def block(self, block):
         """Sends the body of a bitcoin block in response to a getdata message which
         requests transaction information from a block hash
         https://en.bitcoin.it/wiki/Protocol_documentation#block"""
-        num_txs_block = len(block.transactions)
-        block_txs_size = self._message_size['tx'] * num_txs_block
+        block_txs_size = self._transactions_size(block.transactions)
         total_block_size = self._header_size + \
             self._message_size['block_base'] + block_txs_size
-        return {
-            'id': 'block',
-            'block': block,
-            'size': kB_to_MB(total_block_size)
-        }
+        return FullBlock(block, kB_to_MB(total_block_size))
 
     def get_data(self, hashes: list, _type: str):
         """Used to retrieve the content of a specific type (e.g. block or transaction).
@@ -72,9 +156,4 @@ class BTCMessage:
         https://en.bitcoin.it/wiki/Protocol_documentation#getdata"""
         num_items = len(hashes)
         inv_size = num_items * self._message_size['inv_vector']
-        return {
-            'id': 'getdata',
-            'type': _type,
-            'hashes': hashes,
-            'size': kB_to_MB(self._header_size + inv_size)
-        }
+        return _GETDATA_TYPES[_type](hashes, kB_to_MB(self._header_size + inv_size))
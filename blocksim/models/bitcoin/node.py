@@ -1,5 +1,6 @@
 from blocksim.models.node import Node
 from blocksim.models.network import Network
+from blocksim.models.bitcoin import message
 from blocksim.models.bitcoin.message import BTCMessage
 from blocksim.models.chain import Chain
 from blocksim.models.db import BaseDB
@@ -59,7 +60,7 @@ class BTCNode(Node):
         transactions_per_block_dist = self.env.config[
             'bitcoin']['number_transactions_per_block']
         transactions_per_block = int(
-            get_random_values(transactions_per_block_dist)[0])
+            get_random_values(transactions_per_block_dist, random_state=self.consensus.random_state)[0])
         pending_txs = []
         for i in range(transactions_per_block * block_size):
             if self.transaction_queue.is_empty():
@@ -87,30 +88,20 @@ class BTCNode(Node):
             timestamp,
             coinbase,
             difficulty)
-        return Block(candidate_block_header, pending_txs)
+        candidate_block = Block(candidate_block_header, pending_txs)
+        self.network.block_built(candidate_block)
+        return candidate_block
 
     def _read_envelope(self, envelope):
         """It implements how bitcon P2P protocol works, more info here:
-        https://bitcoin.org/en/developer-reference#p2p-network"""
+        https://bitcoin.org/en/developer-reference#p2p-network
+
+        The message is dispatched to its handler, looked up by the message type tag
+        in `_envelope_handlers`"""
         super()._read_envelope(envelope)
-        if envelope.msg['id'] == 'version':
-            self._receive_version(envelope)
-        if envelope.msg['id'] == 'verack':
-            self._receive_verack(envelope)
-        if envelope.msg['id'] == 'inv':
-            if envelope.msg['type'] == 'block':
-                self._receive_new_inv_blocks(envelope)
-            if envelope.msg['type'] == 'tx':
-                self._receive_new_inv_transactions(envelope)
-        if envelope.msg['id'] == 'getdata':
-            if envelope.msg['type'] == 'block':
-                self._send_full_blocks(envelope)
-            if envelope.msg['type'] == 'tx':
-                self._send_full_transactions(envelope)
-        if envelope.msg['id'] == 'block':
-            self._receive_full_block(envelope)
-        if envelope.msg['id'] == 'tx':
-            self._receive_full_transaction(envelope)
+        handler = self._envelope_handlers.get(envelope.msg.tag)
+        if handler is not None:
+            handler(self, envelope)
 
     ##              ##
     ## Handshake    ##
@@ -184,10 +175,10 @@ class BTCNode(Node):
 
     def _send_full_transactions(self, envelope):
         """Send a full transaction for any node that request it, identified by the
-        `destination_address`. In `envelope.msg['hashes']` we obtain a list of hashes of
+        `destination_address`. In `envelope.msg.hashes` we obtain a list of hashes of
         transactions being requested
         """
-        for tx_hash in envelope.msg['hashes']:
+        for tx_hash in envelope.msg.hashes:
             if tx_hash in self.temp_txs:
                 tx = self.temp_txs[tx_hash]
                 del self.temp_txs[tx_hash]
@@ -199,7 +190,7 @@ class BTCNode(Node):
     def _receive_new_inv_transactions(self, envelope):
         """Handle new transactions received"""
         request_txs = []
-        for tx_hash in envelope.msg.get('hashes'):
+        for tx_hash in envelope.msg.hashes:
             # Only request full TX that are not on transit
             if tx_hash not in self.tx_on_transit:
                 request_txs.append(tx_hash)
@@ -209,7 +200,7 @@ class BTCNode(Node):
 
     def _receive_full_transaction(self, envelope):
         """Handle full tx received. If node is miner store transactions in a pool"""
-        tx = envelope.msg.get('tx')
+        tx = envelope.msg.tx
         del self.tx_on_transit[tx.hash]
         if self.is_mining:
             self.transaction_queue.put(tx)
@@ -229,7 +220,7 @@ class BTCNode(Node):
         """Handle new `inv` blocks received (https://bitcoin.org/en/developer-reference#inv).
         The destination only receives the hash of the block, and then ask for the entire block
         by calling `getdata` netowork protocol message (https://bitcoin.org/en/developer-reference#getdata)."""
-        new_blocks_hashes = envelope.msg.get('hashes')
+        new_blocks_hashes = envelope.msg.hashes
         print(
             f'{self.address} at {time(self.env)}: {len(new_blocks_hashes)} new blocks announced by {envelope.origin.address}')
         get_data_msg = self.network_message.get_data(
@@ -240,10 +231,10 @@ class BTCNode(Node):
     def _send_full_blocks(self, envelope):
         """Send a full block (https://bitcoin.org/en/developer-reference#block) for any node that
         request it (`envelope.origin.address`) by using `getdata`.
-        In `envelope.msg['hashes']` we obtain a list of hashes of full blocks being requested
+        In `envelope.msg.hashes` we obtain a list of hashes of full blocks being requested
         """
         origin = envelope.origin.address
-        for block_hash in envelope.msg['hashes']:
+        for block_hash in envelope.msg.hashes:
             block = self.chain.get_block(block_hash)
             print(
                 f'{self.address} at {time(self.env)}: Block {block.header.hash[:8]} preapred to send to {origin}')
@@ -253,7 +244,7 @@ class BTCNode(Node):
     def _receive_full_block(self, envelope):
         """Handle full blocks received.
         The node tries to add the block to the chain, by performing validation."""
-        block = envelope.msg['block']
+        block = envelope.msg.block
         is_added = self.chain.add_block(block)
         if is_added:
             print(
@@ -261,3 +252,31 @@ class BTCNode(Node):
         else:
             print(
                 f'{self.address} at {time(self.env)}: Block NOT added to the chain {block.header}')
+
+    def _validate_block(self, msg):
+        """Validates the block before sending it, as Bitcoin validates a block when it
+        receives the full block"""
+        delay = self.consensus.validate_block()
+        yield self.env.timeout(delay)
+
+    def _validate_transaction(self, msg):
+        delay = self.consensus.validate_transaction()
+        yield self.env.timeout(delay)
+
+    # Validation of the messages before being sent, by message type tag
+    VALIDATE_BEFORE_SENDING = {
+        message.BLOCK: _validate_block,
+        message.TX: _validate_transaction
+    }
+
+    # Handlers of the received messages, by message type tag
+    _envelope_handlers = {
+        message.VERSION: _receive_version,
+        message.VERACK: _receive_verack,
+        message.INV_BLOCK: _receive_new_inv_blocks,
+        message.INV_TX: _receive_new_inv_transactions,
+        message.GETDATA_BLOCK: _send_full_blocks,
+        message.GETDATA_TX: _send_full_transactions,
+        message.BLOCK: _receive_full_block,
+        message.TX: _receive_full_transaction
+    }
@@ -22,6 +22,8 @@ class Chain:
         self.db.put(genesis.header.hash, genesis)
         self._head_hash = genesis.header.hash
         self.parent_queue = {}
+        # Random numbers used to break the ties in the fork choice
+        self.random = random
 
     @property
     def head(self):
@@ -29,6 +31,13 @@ class Chain:
         block = self.db.get(self._head_hash)
         return block
 
+    def _set_head(self, block):
+        self._head_hash = block.header.hash
+        if self.env.tracer is not None:
+            self.env.tracer.head_changed(self.node, block)
+        if self.env.convergence is not None:
+            self.env.convergence.head_changed(self.node, block)
+
     def get_parent(self, block):
         """Genesis Block do not have parent"""
         if block.header.number == 0:
@@ -94,7 +103,7 @@ class Chain:
         score = int(self.db.get(key))
         for h, d in fills:
             key = f'score:{h}'
-            score = score + d + random.randrange(10**6 + 1)
+            score = score + d + self.random.randrange(10**6 + 1)
             self.db.put(key, str(score))
         return score
 
@@ -109,7 +118,7 @@ class Chain:
             print(
                 f'{self.node.address} at {time(self.env)}: Adding block #{block.header.number} ({block.header.hash[:8]}) to the head', )
             self.db.put(f'block:{block.header.number}', block.header.hash)
-            self._head_hash = block.header.hash
+            self._set_head(block)
         # Or is the block being added to a chain that is not currently the head?
         elif block.header.prevhash in self.db:
             print(
@@ -160,7 +169,7 @@ class Chain:
                         self.db.put(key, new_block_at_height.header.hash)
                     if i not in new_chain and not orig_at_height:
                         break
-                self._head_hash = block.header.hash
+                self._set_head(block)
         # Block has no parent yet. An Orphan block
         else:
             if block.header.prevhash not in self.parent_queue:
@@ -13,6 +13,8 @@ class Consensus:
 
     def __init__(self, env):
         self.env = env
+        # NumPy generator of the delays. If None, the global NumPy random state is used
+        self.random_state = None
 
     def calc_difficulty(self, parent, timestamp):
         """Difficulty adjustment algorithm for the simulator.
@@ -24,12 +26,12 @@ class Consensus:
         """ Simulates the block validation.
         For now, it only applies a delay in simulation, corresponding to previous measurements"""
         delay = round(get_random_values(
-            self.env.delays['block_validation'])[0], 4)
+            self.env.delays['block_validation'], random_state=self.random_state)[0], 4)
         return delay
 
     def validate_transaction(self, tx=None):
         """ Simulates the transaction validation.
         For now, it only calculates a delay in simulation, corresponding to previous measurements"""
         delay = round(get_random_values(
-            self.env.delays['tx_validation'])[0], 4)
+            self.env.delays['tx_validation'], random_state=self.random_state)[0], 4)
         return delay
@@ -1,10 +1,96 @@
+from blocksim.models.message import Message
 from blocksim.utils import kB_to_MB
 
+# Type tags of the Ethereum wire protocol messages
+STATUS = 0
+NEW_BLOCKS = 1
+TRANSACTIONS = 2
+GET_HEADERS = 3
+BLOCK_HEADERS = 4
+GET_BLOCK_BODIES = 5
+BLOCK_BODIES = 6
+
+
+class Status(Message):
+    __slots__ = ('protocol_version', 'network', 'td', 'best_hash', 'genesis_hash')
+    tag = STATUS
+    id = 'status'
+
+    def __init__(self, protocol_version, network, td, best_hash, genesis_hash, size):
+        super().__init__(size)
+        self.protocol_version = protocol_version
+        self.network = network
+        self.td = td
+        self.best_hash = best_hash
+        self.genesis_hash = genesis_hash
+
+
+class NewBlocks(Message):
+    __slots__ = ('new_blocks',)
+    tag = NEW_BLOCKS
+    id = 'new_blocks'
+
+    def __init__(self, new_blocks: dict, size):
+        super().__init__(size)
+        self.new_blocks = new_blocks
+
+
+class Transactions(Message):
+    __slots__ = ('transactions',)
+    tag = TRANSACTIONS
+    id = 'transactions'
+
+    def __init__(self, transactions: list, size):
+        super().__init__(size)
+        self.transactions = transactions
+
+
+class GetHeaders(Message):
+    __slots__ = ('block_number', 'max_headers')
+    tag = GET_HEADERS
+    id = 'get_headers'
+
+    def __init__(self, block_number: int, max_headers: int, size):
+        super().__init__(size)
+        self.block_number = block_number
+        self.max_headers = max_headers
+
+
+class BlockHeaders(Message):
+    __slots__ = ('block_headers',)
+    tag = BLOCK_HEADERS
+    id = 'block_headers'
+
+    def __init__(self, block_headers: list, size):
+        super().__init__(size)
+        self.block_headers = block_headers
+
+
+class GetBlockBodies(Message):
+    __slots__ = ('hashes',)
+    tag = GET_BLOCK_BODIES
+    id = 'get_block_bodies'
+
+    def __init__(self, hashes: list, size):
+        super().__init__(size)
+        self.hashes = hashes
+
+
+class BlockBodies(Message):
+    __slots__ = ('block_bodies',)
+    tag = BLOCK_BODIES
+    id = 'block_bodies'
+
+    def __init__(self, block_bodies: dict, size):
+        super().__init__(size)
+        self.block_bodies = block_bodies
+
 
 class ETHMessage:
     """Defines a model for the network messages of the Ethereum blockchain.
 
     For each message its calculated the size, taking into account measurements from the live and public network.
+    The sizes that do not depend on the message content are converted to MB only once, when the node is created.
 
     Ethereum Wire Protocol: https://github.com/ethereum/wiki/wiki/Ethereum-Wire-Protocol
     """
@@ -13,52 +99,45 @@ class ETHMessage:
         self.origin_node = origin_node
         _env = origin_node.env
         self._message_size = _env.config['ethereum']['message_size_kB']
+        self._status_size = kB_to_MB(self._message_size['status'])
+        self._get_headers_size = kB_to_MB(self._message_size['get_headers'])
+
+    def _transactions_size(self, transactions: list):
+        """Size in kB of a list of transactions. Transactions without a size (e.g. not
+        replayed from a trace) have the size of the configuration"""
+        tx_size = self._message_size['tx']
+        return sum(tx_size if tx.size is None else tx.size for tx in transactions)
 
     def status(self):
         """ Inform a peer of its current Ethereum state.
         This message should be sent `after` the initial handshake and `prior` to any ethereum related messages.
         """
-        return {
-            'id': 'status',
-            'protocol_version': 'PV62',
-            'network': self.origin_node.network.name,
-            'td': self.origin_node.chain.head.header.difficulty,
-            'best_hash': self.origin_node.chain.head.header.hash,
-            'genesis_hash': self.origin_node.chain.genesis.header.hash,
-            'size': kB_to_MB(self._message_size['status'])
-        }
+        head = self.origin_node.chain.head
+        return Status(
+            'PV62',
+            self.origin_node.network.name,
+            head.header.difficulty,
+            head.header.hash,
+            self.origin_node.chain.genesis.header.hash,
+            self._status_size)
 
     def new_blocks(self, new_blocks: dict):
         """Advertises one or more new blocks which have appeared on the network"""
         num_new_block_hashes = len(new_blocks)
         new_blocks_size = num_new_block_hashes * \
             self._message_size['hash_size']
-        return {
-            'id': 'new_blocks',
-            'new_blocks': new_blocks,
-            'size': kB_to_MB(new_blocks_size)
-        }
+        return NewBlocks(new_blocks, kB_to_MB(new_blocks_size))
 
     def transactions(self, transactions: list):
         """ Specify (a) transaction(s) that the peer should make sure is included on its
         transaction queue. Nodes must not resend the same transaction to a peer in the same session.
         This packet must contain at least one (new) transaction.
         """
-        num_txs = len(transactions)
-        transactions_size = num_txs * self._message_size['tx']
-        return {
-            'id': 'transactions',
-            'transactions': transactions,
-            'size': kB_to_MB(transactions_size)
-        }
+        transactions_size = self._transactions_size(transactions)
+        return Transactions(transactions, kB_to_MB(transactions_size))
 
     def get_headers(self, block_number: int, max_headers: int):
-        return {
-            'id': 'get_headers',
-            'block_number': block_number,
-            'max_headers': max_headers,
-            'size': kB_to_MB(self._message_size['get_headers'])
-        }
+        return GetHeaders(block_number, max_headers, self._get_headers_size)
 
     def block_headers(self, block_headers: list):
         """ Reply to `get_headers` the items in the list are block headers.
@@ -67,33 +146,22 @@ class ETHMessage:
         """
         num_headers = len(block_headers)
         block_headers_size = num_headers * self._message_size['header']
-        return {
-            'id': 'block_headers',
-            'block_headers': block_headers,
-            'size': kB_to_MB(block_headers_size)
-        }
+        return BlockHeaders(block_headers, kB_to_MB(block_headers_size))
 
     def get_block_bodies(self, hashes: list):
         block_bodies_size = len(hashes) * self._message_size['hash_size']
-        return {
-            'id': 'get_block_bodies',
-            'hashes': hashes,
-            'size': kB_to_MB(block_bodies_size)
-        }
+        return GetBlockBodies(hashes, kB_to_MB(block_bodies_size))
 
     def block_bodies(self, block_bodies: dict):
         """ Reply to `get_block_bodies`. The items in the list are some of the blocks, minus the header.
         This may contain no items if no blocks were able to be returned for the `get_block_bodies` message.
         """
         txsCount = 0
+        txs_size = 0
         for block_hash, block_txs in block_bodies.items():
             txsCount += len(block_txs)
-        message_size = (
-            txsCount * self._message_size['tx']) + self._message_size['block_bodies']
+            txs_size += self._transactions_size(block_txs)
+        message_size = txs_size + self._message_size['block_bodies']
         print(
             f'block bodies with {txsCount} txs have a message size: {message_size} kB')
-        return {
-            'id': 'block_bodies',
-            'block_bodies': block_bodies,
-            'size': kB_to_MB(message_size)
-        }
+        return BlockBodies(block_bodies, kB_to_MB(message_size))
@@ -6,6 +6,7 @@ from blocksim.models.db import BaseDB
 from blocksim.models.transaction_queue import TransactionQueue
 from blocksim.utils import time
 from blocksim.models.ethereum.block import Block, BlockHeader
+from blocksim.models.ethereum import message
 from blocksim.models.ethereum.message import ETHMessage
 
 
@@ -85,24 +86,17 @@ class ETHNode(Node):
             difficulty,
             gas_limit_per_block,
             txs_intrinsic_gas)
-        return Block(candidate_block_header, pending_txs)
+        candidate_block = Block(candidate_block_header, pending_txs)
+        self.network.block_built(candidate_block)
+        return candidate_block
 
     def _read_envelope(self, envelope):
+        """Dispatches the message to its handler, looked up by the message type tag
+        in `_envelope_handlers`"""
         super()._read_envelope(envelope)
-        if envelope.msg['id'] == 'status':
-            self._receive_status(envelope)
-        if envelope.msg['id'] == 'new_blocks':
-            self._receive_new_blocks(envelope)
-        if envelope.msg['id'] == 'transactions':
-            self._receive_full_transactions(envelope)
-        if envelope.msg['id'] == 'get_headers':
-            self._send_block_headers(envelope)
-        if envelope.msg['id'] == 'block_headers':
-            self._receive_block_headers(envelope)
-        if envelope.msg['id'] == 'get_block_bodies':
-            self._send_block_bodies(envelope)
-        if envelope.msg['id'] == 'block_bodies':
-            self._receive_block_bodies(envelope)
+        handler = self._envelope_handlers.get(envelope.msg.tag)
+        if handler is not None:
+            handler(self, envelope)
 
     ##              ##
     ## Handshake    ##
@@ -128,8 +122,10 @@ class ETHNode(Node):
         node = self.active_sessions.get(envelope.origin.address)
         node['status'] = envelope.msg
         self.active_sessions[envelope.origin.address] = node
-        self._handshaking.succeed()
-        self._handshaking = self.env.event()
+        # Transactions are sent once the first handshake is completed. The event is kept
+        # triggered, so transactions broadcasted later in the simulation do not wait
+        if not self._handshaking.triggered:
+            self._handshaking.succeed()
 
     ##              ##
     ## Transactions ##
@@ -158,7 +154,7 @@ class ETHNode(Node):
 
     def _receive_full_transactions(self, envelope):
         """Handle full tx received. If node is miner store transactions in a pool (ordered by the gas price)"""
-        transactions = envelope.msg.get('transactions')
+        transactions = envelope.msg.transactions
         valid_transactions = []
         for tx in transactions:
             if self.is_mining:
@@ -220,7 +216,7 @@ class ETHNode(Node):
         The destination only receives the hash and number of the block. It is needed to
         ask for the header and body.
         If node is a miner, we need to interrupt the current candidate block mining process"""
-        new_blocks = envelope.msg['new_blocks']
+        new_blocks = envelope.msg.new_blocks
         print(f'{self.address} at {time(self.env)}: New blocks received {new_blocks}')
         # If the block is already known by a node, it does not need to request the block again
         block_numbers = []
@@ -242,8 +238,8 @@ class ETHNode(Node):
 
     def _send_block_headers(self, envelope):
         """Send block headers for any node that request it, identified by the `destination_address`"""
-        block_number = envelope.msg.get('block_number', 0)
-        max_headers = envelope.msg.get('max_headers', 1)
+        block_number = envelope.msg.block_number
+        max_headers = envelope.msg.max_headers
         block_hash = self.chain.get_blockhash_by_number(block_number)
         block_hashes = self.chain.get_blockhashes_from_hash(
             block_hash, max_headers)
@@ -258,7 +254,7 @@ class ETHNode(Node):
 
     def _receive_block_headers(self, envelope):
         """Handle block headers received"""
-        block_headers = envelope.msg.get('block_headers')
+        block_headers = envelope.msg.block_headers
         # Save the header in a temporary list
         hashes = []
         for header in block_headers:
@@ -279,7 +275,7 @@ class ETHNode(Node):
         In `envelope.msg.hashes` we obtain a list of hashes of block bodies being requested.
         """
         block_bodies = {}
-        for block_hash in envelope.msg.get('hashes'):
+        for block_hash in envelope.msg.hashes:
             block = self.chain.get_block(block_hash)
             block_bodies[block.header.hash] = block.transactions
         print(
@@ -292,14 +288,44 @@ class ETHNode(Node):
         Assemble the block header in a temporary list with the block body received and
         insert it in the blockchain"""
         block_hashes = []
-        block_bodies = envelope.msg.get('block_bodies')
+        block_bodies = envelope.msg.block_bodies
         for block_hash, block_txs in block_bodies.items():
             block_hashes.append(block_hash[:8])
             if block_hash in self.temp_headers:
                 header = self.temp_headers.get(block_hash)
                 new_block = Block(header, block_txs)
+                self.network.block_built(new_block)
                 if self.chain.add_block(new_block):
                     del self.temp_headers[block_hash]
                     print(
                         f'{self.address} at {time(self.env)}: Block assembled and added to the tip of the chain  {new_block.header}')
                     # self.broadcast_received_blocks([new_block])
+
+    def _validate_block_headers(self, msg):
+        """Validates the blocks before sending their headers, as Ethereum validates a block
+        when it receives the header"""
+        for header in msg.block_headers:
+            delay = self.consensus.validate_block()
+            yield self.env.timeout(delay)
+
+    def _validate_transactions(self, msg):
+        for tx in msg.transactions:
+            delay = self.consensus.validate_transaction()
+            yield self.env.timeout(delay)
+
+    # Validation of the messages before being sent, by message type tag
+    VALIDATE_BEFORE_SENDING = {
+        message.BLOCK_HEADERS: _validate_block_headers,
+        message.TRANSACTIONS: _validate_transactions
+    }
+
+    # Handlers of the received messages, by message type tag
+    _envelope_handlers = {
+        message.STATUS: _receive_status,
+        message.NEW_BLOCKS: _receive_new_blocks,
+        message.TRANSACTIONS: _receive_full_transactions,
+        message.GET_HEADERS: _send_block_headers,
+        message.BLOCK_HEADERS: _receive_block_headers,
+        message.GET_BLOCK_BODIES: _send_block_bodies,
+        message.BLOCK_BODIES: _receive_block_bodies
+    }
@@ -12,6 +12,7 @@ class Transaction(BaseTransaction):
     :param int nonce: sequence number, issued by the originating EOA, used to prevent message replay
     :param gasprice: price of gas (in wei) the originator is willing to pay
     :param startgas: or gas limit is the maximum amount of gas the originator is willing to pay
+    :param size: size of the transaction in kB. When it is not given, the messages use the size in the configuration
 
     """
 
@@ -24,10 +25,11 @@ class Transaction(BaseTransaction):
                  gasprice,
                  startgas,
                  gen_time,
-                 proc_time=0):
+                 proc_time=0,
+                 size=None):
         # In Ethereum the fee is calculated as following:
         fee = gasprice * startgas
-        super().__init__(to, sender, value, signature, fee, gen_time, proc_time)
+        super().__init__(to, sender, value, signature, fee, gen_time, proc_time, size)
         self.nonce = nonce
         self.gasprice = gasprice
         self.startgas = startgas
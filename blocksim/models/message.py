@@ -0,0 +1,22 @@
+class Message:
+    """ Defines the base record for the network messages exchanged between nodes.
+
+    Messages are created and read on every hop of the simulation, so each message type is
+    a small record class with ``__slots__``. A message type is identified by:
+
+    :param int tag: integer type tag, used by the nodes to dispatch the message with a single table lookup
+    :param str id: the name of the message in the wire protocol, used for logging and reports
+
+    The ``size`` (in MB) is calculated once, when the message is created.
+    """
+
+    __slots__ = ('size',)
+    tag = None
+    id = None
+
+    def __init__(self, size: float):
+        self.size = size
+
+    def __repr__(self):
+        """Returns a unambiguous representation of the message"""
+        return f'<{self.__class__.__name__}(id:{self.id} size:{self.size})>'
@@ -1,32 +1,99 @@
-import scipy
 from simpy import Store
-from blocksim.utils import get_random_values, time, get_latency_delay
+from blocksim.utils import AliasTable, get_random_values, rng, time, get_latency_delay
+
+# Number of blocks sampled at once by the network heartbeat
+HEARTBEAT_BATCH_SIZE = 1024
 
 
 class Network:
-    def __init__(self, env, name):
+    """The network of the nodes, with the heartbeat that builds the blocks.
+
+    The times between blocks and the orphan block situations are drawn from `random_state`, and
+    the miners from `miner_random_state` (by default the same generator). With separate
+    generators, the block times do not depend on the miners drawn, e.g. to compare topologies
+    with common random numbers (see `blocksim.random_streams`).
+    """
+
+    def __init__(self, env, name, random_state=None, miner_random_state=None):
         self.env = env
         self.name = name
         self.blockchain = self.env.config['blockchain']
         self.total_hashrate = 0
         self._nodes = {}
         self._list_nodes = []
-        self._list_probabilities = []
+        # Alias table over the miners hashrate, built when the heartbeat needs it
+        self._miners_table = None
+        self._samples = None
+        # Analytic propagation of the new blocks (see `blocksim.fast_forward.FastForward`)
+        self.fast_forward = None
+        self._rng = rng if random_state is None else random_state
+        self._miner_rng = self._rng if miner_random_state is None else miner_random_state
 
     def get_node(self, address):
         return self._nodes.get(address)
 
+    def is_local(self, node):
+        """If the events of `node` are simulated in this process (see `blocksim.parallel`)"""
+        return True
+
+    def create_connection(self, origin_node, destination_node):
+        """Creates the connection used by `origin_node` to send messages to `destination_node`"""
+        return Connection(self.env, origin_node, destination_node)
+
     def add_node(self, node):
         self._nodes[node.address] = node
         if node.is_mining:
             self.total_hashrate += node.hashrate
+            self._miners_table = None
+
+    def block_built(self, block):
+        """Called when a node builds a block, a candidate block or a block assembled from its
+        header and body, which sets the processing time of its transactions"""
+        pass
+
+    def set_hashrate(self, node, hashrate):
+        """Changes the hashrate of a miner node. The miners alias table is rebuilt at the next block"""
+        if node.is_mining:
+            self.total_hashrate += hashrate - node.hashrate
+            self._miners_table = None
+        node.hashrate = hashrate
 
     def _init_lists(self):
-        for add, node in self._nodes.items():
-            if node.is_mining:
-                self._list_nodes.append(node)
-                node_prob = node.hashrate / self.total_hashrate
-                self._list_probabilities.append(node_prob)
+        self._list_nodes = [node for node in self._nodes.values() if node.is_mining]
+        self._miners_table = AliasTable([node.hashrate for node in self._list_nodes])
+        # The second miner of an orphan block situation needs another miner with a hashrate
+        self._num_hashing_miners = sum(1 for node in self._list_nodes if node.hashrate > 0)
+
+    def _heartbeat_samples(self):
+        """Generates, for each block, the time between blocks, if it is an orphan block situation
+        and two uniform values to select the miner from the alias table.
+
+        The values are drawn in NumPy batches of `HEARTBEAT_BATCH_SIZE` blocks. The miner is only
+        resolved when the block is built, so the batch remains valid when the hashrates change."""
+        time_between_blocks_dist = self.env.delays['time_between_blocks_seconds']
+        orphan_blocks_probability = self.env.config[self.blockchain]['orphan_blocks_probability']
+        while True:
+            intervals = get_random_values(
+                time_between_blocks_dist, HEARTBEAT_BATCH_SIZE, random_state=self._rng).round(2).tolist()
+            orphans = (self._rng.random(HEARTBEAT_BATCH_SIZE) < orphan_blocks_probability).tolist()
+            uniforms = self._miner_rng.random((HEARTBEAT_BATCH_SIZE, 2)).tolist()
+            yield from zip(intervals, orphans, uniforms)
+
+    def discard_samples(self):
+        """Discards the values pre-sampled by the heartbeat, e.g. after the random number
+        generator is reseeded. The next block uses a new batch"""
+        self._samples = self._heartbeat_samples()
+
+    def _select_second_miner(self, first):
+        """Selects a second miner, different from `first`, by rejection on the alias table.
+        This is the same distribution as choosing two miners without replacement"""
+        if self._num_hashing_miners < 2:
+            raise ValueError('A second miner needs at least two miners with a positive hashrate')
+        while True:
+            u_column, u_coin = self._miner_rng.random(2)
+            second = self._miners_table.pick(u_column, u_coin)
+            if second != first:
+                return second
 
     def start_heartbeat(self):
         """ The "heartbeat" frequency of any blockchain network based on PoW is time difference
@@ -42,31 +109,35 @@ class Network:
         when the two blocks are found close in time, and are submitted to the network at different “ends”
 
         Each node has a corresponding hashrate. The greater the hashrate, the greater the
-        probability of the node being chosen.
+        probability of the node being chosen. The miner is drawn in O(1) from an alias table
+        over the hashrates, which is only rebuilt when the hashrates change.
         """
-        self._init_lists()
+        self._samples = self._heartbeat_samples()
         while True:
-            time_between_blocks = round(get_random_values(
-                self.env.delays['time_between_blocks_seconds'])[0], 2)
+            time_between_blocks, simulate_orphan_blocks, (u_column, u_coin) = next(self._samples)
             yield self.env.timeout(time_between_blocks)
-            orphan_blocks_probability = self.env.config[self.blockchain]['orphan_blocks_probability']
-            simulate_orphan_blocks = scipy.random.choice(
-                [True, False], 1, p=[orphan_blocks_probability, 1-orphan_blocks_probability])[0]
-            if simulate_orphan_blocks:
-                selected_nodes = scipy.random.choice(
-                    self._list_nodes, 2, replace=False, p=self._list_probabilities)
-                for selected_node in selected_nodes:
-                    self._build_new_block(selected_node)
-            else:
-                selected_node = scipy.random.choice(
-                    self._list_nodes, 1, replace=False, p=self._list_probabilities)[0]
-                self._build_new_block(selected_node)
+            if self._miners_table is None:
+                self._init_lists()
+            first = self._miners_table.pick(u_column, u_coin)
+            self._build_new_block(self._list_nodes[first])
+            # With a single miner with a hashrate, the orphan block situation falls back to one miner
+            if simulate_orphan_blocks and self._num_hashing_miners > 1:
+                second = self._select_second_miner(first)
+                self._build_new_block(self._list_nodes[second])
 
     def _build_new_block(self, node):
+        if not self.is_local(node):
+            return
         print(
             f'Network at {time(self.env)}: Node {node.address} selected to broadcast his candidate block')
         # Give orders to the selected node to broadcast his candidate block
         node.build_new_block()
+        if self.env.tracer is not None:
+            # The candidate block is the head of the miner chain
+            self.env.tracer.block_created(node, node.chain.head)
+        if self.fast_forward is not None:
+            # The candidate block is the head of the miner chain
+            self.fast_forward.propagate(node, node.chain.head)
 
 
 class Connection:
@@ -85,9 +156,15 @@ class Connection:
         yield self.env.timeout(latency_delay)
         self.store.put(envelope)
 
+    def start_listening(self):
+        """Starts the process of the destination node that reads the messages"""
+        self.env.process(self.destination_node.listening_node(self))
+
     def put(self, envelope):
         print(
-            f'{envelope.origin.address} at {envelope.timestamp}: Message (ID: {envelope.msg["id"]}) sent with {envelope.msg["size"]} MB with a destination: {envelope.destination.address}')
+            f'{envelope.origin.address} at {envelope.timestamp}: Message (ID: {envelope.msg.id}) sent with {envelope.msg.size} MB with a destination: {envelope.destination.address}')
+        if self.env.tracer is not None:
+            self.env.tracer.message_sent(envelope)
         self.env.process(self.latency(envelope))
 
     def get(self):
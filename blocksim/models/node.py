@@ -1,9 +1,10 @@
 from collections import namedtuple
-from blocksim.models.network import Connection, Network
+from blocksim.models.network import Network
 from blocksim.models.chain import Chain
 from blocksim.models.consensus import Consensus
 from blocksim.utils import get_received_delay, get_sent_delay, get_latency_delay, time
 from blocksim.models.transaction_queue import TransactionQueue
+from blocksim.models.ethereum import message as eth
 import simpy
 
 Envelope = namedtuple('Envelope', 'msg, timestamp, destination, origin')
@@ -28,6 +29,10 @@ class Node:
     In order to a node to be identified in the network simulation, is needed to have an `address`
     """
 
+    # Validation of the messages that need a block or transaction validation before being sent,
+    # by message type tag. Each blockchain defines its messages
+    VALIDATE_BEFORE_SENDING = {}
+
     def __init__(self,
                  env:simpy.Environment,
                  network: Network,
@@ -66,6 +71,9 @@ class Node:
         # Set the monitor to count the forks during the simulation
         key = f'forks_{address}'
         self.env.data[key] = 0
+        # Hot path instrumentation (see `blocksim.instrumentation`), which replaces the methods
+        # of the node by measured versions when it is enabled
+        self.env.instrumentation.instrument(self)
 
     def connect(self, nodes: list):
         """Simulate an acknowledgement phase with given nodes. During simulation the nodes
@@ -73,7 +81,7 @@ class Node:
         for node in nodes:
             # Ignore when a node is trying to connect to itself
             if node.address != self.address:
-                connection = Connection(self.env, self, node)
+                connection = self.network.create_connection(self, node)
 
                 # Set the bases to monitor the block & TX propagation
                 self.env.data['block_propagation'].update({
@@ -102,7 +110,13 @@ class Node:
         #     self.env, origin_node.location, destination_node.location)
         tcp_handshake_delay = 3*latency
         yield self.env.timeout(tcp_handshake_delay)
-        self.env.process(destination_node.listening_node(connection))
+        connection.start_listening()
+
+    def set_random_streams(self, streams):
+        """Draws the random values of the node (validation delays and fork choice) from its
+        own streams of `streams` (a `blocksim.random_streams.RandomStreams`)"""
+        self.consensus.random_state = streams.generator('consensus', self.node_id_num)
+        self.chain.random = streams.python_random('fork_choice', self.node_id_num)
 
     def _mark_block(self, block_hash: str, node_address: str):
         """Marks a block as known for a specific node, ensuring that it will never be
@@ -128,7 +142,7 @@ class Node:
 
     def _read_envelope(self, envelope):
         print(
-            f'{self.address} at {time(self.env)}: Receive a message (ID: {envelope.msg["id"]}) created at {envelope.timestamp} from {envelope.origin.address}')
+            f'{self.address} at {time(self.env)}: Receive a message (ID: {envelope.msg.id}) created at {envelope.timestamp} from {envelope.origin.address}')
 
     def listening_node(self, connection):
         while True:
@@ -136,18 +150,19 @@ class Node:
             envelope = yield connection.get()
             origin_loc = envelope.origin.address
             dest_loc = envelope.destination.address
-            message_size = envelope.msg['size']
+            msg = envelope.msg
+            message_size = msg.size
             received_delay = get_received_delay(message_size, origin_loc, dest_loc)
             # received_delay = get_received_delay(
             #     self.env, message_size, origin_loc, dest_loc)
             yield self.env.timeout(received_delay)
 
             # Monitor the transaction propagation on Ethereum
-            if envelope.msg['id'] == 'transactions':
+            if msg.tag == eth.TRANSACTIONS:
                 tx_propagation = self.env.data['tx_propagation'][
                     f'{envelope.origin.address}_{envelope.destination.address}']
                 txs = {}
-                for tx in envelope.msg['transactions']:
+                for tx in msg.transactions:
                     initial_time = tx_propagation.get(tx.hash[:8], None)
                     if type(initial_time) is tuple:
                         initial_time = initial_time[0]
@@ -157,11 +172,11 @@ class Node:
                 self.env.data['tx_propagation'][f'{envelope.origin.address}_{envelope.destination.address}'].update(
                     txs)
             # Monitor the block propagation on Ethereum
-            if envelope.msg['id'] == 'block_bodies':
+            elif msg.tag == eth.BLOCK_BODIES:
                 block_propagation = self.env.data['block_propagation'][
                     f'{envelope.origin.address}_{envelope.destination.address}']
                 blocks = {}
-                for block_hash, _ in envelope.msg['block_bodies'].items():
+                for block_hash, _ in msg.block_bodies.items():
                     initial_time = block_propagation.get(block_hash[:8], None)
                     if initial_time is not None:
                         propagation_time = self.env.now - initial_time
@@ -169,6 +184,8 @@ class Node:
                 self.env.data['block_propagation'][f'{envelope.origin.address}_{envelope.destination.address}'].update(
                     blocks)
 
+            if self.env.tracer is not None:
+                self.env.tracer.message_received(envelope)
             self._read_envelope(envelope)
 
     def send(self, destination_address: str, msg):
@@ -179,30 +196,14 @@ class Node:
         origin_node = active_connection.origin_node
         destination_node = active_connection.destination_node
 
-        # Perform block validation before sending
-        # For Ethereum it performs validation when receives the header:
-        if msg['id'] == 'block_headers':
-            for header in msg['block_headers']:
-                delay = self.consensus.validate_block()
-                yield self.env.timeout(delay)
-        # For Bitcoin it performs validation when receives the full block:
-        if msg['id'] == 'block':
-            delay = self.consensus.validate_block()
-            yield self.env.timeout(delay)
-        # Perform transaction validation before sending
-        # For Ethereum:
-        if msg['id'] == 'transactions':
-            for tx in msg['transactions']:
-                delay = self.consensus.validate_transaction()
-                yield self.env.timeout(delay)
-        # For Bitcoin:
-        if msg['id'] == 'tx':
-            delay = self.consensus.validate_transaction()
-            yield self.env.timeout(delay)
-
-        upload_transmission_delay = get_sent_delay(msg['size'], origin_node.address, destination_node.address)
+        # Perform the block or transaction validation before sending
+        validate = self.VALIDATE_BEFORE_SENDING.get(msg.tag)
+        if validate is not None:
+            yield from validate(self, msg)
+
+        upload_transmission_delay = get_sent_delay(msg.size, origin_node.address, destination_node.address)
         # upload_transmission_delay = get_sent_delay(
-        #     self.env, msg['size'], origin_node.location, destination_node.location)
+        #     self.env, msg.size, origin_node.location, destination_node.location)
         yield self.env.timeout(upload_transmission_delay)
 
         envelope = Envelope(msg, time(self.env), destination_node, origin_node)
@@ -210,29 +211,30 @@ class Node:
 
     def broadcast(self, msg):
         """Broadcast a message to all nodes with an active session"""
+        tag = msg.tag
         for add, node in self.active_sessions.items():
             connection = node['connection']
             origin_node = connection.origin_node
             destination_node = connection.destination_node
 
             # Monitor the transaction propagation on Ethereum
-            if msg['id'] == 'transactions':
+            if tag == eth.TRANSACTIONS:
                 txs = {}
-                for tx in msg['transactions']:
+                for tx in msg.transactions:
                     txs.update({f'{tx.hash[:8]}': self.env.now})
                 self.env.data['tx_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
                     txs)
             # Monitor the block propagation on Ethereum
-            if msg['id'] == 'new_blocks':
+            elif tag == eth.NEW_BLOCKS:
                 blocks = {}
-                for block_hash in msg['new_blocks']:
+                for block_hash in msg.new_blocks:
                     blocks.update({f'{block_hash[:8]}': self.env.now})
                 self.env.data['block_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
                     blocks)
             
-            upload_transmission_delay = get_sent_delay(msg['size'], origin_node.address, destination_node.address)
+            upload_transmission_delay = get_sent_delay(msg.size, origin_node.address, destination_node.address)
             # upload_transmission_delay = get_sent_delay(
-            #     self.env, msg['size'], origin_node.location, destination_node.location)
+            #     self.env, msg.size, origin_node.location, destination_node.location)
             yield self.env.timeout(upload_transmission_delay)
             envelope = Envelope(msg, time(self.env),
                                 destination_node, origin_node)
@@ -240,29 +242,30 @@ class Node:
 
     def multicast(self, msg, nodes:dict):
             """Multicast a message to selected nodes with an active session"""
+            tag = msg.tag
             for add, node in nodes.items():
                 connection = node['connection']
                 origin_node = connection.origin_node
                 destination_node = connection.destination_node
 
                 # Monitor the transaction propagation on Ethereum
-                if msg['id'] == 'transactions':
+                if tag == eth.TRANSACTIONS:
                     txs = {}
-                    for tx in msg['transactions']:
+                    for tx in msg.transactions:
                         txs.update({f'{tx.hash[:8]}': self.env.now})
                     self.env.data['tx_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
                         txs)
                 # Monitor the block propagation on Ethereum
-                if msg['id'] == 'new_blocks':
+                elif tag == eth.NEW_BLOCKS:
                     blocks = {}
-                    for block_hash in msg['new_blocks']:
+                    for block_hash in msg.new_blocks:
                         blocks.update({f'{block_hash[:8]}': self.env.now})
                     self.env.data['block_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
                         blocks)
                 
-                upload_transmission_delay = get_sent_delay(msg['size'], origin_node.address, destination_node.address)
+                upload_transmission_delay = get_sent_delay(msg.size, origin_node.address, destination_node.address)
                 # upload_transmission_delay = get_sent_delay(
-                #     self.env, msg['size'], origin_node.location, destination_node.location)
+                #     self.env, msg.size, origin_node.location, destination_node.location)
                 yield self.env.timeout(upload_transmission_delay)
                 envelope = Envelope(msg, time(self.env),
                                     destination_node, origin_node)
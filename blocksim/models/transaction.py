@@ -14,6 +14,7 @@ class Transaction:
     :param fee: a fee destinated to the node that will insert the transaction on the chain
     :param gen_time: stores the time at which the transaction was generated
     :param proc_time: records the time at which the transaction was processed
+    :param size: size of the transaction in kB. When it is not given, the messages use the size in the configuration
     """
 
     def __init__(self,
@@ -23,7 +24,8 @@ class Transaction:
                  signature,
                  fee,
                  gen_time,
-                 proc_time=0):
+                 proc_time=0,
+                 size=None):
         self.to = to
         self.sender = sender
         self.value = value
@@ -31,6 +33,7 @@ class Transaction:
         self.fee = fee
         self.gen_time = gen_time
         self.proc_time = proc_time
+        self.size = size
 
     @property
     def hash(self):
@@ -15,10 +15,15 @@ class TransactionQueue():
         key = f'{self._node.address}_number_of_transactions_queue'
         self._env.data[key] += 1
         self._transaction_queue.append(tx)
+        if self._env.tracer is not None:
+            self._env.tracer.mempool_added(self._node, tx)
 
     def get(self):
         # TODO: A delay to retrieve a transaction from the Queue
-        return self._transaction_queue.popleft()
+        tx = self._transaction_queue.popleft()
+        if self._env.tracer is not None:
+            self._env.tracer.mempool_removed(self._node, tx)
+        return tx
 
     def is_empty(self):
         return len(self._transaction_queue) == 0
@@ -39,7 +39,7 @@ class NodeFactory:
         nodes_list = {}
         node_props = peers_data["node_properties"]
         for k,v in node_props.items():
-            hashrate = v.compute_capacity *10**6
+            hashrate = v["compute_capacity"] *10**6
             new = BTCNode(self._world.env,
                               self._network,
                               v["location"],
@@ -0,0 +1,196 @@
+# Features of a run that change how it is executed (see `RunOption.UNSUPPORTED`)
+FEATURES = ('partitions', 'ensemble', 'checkpoints', 'replicas', 'fast_forward')
+
+
+class RunOption:
+    """An optional feature of a run of `main.run_model`. `UNSUPPORTED` are the features of
+    `FEATURES` it cannot be combined with, checked by `check_options`"""
+
+    UNSUPPORTED = frozenset()
+
+
+def check_options(options: list, features: set):
+    """Raises a ValueError if one of the `options` does not support one of the `features` of the run"""
+    for option in options:
+        unsupported = features & option.UNSUPPORTED
+        if unsupported:
+            raise ValueError(f'{type(option).__name__} does not support {", ".join(sorted(unsupported))}')
+
+
+class Partitions(RunOption):
+    """Splits the nodes in `count` partitions, by `by` ('location' or 'graph'), simulated in
+    parallel processes, with the same results as the sequential simulation for the same seed
+    (see `blocksim.parallel.run_partitioned`)"""
+
+    UNSUPPORTED = frozenset(('ensemble', 'checkpoints', 'replicas', 'fast_forward'))
+
+    def __init__(self, count: int, by: str = 'location'):
+        self.count = count
+        self.by = by
+
+
+class Checkpoints(RunOption):
+    """Takes a checkpoint every `interval` simulated seconds, from which the simulation is
+    resumed if it crashes, and writes the state of each checkpoint in `directory` for
+    inspection (see `blocksim.checkpoint.Checkpointer`)"""
+
+    UNSUPPORTED = frozenset(('ensemble', 'partitions'))
+
+    def __init__(self, interval: float, directory: str = None):
+        self.interval = interval
+        self.directory = directory
+
+
+class Replicas(RunOption):
+    """Runs the setup and the first `warmup` simulated seconds once, and then forks the
+    simulation into one run per seed (see `blocksim.checkpoint.fork_replicas`)"""
+
+    UNSUPPORTED = frozenset(('ensemble', 'partitions'))
+
+    def __init__(self, seeds: list, warmup: float):
+        self.seeds = seeds
+        self.warmup = warmup
+
+
+class Observer(RunOption):
+    """Observes a run of `main.run_model`, to add a feature to the run without a new argument.
+    The hooks are called in the order of the observers:
+
+    * `on_world`, when the simulation world is created
+    * `on_nodes`, when the nodes are created, before the network starts
+    * `on_report`, with the `ReportEngine` of the nodes and the metrics of the run, which it
+      can extend. It is called by the process that simulated the run (e.g. each replica)
+    * `on_end`, at the end of the run, in the calling process
+
+    The hooks get the parameters of the run (`run`): its `algo`, `num_nodes`, `run_id`,
+    `seed`, `start` time and `duration`.
+    """
+
+    def on_world(self, world, run: dict):
+        pass
+
+    def on_nodes(self, world, nodes: dict, run: dict):
+        pass
+
+    def on_report(self, world, reports, metrics: dict, run: dict):
+        pass
+
+    def on_end(self, world, nodes: dict, run: dict):
+        pass
+
+
+class OnWorld(Observer):
+    """Calls `callback` with the simulation world once it is created, e.g. to measure it"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def on_world(self, world, run: dict):
+        self.callback(world)
+
+
+class Instrumentation(Observer):
+    """Counts the messages sent and received by the nodes, with the events they schedule and
+    the wall time spent on them, and prints the table of the counters at the end of the run
+    (see `blocksim.instrumentation.MessageCounters`)"""
+
+    UNSUPPORTED = frozenset(('partitions', 'ensemble'))
+
+    def on_world(self, world, run: dict):
+        from blocksim.instrumentation import MessageCounters
+        world.env.instrumentation = MessageCounters(world.env)
+
+    def on_report(self, world, reports, metrics: dict, run: dict):
+        world.env.instrumentation.report()
+
+
+class Trace(Observer):
+    """Writes the messages, blocks, chain heads and transaction queues of the run to the binary
+    trace file `path`, to compute metrics after the run (see `blocksim.trace`)"""
+
+    UNSUPPORTED = frozenset(('partitions', 'ensemble', 'checkpoints', 'replicas'))
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def on_world(self, world, run: dict):
+        from blocksim.trace import EventTracer
+        world.env.tracer = EventTracer(self.path, world.env)
+
+    def on_end(self, world, nodes: dict, run: dict):
+        world.env.tracer.close(nodes, algo=run['algo'], run_id=run['run_id'], blockchain=world.blockchain,
+                               start=run['start'], duration=run['duration'])
+
+
+class Telemetry(Observer):
+    """Reports the progress of the simulation every `interval` simulated seconds, to the
+    standard error or as JSON lines to `output`, and stops the simulation when it runs for more
+    than `max_wall_time` seconds (see `blocksim.telemetry.TelemetryMonitor`)"""
+
+    UNSUPPORTED = frozenset(('partitions', 'ensemble'))
+
+    def __init__(self, interval: float, output: str = None, max_wall_time: float = None):
+        self.interval = interval
+        self.output = output
+        self.max_wall_time = max_wall_time
+
+    def on_nodes(self, world, nodes: dict, run: dict):
+        world.start_telemetry(self.interval, list(nodes.values()), self.output, max_wall_time=self.max_wall_time)
+
+
+class Convergence(Observer):
+    """Stops the simulation when the block propagation latency and finality estimates converge
+    (see `blocksim.convergence.ConvergenceController`, which gets the `parameters`). The metrics
+    then include the reason the simulation stopped (`stop_reason`) and the simulated time
+    (`simulated_time`)"""
+
+    UNSUPPORTED = frozenset(('partitions', 'ensemble'))
+
+    def __init__(self, **parameters):
+        self.parameters = parameters
+
+    def on_nodes(self, world, nodes: dict, run: dict):
+        from blocksim.convergence import ConvergenceController
+        controller = ConvergenceController(world, list(nodes.values()), **self.parameters)
+        world.env.convergence = controller
+        world.env.process(controller.run())
+
+    def on_report(self, world, reports, metrics: dict, run: dict):
+        metrics['stop_reason'] = world.stop_reason or 'end of the simulation'
+        metrics['simulated_time'] = run['duration'] if world.stop_reason is None else world.env.now - run['start']
+
+
+class BatchMeans(Observer):
+    """Analyses the run as one long run: the metrics include the batch-means confidence interval
+    of the block latency and finality time, with `batches` batches (`batch_means`, see
+    `ReportEngine.get_batch_means_report`)"""
+
+    UNSUPPORTED = frozenset(('ensemble',))
+
+    def __init__(self, batches: int = 20):
+        self.batches = batches
+
+    def on_report(self, world, reports, metrics: dict, run: dict):
+        metrics['batch_means'] = reports.get_batch_means_report(self.batches)
+
+
+class RecordResults(Observer):
+    """Adds the metrics of the run and the latency and finality time of each block to the SQLite
+    database of results `path`, with the `label` (see `blocksim.results_db.ResultsDB`)"""
+
+    UNSUPPORTED = frozenset(('ensemble',))
+
+    def __init__(self, path: str, label: str = None):
+        self.path = path
+        self.label = label
+
+    def on_report(self, world, reports, metrics: dict, run: dict):
+        from blocksim.results_db import ResultsDB, config_hash
+        db = ResultsDB(self.path)
+        try:
+            db.add_run(run['algo'], run['num_nodes'], metrics, run_id=run['run_id'], seed=run['seed'],
+                       config_hash=config_hash(world.env.config), label=self.label,
+                       blocks={'av_block_latency': reports.latencies,
+                               'av_finality_time': reports.finality_times})
+        finally:
+            db.close()
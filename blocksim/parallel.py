@@ -0,0 +1,326 @@
+import multiprocessing
+import queue
+import sys
+from math import inf
+from blocksim.models.block import Block
+from blocksim.models.network import Connection, Network
+from blocksim.models.node import Envelope
+from blocksim.models.ethereum import message as eth
+from blocksim.utils import get_latency_delay
+
+
+def partition_nodes(nodes: dict, neighbours: dict, partitions: int, by: str = 'location'):
+    """Splits the nodes into `partitions` of the same size. Returns the partition of each
+    node address.
+
+    With `by='location'` the nodes are ordered by location, so the nodes of a location are kept
+    together. With `by='graph'` they are ordered by a breadth first search over the topology,
+    so neighbours tend to be in the same partition and fewer messages cross partitions.
+
+    :param dict nodes: the nodes of the simulation, by node id
+    :param dict neighbours: the neighbour nodes of each node id
+    """
+    if by == 'location':
+        order = sorted(nodes, key=lambda node_id: (nodes[node_id].location, node_id))
+    elif by == 'graph':
+        order = _graph_order(nodes, neighbours)
+    else:
+        raise ValueError(f'Unknown partitioning: {by}')
+    return {nodes[node_id].address: i * partitions // len(order) for i, node_id in enumerate(order)}
+
+
+def _graph_order(nodes: dict, neighbours: dict):
+    ids = {node.address: node_id for node_id, node in nodes.items()}
+    order = []
+    visited = set()
+    for root in nodes:
+        if root in visited:
+            continue
+        visited.add(root)
+        i = len(order)
+        order.append(root)
+        while i < len(order):
+            for neighbour in neighbours.get(order[i], []):
+                neighbour_id = ids[neighbour.address]
+                if neighbour_id not in visited:
+                    visited.add(neighbour_id)
+                    order.append(neighbour_id)
+            i += 1
+    return order
+
+
+def get_lookahead(nodes: dict, neighbours: dict, partition_of: dict):
+    """The minimum latency of the links between partitions. A message sent at time `t` to
+    another partition is not received before `t + lookahead`"""
+    lookahead = inf
+    for node_id, node in nodes.items():
+        for neighbour in neighbours[node_id]:
+            if partition_of[node.address] != partition_of[neighbour.address]:
+                lookahead = min(lookahead, get_latency_delay(node.address, neighbour.address))
+    return lookahead
+
+
+class RemoteConnection(Connection):
+    """Connection to a node simulated by another process. The messages are handed to the
+    network, which sends them to the process of the destination"""
+
+    def __init__(self, network, origin_node, destination_node):
+        super().__init__(network.env, origin_node, destination_node)
+        self._network = network
+
+    def start_listening(self):
+        # The destination node listens in its own process (see `PartitionedNetwork.accept`)
+        pass
+
+    def put(self, envelope):
+        print(
+            f'{envelope.origin.address} at {envelope.timestamp}: Message (ID: {envelope.msg.id}) sent with {envelope.msg.size} MB with a destination: {envelope.destination.address}')
+        self._network.send_remote(envelope)
+
+
+class PartitionedNetwork(Network):
+    """Network of a partitioned simulation (see `run_partitioned`).
+
+    Each worker process simulates the nodes of one partition. All the nodes are created in every
+    process, but only the events of the local nodes are simulated: the heartbeat and the
+    transaction sources skip the nodes of other partitions, and the messages sent to them go
+    to the `outbox`, to be delivered by the process of the destination.
+
+    Until `partition` is set, all the nodes are local.
+    """
+
+    def __init__(self, env, name, random_state=None, miner_random_state=None):
+        super().__init__(env, name, random_state, miner_random_state)
+        self.partition = None
+        self.partition_of = {}
+        self.outbox = []
+        # The time each transaction was last included in a block built in this process, with
+        # the processing time set by that block
+        self.processed = {}
+        self._inbound = {}
+        self._sent = 0
+
+    def is_local(self, node):
+        return self.partition is None or self.partition_of[node.address] == self.partition
+
+    def create_connection(self, origin_node, destination_node):
+        if self.is_local(destination_node):
+            return super().create_connection(origin_node, destination_node)
+        return RemoteConnection(self, origin_node, destination_node)
+
+    def accept(self, origin_node, destination_node):
+        """Creates the connection used by `origin_node`, from another partition, to send
+        messages to the local `destination_node`. As in `Node.connect`, the destination
+        starts listening after the TCP handshake"""
+        connection = Connection(self.env, origin_node, destination_node)
+        self._inbound[(origin_node.address, destination_node.address)] = connection
+        key = f'{origin_node.address}_{destination_node.address}'
+        self.env.data['block_propagation'].setdefault(key, {})
+        self.env.data['tx_propagation'].setdefault(key, {})
+        self.env.process(self._connecting(connection))
+
+    def _connecting(self, connection):
+        latency = get_latency_delay(connection.origin_node.address, connection.destination_node.address)
+        yield self.env.timeout(3*latency)
+        connection.start_listening()
+
+    def send_remote(self, envelope):
+        """Adds a message to the outbox, with the time it is received by the destination"""
+        origin = envelope.origin.address
+        destination = envelope.destination.address
+        msg = envelope.msg
+        key = f'{origin}_{destination}'
+        # The destination needs the send time monitored by the origin to measure the propagation
+        monitor = None
+        if msg.tag == eth.NEW_BLOCKS:
+            sent = self.env.data['block_propagation'][key]
+            monitor = ('block_propagation', {h[:8]: sent[h[:8]] for h in msg.new_blocks if h[:8] in sent})
+        elif msg.tag == eth.TRANSACTIONS:
+            sent = self.env.data['tx_propagation'][key]
+            monitor = ('tx_propagation', {tx.hash[:8]: sent[tx.hash[:8]] for tx in msg.transactions if tx.hash[:8] in sent})
+        receive_time = self.env.now + get_latency_delay(origin, destination)
+        self.outbox.append(
+            (receive_time, self.env.now, origin, self._sent, destination, msg, envelope.timestamp, monitor))
+        self._sent += 1
+
+    def block_built(self, block):
+        if block.transactions is not None:
+            now = self.env.now
+            for tx in block.transactions:
+                self.processed[tx.hash] = (now, tx.proc_time)
+
+    def take_outbox(self):
+        """Empties the outbox. Returns the messages for each partition"""
+        messages = {}
+        for message in self.outbox:
+            messages.setdefault(self.partition_of[message[4]], []).append(message)
+        self.outbox = []
+        return messages
+
+    def deliver(self, messages: list):
+        """Schedules the reception of messages from other partitions. They are received in the
+        order of the receive time, the send time and the origin"""
+        for receive_time, _, origin, _, destination, msg, timestamp, monitor in sorted(messages, key=_message_order):
+            if monitor is not None:
+                name, sent = monitor
+                self.env.data[name][f'{origin}_{destination}'].update(sent)
+            connection = self._inbound[(origin, destination)]
+            envelope = Envelope(msg, timestamp, connection.destination_node, connection.origin_node)
+            arrival = self.env.timeout(receive_time - self.env.now, (connection, envelope))
+            arrival.callbacks.append(_put_envelope)
+
+
+def _message_order(message):
+    return message[:4]
+
+
+def _put_envelope(event):
+    connection, envelope = event.value
+    connection.store.put(envelope)
+
+
+def run_partitioned(world, network: PartitionedNetwork, nodes: dict, neighbours: dict, start,
+                    partitions: int, by: str = 'location'):
+    """Runs the simulation in `partitions` worker processes, with conservative synchronisation.
+
+    The nodes are split with `partition_nodes` and each process simulates one partition in its
+    own SimPy environment (forked from the current one). The processes run in windows of
+    `get_lookahead` simulated seconds: a message sent to another partition during a window is
+    received after the end of the window, so after each window the processes exchange the
+    messages sent to other partitions and continue, without ever receiving a message in the past.
+
+    The model must not have been connected yet. Each process connects its local nodes to
+    `neighbours` (the neighbour nodes of each node id) and then calls `start`, to start the
+    transaction sources. With the random values drawn from `blocksim.random_streams`, the
+    results are the same as the sequential simulation with the same seed.
+
+    After the run, the chains and the monitors of the processes are merged into the `world`
+    and the `nodes` of the current process, as if it had run the whole simulation. The
+    processing time of a transaction is set by the last block built with it by any node, so it
+    is taken from the process that built that block.
+    """
+    network.partition_of = partition_nodes(nodes, neighbours, partitions, by)
+    lookahead = get_lookahead(nodes, neighbours, network.partition_of)
+    print(f'Partitioned simulation: {partitions} partitions, lookahead of {lookahead} seconds')
+    context = multiprocessing.get_context('fork')
+    inboxes = [context.Queue() for _ in range(partitions)]
+    results = context.Queue()
+    workers = [
+        context.Process(
+            target=_run_partition,
+            args=(partition, world, network, nodes, neighbours, start, lookahead, inboxes, results))
+        for partition in range(partitions)]
+    sys.stdout.flush()
+    for worker in workers:
+        worker.start()
+    partition_results = {}
+    try:
+        while len(partition_results) < partitions:
+            try:
+                partition, result = results.get(timeout=1)
+                partition_results[partition] = result
+            except queue.Empty:
+                for worker in workers:
+                    if worker.exitcode not in (None, 0):
+                        raise RuntimeError(f'Partition worker failed with exit code {worker.exitcode}')
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+    _merge_results(world, network, nodes, neighbours, partition_results)
+
+
+def _run_partition(partition, world, network, nodes, neighbours, start, lookahead, inboxes, results):
+    env = world.env
+    network.partition = partition
+    for node_id, node in nodes.items():
+        if network.is_local(node):
+            node.connect(neighbours[node_id])
+        else:
+            for neighbour in neighbours[node_id]:
+                if neighbour.address != node.address and network.is_local(neighbour):
+                    network.accept(node, neighbour)
+    start()
+
+    others = [p for p in range(len(inboxes)) if p != partition]
+    end = world.end_time
+    now = env.now
+    # The batches are tagged with their window and sender: a partition can finish the window
+    # and send its next batch before this one has received the batches of the other partitions,
+    # so the batches of the next window are kept until it starts
+    early = {}
+    window = 0
+    while now < end:
+        now = min(now + lookahead, end)
+        env.run(until=now)
+        outbox = network.take_outbox()
+        for p in others:
+            inboxes[p].put((window, partition, outbox.get(p, [])))
+        batches = early.pop(window, {})
+        while len(batches) < len(others):
+            batch_window, sender, batch = inboxes[partition].get()
+            if batch_window == window:
+                batches[sender] = batch
+            else:
+                early.setdefault(batch_window, {})[sender] = batch
+        messages = []
+        for sender in others:
+            messages.extend(batches[sender])
+        network.deliver(messages)
+        window += 1
+
+    data = env.data
+    local_nodes = [node for node in nodes.values() if network.is_local(node)]
+    counters = {}
+    for node in local_nodes:
+        for key in (f'forks_{node.address}', f'{node.address}_number_of_transactions_queue'):
+            if key in data:
+                counters[key] = data[key]
+    sys.stdout.flush()
+    results.put((partition, {
+        'chains': {node.address: (node.chain.db.db, node.chain._head_hash) for node in local_nodes},
+        'counters': counters,
+        'created_transactions': data['created_transactions'],
+        'processed': network.processed,
+        'block_propagation': data['block_propagation'],
+        'tx_propagation': data['tx_propagation']
+    }))
+
+
+def _merge_results(world, network, nodes, neighbours, partition_results):
+    data = world.env.data
+    partition_of = network.partition_of
+    for node in nodes.values():
+        result = partition_results[partition_of[node.address]]
+        node.chain.db.db, node.chain._head_hash = result['chains'][node.address]
+    for result in partition_results.values():
+        data.update(result['counters'])
+    # The transaction sources run in every process
+    data['created_transactions'] = partition_results[0]['created_transactions']
+    # The monitors are rebuilt in the order of the sequential simulation (the order of the
+    # connections). The origin records the send times and the destination the propagation times
+    for name in ('block_propagation', 'tx_propagation'):
+        merged = {}
+        for node_id, node in nodes.items():
+            for neighbour in neighbours[node_id]:
+                if neighbour.address == node.address:
+                    continue
+                key = f'{node.address}_{neighbour.address}'
+                values = dict(partition_results[partition_of[node.address]][name].get(key, {}))
+                values.update(partition_results[partition_of[neighbour.address]][name].get(key, {}))
+                merged[key] = values
+        data[name] = merged
+    # The transactions of the chains are copies made by each process
+    processed = {}
+    for result in partition_results.values():
+        for tx_hash, (built, proc_time) in result['processed'].items():
+            if tx_hash not in processed or built > processed[tx_hash][0]:
+                processed[tx_hash] = (built, proc_time)
+    for node in nodes.values():
+        for value in node.chain.db.db.values():
+            if isinstance(value, Block) and value.transactions is not None:
+                for tx in value.transactions:
+                    if tx.hash in processed:
+                        tx.proc_time = processed[tx.hash][1]
@@ -0,0 +1,141 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import resource
+import time
+import tracemalloc
+
+# Number of allocators reported for each phase
+TOP_ALLOCATORS = 10
+# Number of functions of the cProfile report
+TOP_FUNCTIONS = 30
+
+
+class NoProfiler:
+    """Profiler of the runs that are not profiled. The phases are not measured"""
+
+    enabled = False
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        yield
+
+    def write_report(self, path: str):
+        pass
+
+
+class PhaseProfiler:
+    """Measures the phases of a run (see `main.run_model`): the input loading, world construction,
+    node creation, topology wiring, simulation, chain extraction and reporting.
+
+    For each phase it records the wall time, the CPU time of the process, the increase of the peak
+    RSS and, with `tracemalloc`, the peak of the memory traced during the phase and the lines
+    that allocated more memory. The phase `cprofile_phase` also runs under `cProfile`.
+
+    A phase can be entered more than once (e.g. the simulation of each replica); its measures
+    are added.
+
+    :param bool trace_allocations: trace the memory allocations with `tracemalloc`, which slows
+        down the run
+    :param str cprofile_phase: the name of the phase profiled with `cProfile`
+    """
+
+    enabled = True
+
+    def __init__(self, trace_allocations=True, cprofile_phase: str = None):
+        self.trace_allocations = trace_allocations
+        self.cprofile_phase = cprofile_phase
+        # Measures of each phase, in the order they are entered
+        self.phases = {}
+        self.profile = None
+        self._tracing = trace_allocations and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Measures the code run in the context as the phase `name`"""
+        measures = self.phases.setdefault(name, {
+            'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_delta_MB': 0.0, 'peak_traced_MB': 0.0,
+            'allocators': {}})
+        snapshot = None
+        if self.trace_allocations:
+            snapshot = _snapshot()
+            tracemalloc.reset_peak()
+        profile = None
+        if name == self.cprofile_phase:
+            profile = self.profile = self.profile or cProfile.Profile()
+        rss = _peak_rss_MB()
+        cpu = time.process_time()
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            measures['calls'] += 1
+            measures['wall_s'] += time.perf_counter() - start
+            measures['cpu_s'] += time.process_time() - cpu
+            measures['peak_rss_delta_MB'] += _peak_rss_MB() - rss
+            if snapshot is not None:
+                _, peak = tracemalloc.get_traced_memory()
+                measures['peak_traced_MB'] = max(measures['peak_traced_MB'], peak / 2**20)
+                allocators = measures['allocators']
+                for stat in _snapshot().compare_to(snapshot, 'lineno'):
+                    frame = stat.traceback[0]
+                    key = f'{frame.filename}:{frame.lineno}'
+                    allocators[key] = allocators.get(key, 0) + stat.size_diff
+
+    def format_report(self) -> str:
+        """The measures of the phases as text"""
+        lines = [f'{"phase":<12} {"calls":>6} {"wall s":>10} {"cpu s":>10} {"peak RSS +MB":>13} {"traced MB":>10}']
+        total = sum(measures['wall_s'] for measures in self.phases.values()) or 1
+        for name, measures in self.phases.items():
+            lines.append(
+                f'{name:<12} {measures["calls"]:>6} {measures["wall_s"]:>10.3f} {measures["cpu_s"]:>10.3f} '
+                f'{measures["peak_rss_delta_MB"]:>13.1f} {measures["peak_traced_MB"]:>10.1f}'
+                f'  {100 * measures["wall_s"] / total:>5.1f}%')
+        if self.trace_allocations:
+            for name, measures in self.phases.items():
+                lines.append('')
+                lines.append(f'Top allocators of the {name} phase (memory still allocated at the end of the phase):')
+                allocators = sorted(measures['allocators'].items(), key=lambda item: item[1], reverse=True)
+                for location, size in allocators[:TOP_ALLOCATORS]:
+                    if size > 0:
+                        lines.append(f'  {size / 1024:>12.1f} KiB  {location}')
+        if self.profile is not None:
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            lines.append('')
+            lines.append(f'cProfile of the {self.cprofile_phase} phase:')
+            lines.append(stream.getvalue())
+        return '\n'.join(lines)
+
+    def write_report(self, path: str):
+        """Writes the report to `path` and, when a phase runs under `cProfile`, its statistics to
+        the same path with the `.prof` extension (to be read with `pstats` or a viewer)"""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        report = self.format_report()
+        with open(path, 'w') as f:
+            f.write(report)
+        if self.profile is not None:
+            self.profile.dump_stats(f'{os.path.splitext(path)[0]}.prof')
+        print(report)
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<unknown>')))
+
+
+def _peak_rss_MB():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
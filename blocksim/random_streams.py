@@ -0,0 +1,51 @@
+import random
+import zlib
+import numpy as np
+
+
+class RandomStreams:
+    """Independent random number generators derived from one `seed`. Each stream is identified
+    by a name and optional integer keys, e.g. ``streams.generator('validation', node_id)``.
+
+    The values drawn from a stream do not depend on the draws from the other streams, so a
+    simulation with the same seed draws the same values even when its events are processed
+    in a different order (e.g. split across processes by `blocksim.parallel`).
+
+    :param int seed: the seed of all the streams
+    """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        # The generators returned, reseeded in place by `reseed`
+        self._generators = []
+        self._python_randoms = []
+
+    def _seed_sequence(self, name: str, keys: tuple):
+        return np.random.SeedSequence(self.seed, spawn_key=(zlib.crc32(name.encode()),) + tuple(keys))
+
+    def _python_seed(self, name: str, keys: tuple) -> int:
+        return int(self._seed_sequence(name, keys).generate_state(1, np.uint64)[0])
+
+    def generator(self, name: str, *keys):
+        """Returns the NumPy generator of a stream"""
+        generator = np.random.default_rng(self._seed_sequence(name, keys))
+        self._generators.append((name, keys, generator))
+        return generator
+
+    def python_random(self, name: str, *keys):
+        """Returns a `random.Random` instance for a stream, for the models using the
+        interface of the `random` module"""
+        instance = random.Random(self._python_seed(name, keys))
+        self._python_randoms.append((name, keys, instance))
+        return instance
+
+    def reseed(self, seed: int):
+        """Changes the seed of all the streams. The generators already returned are reseeded in
+        place, so the models holding them draw from the streams of the new `seed` (e.g. the
+        replicas of `blocksim.checkpoint.fork_replicas`)"""
+        self.seed = seed
+        for name, keys, generator in self._generators:
+            generator.bit_generator.state = np.random.default_rng(
+                self._seed_sequence(name, keys)).bit_generator.state
+        for name, keys, instance in self._python_randoms:
+            instance.seed(self._python_seed(name, keys))
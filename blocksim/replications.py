@@ -0,0 +1,151 @@
+import os
+from math import sqrt
+from blocksim.workers import warm_pool
+
+# Replication run by the worker processes of `SequentialReplications.run`
+_replicate = None
+
+
+class RunningStats:
+    """Running mean and variance of a metric (Welford's algorithm)"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else float('inf')
+
+    def half_width(self, confidence=0.95):
+        """Half-width of the confidence interval of the mean"""
+        if self.n < 2:
+            return float('inf')
+        from scipy.stats import t as student_t
+        return float(student_t.ppf((1 + confidence) / 2, self.n - 1) * sqrt(self.variance / self.n))
+
+
+class SequentialReplications:
+    """Runs replications of a simulation until the confidence intervals of the metrics are narrow
+    enough, instead of a fixed number of runs.
+
+    The replications run in waves of `wave_size` runs, in parallel processes. After each wave the
+    running mean and variance of each metric of `targets` is updated, and the runs stop when the
+    half-width of the confidence interval of every metric is below its target, after at least
+    `min_runs` runs, or when `max_runs` runs are done.
+
+    :param replicate: function that runs the replication `i` (from 0) and returns its metrics
+        (e.g. `run_model` with `run_id=i`)
+    :param dict targets: the maximum half-width of each metric, e.g.
+        ``{'av_block_latency': 0.02, 'av_finality_time': 0.05}``
+    :param bool relative: the targets are relative to the mean of the metric
+    :param float confidence: the confidence level of the intervals
+    :param int wave_size: runs of each wave. Defaults to the number of CPUs
+    """
+
+    def __init__(self, replicate, targets: dict, relative=True, confidence=0.95, min_runs=5, max_runs=100,
+                 wave_size=None):
+        self.replicate = replicate
+        self.targets = targets
+        self.relative = relative
+        self.confidence = confidence
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.wave_size = wave_size or os.cpu_count()
+        self.stats = {metric: RunningStats() for metric in targets}
+        self.results = []
+
+    def _run_wave(self, run_ids: list):
+        global _replicate
+        if len(run_ids) == 1 or not hasattr(os, 'fork'):
+            return [self.replicate(i) for i in run_ids]
+        # The workers are forked, so the replication does not need to be pickled
+        _replicate = self.replicate
+        try:
+            with warm_pool(len(run_ids), maxtasksperchild=1) as pool:
+                return pool.map(_run_replication, run_ids)
+        finally:
+            _replicate = None
+
+    def _half_width(self, metric: str):
+        stats = self.stats[metric]
+        half_width = stats.half_width(self.confidence)
+        if self.relative:
+            return half_width / abs(stats.mean) if stats.mean else float('inf')
+        return half_width
+
+    def converged(self) -> bool:
+        """If the confidence intervals of all the metrics are below their targets"""
+        return len(self.results) >= self.min_runs and all(
+            self._half_width(metric) <= target for metric, target in self.targets.items())
+
+    def run(self) -> dict:
+        """Runs the replications. Returns the summary (see `summary`)"""
+        while len(self.results) < self.max_runs and not self.converged():
+            start = len(self.results)
+            run_ids = list(range(start, min(start + self.wave_size, self.max_runs)))
+            # The results are added in the order of the runs, so they do not depend on the waves
+            for metrics in self._run_wave(run_ids):
+                self.results.append(metrics)
+                for metric, stats in self.stats.items():
+                    stats.add(float(metrics[metric]))
+            print(f'Replications: {len(self.results)} runs, ' + ', '.join(
+                f'{metric} {stats.mean:.4g} +- {self._half_width(metric):.4g}'
+                for metric, stats in self.stats.items()))
+        return self.summary()
+
+    def summary(self) -> dict:
+        """The number of runs, if the targets were met, and the mean and the half-width of the
+        confidence interval of each metric"""
+        return {
+            'runs': len(self.results),
+            'converged': self.converged(),
+            'metrics': {
+                metric: {
+                    'mean': stats.mean,
+                    'half_width': stats.half_width(self.confidence),
+                    'relative_half_width': (stats.half_width(self.confidence) / abs(stats.mean)
+                                            if stats.mean else float('inf')),
+                    'target': self.targets[metric],
+                    'met': self._half_width(metric) <= self.targets[metric]
+                } for metric, stats in self.stats.items()}
+        }
+
+
+def _run_replication(i: int):
+    return _replicate(i)
+
+
+def paired_replications(run, algos: list, baseline: str, metrics: list):
+    """Returns the replication function (for `SequentialReplications`) of a paired comparison
+    of algorithms with common random numbers.
+
+    The replication `i` runs every algorithm with `run(algo, i)`, which must use the same random
+    inputs for the same `i` (e.g. `run_model(run_id=i, algo=algo, seed=i)`). Its metrics are the
+    metrics of each algorithm, as ``'{algo}:{metric}'``, and the difference of each algorithm to
+    the `baseline`, as ``'{algo}-{baseline}:{metric}'``. As the runs of a replication share their
+    random inputs, the variance of the differences is lower than with independent runs, and
+    fewer replications are needed for the same precision.
+
+    :param run: function that runs an algorithm and returns its metrics
+    :param list algos: the algorithms compared
+    :param str baseline: the algorithm the others are compared to
+    :param list metrics: the metrics compared
+    """
+    def replicate(i: int):
+        results = {algo: run(algo, i) for algo in algos}
+        paired = {}
+        for algo, values in results.items():
+            for metric in metrics:
+                paired[f'{algo}:{metric}'] = values[metric]
+                if algo != baseline:
+                    paired[f'{algo}-{baseline}:{metric}'] = values[metric] - results[baseline][metric]
+        return paired
+    return replicate
@@ -2,6 +2,7 @@ import json
 from math import ceil
 
 import numpy
+from blocksim.batch_means import batch_means
 from blocksim.models import node as Node
 from csv import writer
 
@@ -34,8 +35,8 @@ class ReportEngine:
         self._get_block_number_and_hash(self.blocks)
         self._get_blocks_prop_times(self.nodes, self.block_prop)
         self._get_block_receive_times(self.nodes, self.block_prop)
-        self._get_network_wide_latency()
-        self._get_average_finality_time()
+        self.latencies = self._get_network_wide_latency()
+        self.finality_times = self._get_average_finality_time()
 
     def _get_block_number_and_hash(self, blocks):
         i = 0
@@ -61,17 +62,17 @@ class ReportEngine:
                         if blocks_and_times.get(k) is None:
                             if type(v) is tuple:
                                 for b in v:
-                                    is_float_val = type(b) is numpy.float64
+                                    is_float_val = isinstance(b, float)
                                     if is_float_val:
                                         blocks_and_times[k] = v[1] + v[0]
                                     else:
                                         c = b
                                         a = c[0]
-                                        is_float_val = type(a) is numpy.float64
+                                        is_float_val = isinstance(a, float)
                                         while is_float_val is False:
                                             c = a
                                             a = a[0]
-                                            is_float_val = type(a) is numpy.float64
+                                            is_float_val = isinstance(a, float)
                                         blocks_and_times[k] = c[1] + c[0]
                                         break
             block_receive_time_all_node[address] = blocks_and_times
@@ -96,17 +97,17 @@ class ReportEngine:
                         if blocks_and_times.get(k) is None:
                             if type(v) is tuple:
                                 for b in v:
-                                    is_float_val = type(b) is numpy.float64
+                                    is_float_val = isinstance(b, float)
                                     if is_float_val:
                                         blocks_and_times[k] = v[1]
                                     else:
                                         c = b
                                         a = c[0]
-                                        is_float_val = type(a) is numpy.float64
+                                        is_float_val = isinstance(a, float)
                                         while is_float_val is False:
                                             c = a
                                             a = a[0]
-                                            is_float_val = type(a) is numpy.float64
+                                            is_float_val = isinstance(a, float)
                                         blocks_and_times[k] = c[1]
                                         break
 
@@ -159,6 +160,22 @@ class ReportEngine:
             }
         return data
 
+    def get_block_report(self):
+        block_metrics = {}
+        block_metrics["av_block_latency"] = numpy.average(list(self.latencies.values()))
+        block_metrics["av_finality_time"] = numpy.average(list(self.finality_times.values()))
+        return block_metrics
+
+    def get_batch_means_report(self, batches=20, confidence=0.95):
+        """Batch-means confidence intervals of the block latency and the finality time of one
+        long run, from their series in the order of the blocks (see `blocksim.batch_means`)"""
+        return {
+            "av_block_latency": batch_means(
+                [self.latencies[num] for num in sorted(self.latencies)], batches, confidence),
+            "av_finality_time": batch_means(
+                [self.finality_times[num] for num in sorted(self.finality_times)], batches, confidence)
+        }
+
     def get_txn_report(self, sim_duration:float):
         av_txn_latency = self._get_average_txn_proc_time()
         txn_throughput = self.get_transaction_throughput(sim_duration)
@@ -182,6 +199,7 @@ class ReportEngine:
 
         # with open(f"reports/txn.json", 'w') as f:
         #     f.write(json.dumps(tx_metrics))
+        return tx_metrics
 
     def _get_average_txn_proc_time(self):
         
@@ -0,0 +1,343 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import warnings
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    algo TEXT,
+    num_nodes INTEGER,
+    run_id INTEGER,
+    seed INTEGER,
+    config_hash TEXT,
+    label TEXT,
+    source TEXT UNIQUE,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS runs_algo_size ON runs (algo, num_nodes);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (config_hash);
+CREATE INDEX IF NOT EXISTS runs_label ON runs (label);
+CREATE TABLE IF NOT EXISTS summaries (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (metric, run)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blocks (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    metric TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (run, metric, number)
+) WITHOUT ROWID;
+"""
+# Columns of the runs that can group and filter the queries
+RUN_COLUMNS = ('algo', 'num_nodes', 'run_id', 'seed', 'config_hash', 'label')
+# Metrics of the single-column CSV files written by `ReportEngine`
+CSV_METRICS = {
+    'latencies': 'av_block_latency',
+    'finality': 'av_finality_time',
+    'av_txn_latency': 'av_txn_latency',
+    'txn_throughput': 'txn_throughput',
+    'txn_proc_ratio': 'txn_proc_ratio'
+}
+# Durations above this value are absolute unix times (after September 2001) left in the reports
+# instead of the difference to the creation of the block, and are not imported
+TIMESTAMP_THRESHOLD = 1e9
+# Per-block series of the runs, as written by the notebooks: {run}_{size}_{algo}[_{variant}]_{series}.csv
+# or {size}_{algo}_{run}_{series}.csv, with the block number and the value of each block
+_DETAIL_FILE = re.compile(r'^(?P<name>.+)_(?P<series>latencies|finality)\.csv$')
+
+
+def config_hash(config: dict) -> str:
+    """The hash of a configuration, to group the runs with the same configuration"""
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def normalise_algo(algo: str) -> str:
+    """The name of an algorithm, as the report folders use different cases (e.g. `MST`, `mst`,
+    `BasePSO`, `base_pso`)"""
+    return algo.lower().replace('_', '')
+
+
+class ResultsDB:
+    """Embedded SQLite database of the results of the runs.
+
+    Each run (`runs`) has its algorithm, number of nodes, run id, seed, configuration hash, a
+    free `label` (e.g. the experiment) and a unique `source`, so the same results are not added
+    twice. Its metrics are in `summaries` and, optionally, the value of each block (e.g. its
+    latency) in `blocks`. The queries select the values with SQL, using the indexes, and
+    aggregate them with NumPy.
+
+    :param str path: the database file, created if it does not exist
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add_run(self, algo: str, num_nodes: int, metrics: dict, run_id: int = None, seed: int = None,
+                config_hash: str = None, label: str = None, source: str = None, blocks: dict = None):
+        """Adds the results of a run. The metrics that are not numbers are ignored.
+
+        :param dict metrics: the metrics of the run, e.g. the result of `main.run_model`
+        :param dict blocks: the values of each block for some metrics, ``{metric: {number: value}}``
+        :param str source: where the results come from. A run with the same source is not added again
+        :return: the id of the run, or None if it was already added
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT OR IGNORE INTO runs (algo, num_nodes, run_id, seed, config_hash, label, source, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (normalise_algo(algo), num_nodes, run_id, seed, config_hash, label, source, time.time()))
+            if cursor.rowcount == 0:
+                return None
+            run = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO summaries (run, metric, value) VALUES (?, ?, ?)',
+                [(run, metric, _number(value)) for metric, value in metrics.items() if _is_number(value)])
+            for metric, values in (blocks or {}).items():
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO blocks (run, metric, number, value) VALUES (?, ?, ?, ?)',
+                    [(run, metric, int(number), _number(value)) for number, value in values.items()])
+        return run
+
+    def _select(self, table: str, metric: str, by: tuple, filters: dict):
+        for column in tuple(by) + tuple(filters):
+            if column not in RUN_COLUMNS:
+                raise ValueError(f'Unknown column of the runs: {column}')
+        conditions = ['t.metric = ?', 't.value IS NOT NULL']
+        parameters = [metric]
+        for column, value in filters.items():
+            if column == 'algo':
+                value = [normalise_algo(algo) for algo in value] if isinstance(value, (list, tuple, set)) \
+                    else normalise_algo(value)
+            if isinstance(value, (list, tuple, set)):
+                conditions.append(f'r.{column} IN ({", ".join("?" * len(value))})')
+                parameters.extend(value)
+            else:
+                conditions.append(f'r.{column} = ?')
+                parameters.append(value)
+        columns = ', '.join(f'r.{column}' for column in by)
+        query = (f'SELECT {columns + ", " if by else ""}t.value FROM {table} t JOIN runs r ON r.id = t.run '
+                 f'WHERE {" AND ".join(conditions)}{" ORDER BY " + columns if by else ""}')
+        return self.connection.execute(query, parameters).fetchall()
+
+    def values(self, metric: str, detail=False, **filters):
+        """The values of a metric of the runs matching the `filters` (columns of the runs, with a
+        value or a list of values, and the algorithms in any case, see `normalise_algo`), as a
+        NumPy array. With `detail`, the values of each block"""
+        rows = self._select('blocks' if detail else 'summaries', metric, (), filters)
+        return np.fromiter((row[0] for row in rows), dtype=float, count=len(rows))
+
+    def aggregate(self, metric: str, by=('algo', 'num_nodes'), quantiles=(0.05, 0.5, 0.95), bootstrap=1000,
+                  confidence=0.95, detail=False, seed=0, **filters) -> list:
+        """The mean, standard deviation, quantiles and bootstrap confidence interval of the mean
+        of a metric, for each group of runs with the same values of the columns `by`.
+
+        The values of each group are resampled `bootstrap` times at once, as a NumPy matrix,
+        and the interval is the percentile interval of the means of the samples.
+
+        :param str metric: the metric (of the summaries or, with `detail`, of the blocks)
+        :param tuple by: the columns of the runs that define the groups
+        :param filters: the runs included (see `values`)
+        :return: a list with a dictionary for each group
+        """
+        by = tuple(by)
+        rows = self._select('blocks' if detail else 'summaries', metric, by, filters)
+        if not rows:
+            return []
+        values = np.fromiter((row[-1] for row in rows), dtype=float, count=len(rows))
+        keys = [row[:-1] for row in rows]
+        # The rows are sorted by group, so each group is a slice
+        starts = [0] + [i for i in range(1, len(keys)) if keys[i] != keys[i - 1]] + [len(keys)]
+        random_state = np.random.default_rng(seed)
+        tail = 100 * (1 - confidence) / 2
+        groups = []
+        for start, end in zip(starts, starts[1:]):
+            group = values[start:end]
+            n = len(group)
+            result = dict(zip(by, keys[start]))
+            result.update({
+                'metric': metric,
+                'n': n,
+                'mean': float(group.mean()),
+                'std': float(group.std(ddof=1)) if n > 1 else float('nan')
+            })
+            for q, value in zip(quantiles, np.quantile(group, quantiles)):
+                result[f'q{q:g}'] = float(value)
+            if bootstrap and n > 1:
+                means = group[random_state.integers(0, n, (bootstrap, n))].mean(axis=1)
+                low, high = np.percentile(means, (tail, 100 - tail))
+                result.update({'ci_low': float(low), 'ci_high': float(high)})
+            else:
+                result.update({'ci_low': float('nan'), 'ci_high': float('nan')})
+            groups.append(result)
+        return groups
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+
+
+def _number(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def _read_column(path: str):
+    with open(path) as f:
+        return [float(row[-1]) for row in csv.reader(f) if row]
+
+
+def _read_series(path: str):
+    """The value of each block, without the values that are absolute times, and the number of
+    values skipped"""
+    with open(path) as f:
+        series = {int(row[0]): float(row[1]) for row in csv.reader(f) if len(row) > 1}
+    timestamps = [number for number, value in series.items() if value > TIMESTAMP_THRESHOLD]
+    if timestamps:
+        warnings.warn(f'{path}: {len(timestamps)} values are absolute times and are not imported '
+                      f'(blocks {timestamps[:5]}{"..." if len(timestamps) > 5 else ""})')
+        for number in timestamps:
+            del series[number]
+    return series, len(timestamps)
+
+
+def _skip_timestamps(metrics: dict, source: str):
+    """The metrics without the values that are absolute times, and the number of values skipped"""
+    timestamps = [metric for metric, value in metrics.items() if _is_number(value) and value > TIMESTAMP_THRESHOLD]
+    if timestamps:
+        warnings.warn(f'{source}: {", ".join(timestamps)} are absolute times and are not imported')
+    return {metric: value for metric, value in metrics.items() if metric not in timestamps}, len(timestamps)
+
+
+def _parse_detail_name(name: str):
+    """The run id, number of nodes, algorithm and variant of a per-run report file name"""
+    parts = name.split('_')
+    if len(parts) >= 3 and parts[0].isdigit() and parts[1].isdigit():
+        # {run}_{size}_{algo}[_{variant}]
+        return int(parts[0]), int(parts[1]), parts[2], '_'.join(parts[3:]) or None
+    if len(parts) == 3 and parts[0].isdigit() and parts[2].isdigit():
+        # {size}_{algo}_{run}
+        return int(parts[2]), int(parts[0]), parts[1], None
+    return None
+
+
+def import_reports(db: ResultsDB, root: str) -> tuple:
+    """Imports the results of the report folders under `root` (e.g. `reports`, `1st_reports`):
+
+    * the per-run files ``{run}_{size}_{algo}[_{variant}]_{latencies|finality}.csv`` or
+      ``{size}_{algo}_{run}_...``, with the value of each block, and their ``_txn.json`` summary
+    * the folders ``{size}/{algo}/`` with the single-column CSV files of `ReportEngine` (e.g.
+      ``av_txn_latency.csv``), with one row per run
+
+    The label of the runs is their folder (and variant). The runs already imported are skipped.
+    The values that are absolute times instead of durations (see `TIMESTAMP_THRESHOLD`) are not
+    imported, with a warning.
+    Returns the number of runs added and the number of values skipped.
+    """
+    added = 0
+    skipped = 0
+    for directory, _, files in sorted(os.walk(root)):
+        relative = os.path.relpath(directory, os.path.dirname(os.path.abspath(root)))
+        runs = {}
+        for file in sorted(files):
+            match = _DETAIL_FILE.match(file)
+            parsed = match and _parse_detail_name(match.group('name'))
+            if parsed:
+                runs.setdefault((match.group('name'),) + parsed, {})[match.group('series')] = os.path.join(directory, file)
+        for (name, run_id, num_nodes, algo, variant), series in runs.items():
+            # The values of the blocks are stored under the metric of their average
+            blocks = {}
+            for kind, path in series.items():
+                blocks[CSV_METRICS[kind]], count = _read_series(path)
+                skipped += count
+            metrics = {metric: float(np.mean(list(values.values()))) if values else float('nan')
+                       for metric, values in blocks.items()}
+            txn_path = os.path.join(directory, f'{name}_txn.json')
+            if os.path.exists(txn_path):
+                with open(txn_path) as f:
+                    txn_metrics, count = _skip_timestamps(json.load(f), txn_path)
+                metrics.update(txn_metrics)
+                skipped += count
+            label = relative if variant is None else f'{relative}:{variant}'
+            if db.add_run(algo, num_nodes, metrics, run_id=run_id, label=label,
+                          source=os.path.join(relative, name), blocks=blocks) is not None:
+                added += 1
+        columns = {CSV_METRICS[file[:-4]]: os.path.join(directory, file)
+                   for file in files if file.endswith('.csv') and file[:-4] in CSV_METRICS}
+        size = os.path.basename(os.path.dirname(directory))
+        if columns and size.isdigit():
+            algo = os.path.basename(directory)
+            values = {metric: _read_column(path) for metric, path in columns.items()}
+            for run_id in range(max(len(column) for column in values.values())):
+                metrics, count = _skip_timestamps(
+                    {metric: column[run_id] for metric, column in values.items() if run_id < len(column)},
+                    f'{directory} (run {run_id})')
+                skipped += count
+                if db.add_run(algo, int(size), metrics, run_id=run_id, label=relative,
+                              source=f'{relative}#{run_id}') is not None:
+                    added += 1
+    return added, skipped
+
+
+def _format_groups(groups: list, by: tuple) -> str:
+    if not groups:
+        return 'No values'
+    statistics = [key for key in groups[0] if key not in by and key != 'metric']
+    lines = [' '.join(f'{column:>14}' for column in by + tuple(statistics))]
+    for group in groups:
+        lines.append(' '.join(
+            f'{group[column]:>14.6g}' if isinstance(group[column], float) else f'{str(group[column]):>14}'
+            for column in by + tuple(statistics)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Database of the results of the runs')
+    commands = parser.add_subparsers(dest='command', required=True)
+    importer = commands.add_parser('import', help='imports report folders')
+    importer.add_argument('database')
+    importer.add_argument('folders', nargs='+')
+    query = commands.add_parser('query', help='aggregates a metric by groups of runs')
+    query.add_argument('database')
+    query.add_argument('metric')
+    query.add_argument('--by', nargs='*', default=['algo', 'num_nodes'], choices=RUN_COLUMNS)
+    query.add_argument('--where', nargs='*', default=[], metavar='COLUMN=VALUE')
+    query.add_argument('--detail', action='store_true', help='aggregate the values of the blocks')
+    query.add_argument('--bootstrap', type=int, default=1000, help='bootstrap samples of the interval')
+    args = parser.parse_args(argv)
+    db = ResultsDB(args.database)
+    try:
+        if args.command == 'import':
+            for folder in args.folders:
+                added, skipped = import_reports(db, folder)
+                print(f'{folder}: {added} runs added, {skipped} values with absolute times skipped')
+            return 0
+        filters = {}
+        for condition in args.where:
+            column, value = condition.split('=', 1)
+            filters[column] = int(value) if value.lstrip('-').isdigit() else value
+        start = time.perf_counter()
+        groups = db.aggregate(args.metric, tuple(args.by), bootstrap=args.bootstrap, detail=args.detail, **filters)
+        print(_format_groups(groups, tuple(args.by)))
+        print(f'{len(groups)} groups in {1000 * (time.perf_counter() - start):.1f} ms')
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import numpy as np
+from blocksim.links import CoordinateLinks
+from blocksim.utils import get_average_number_of_neighbours
+
+TOPOLOGIES = ('random_regular', 'small_world', 'mst')
+# Number of origin nodes of the pairwise links written at once
+PAIRS_CHUNK_SIZE = 256
+# Above this size the pairwise JSON files are not written by default
+MAX_JSON_LINKS_NODES = 2000
+
+
+def generate_nodes(num: int, locations: int, random_state, compute_capacity=38.0, miners=1.0):
+    """Generates the node properties of a scenario, in the format of
+    `{num}/{run_id}_node_properties.json`. The nodes are spread over the `locations` and
+    numbered by location, with the address `loc<location>_<number in the location>`. The block
+    probability of the miners of a location adds up to one.
+
+    Returns the node properties and the location of each node.
+
+    :param int num: the number of nodes
+    :param int locations: the number of locations
+    :param random_state: NumPy generator
+    :param float compute_capacity: the compute capacity of each miner
+    :param float miners: the fraction of nodes which are miners
+    """
+    weights = random_state.dirichlet(np.ones(locations) * 2)
+    node_locations = np.sort(random_state.choice(locations, num, p=weights))
+    is_mining = random_state.random(num) < miners
+    block_probabilities = random_state.random(num) * is_mining
+    node_properties = {}
+    counts = [0] * locations
+    for location in range(locations):
+        in_location = node_locations == location
+        total = block_probabilities[in_location].sum()
+        if total > 0:
+            block_probabilities[in_location] /= total
+    for i, location in enumerate(node_locations.tolist()):
+        node_properties[str(i)] = {
+            'node_id': f'loc{location}_{counts[location]}',
+            'is_mining': bool(is_mining[i]),
+            'block_probability': float(block_probabilities[i]),
+            'compute_capacity': compute_capacity if is_mining[i] else 0.0,
+            'location': f'loc{location}'
+        }
+        counts[location] += 1
+    return node_properties, node_locations
+
+
+def generate_links(node_properties: dict, node_locations, random_state, latency_scale=0.2, bandwidth=50.0,
+                   dimensions=2):
+    """Generates the compact link model of a scenario (see `links.CoordinateLinks`). The
+    locations are placed at random in a square of `latency_scale` seconds and the nodes
+    around their location. The access bandwidth of the nodes follows a log-normal
+    distribution with median `bandwidth` Mbps.
+
+    :param dict node_properties: the nodes of the scenario
+    :param node_locations: the location of each node
+    :param random_state: NumPy generator
+    :param float latency_scale: the size of the coordinates space (seconds)
+    :param float bandwidth: the median access bandwidth (Mbps)
+    :param int dimensions: the number of dimensions of the coordinates
+    """
+    num = len(node_locations)
+    centres = random_state.uniform(0, latency_scale, (node_locations.max() + 1, dimensions))
+    coordinates = centres[node_locations] + random_state.normal(0, latency_scale / 50, (num, dimensions))
+    heights = random_state.uniform(0.001, 0.01, num)
+    bandwidths = np.exp(random_state.normal(np.log(bandwidth), 0.5, num))
+    addresses = [node_properties[str(i)]['node_id'] for i in range(num)]
+    return CoordinateLinks(addresses, bandwidths, coordinates, heights)
+
+
+def _solution(neighbours: list) -> dict:
+    return {str(i): sorted(int(j) for j in node_neighbours) for i, node_neighbours in enumerate(neighbours)}
+
+
+def random_regular_topology(num: int, degree: int, random_state) -> dict:
+    """Random `degree`-regular graph, by pairing `degree` stubs of each node at random. The
+    self links and repeated links are removed by swapping the ends of random links."""
+    if num * degree % 2:
+        raise ValueError('A regular graph needs an even number of links ends')
+    stubs = random_state.permutation(np.repeat(np.arange(num), degree))
+    links = stubs.reshape(-1, 2)
+    for _ in range(100 * len(links)):
+        keys = np.minimum(links[:, 0], links[:, 1]) * num + np.maximum(links[:, 0], links[:, 1])
+        _, first = np.unique(keys, return_index=True)
+        invalid = np.ones(len(links), dtype=bool)
+        invalid[first] = False
+        invalid |= links[:, 0] == links[:, 1]
+        invalid = np.flatnonzero(invalid)
+        if len(invalid) == 0:
+            break
+        # Swap an end of each invalid link with a random link
+        others = random_state.integers(0, len(links), len(invalid))
+        for a, b in zip(invalid.tolist(), others.tolist()):
+            links[a, 1], links[b, 1] = links[b, 1], links[a, 1]
+    else:
+        raise RuntimeError('Could not build a simple regular graph')
+    neighbours = [[] for _ in range(num)]
+    for a, b in links.tolist():
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+    return _solution(neighbours)
+
+
+def small_world_topology(num: int, degree: int, random_state, rewire=0.1) -> dict:
+    """Watts-Strogatz small world graph: the nodes, in the order of their numbers (grouped by
+    location), are linked to the `degree / 2` next nodes in a ring, and each link is rewired
+    to a random node with probability `rewire`"""
+    half = max(degree // 2, 1)
+    neighbours = [set() for _ in range(num)]
+    for offset in range(1, half + 1):
+        for a in range(num):
+            b = (a + offset) % num
+            if random_state.random() < rewire:
+                b = int(random_state.integers(0, num))
+                while b == a or b in neighbours[a]:
+                    b = int(random_state.integers(0, num))
+            if b != a:
+                neighbours[a].add(b)
+                neighbours[b].add(a)
+    return _solution(neighbours)
+
+
+def mst_topology(links, degree: int) -> dict:
+    """Minimum spanning tree over the link latencies, computed with Prim's algorithm on the
+    complete graph with O(N) memory. Each node is also linked to its nearest nodes until it
+    has `degree` neighbours"""
+    num = links.n
+    nodes = np.arange(num)
+    neighbours = [set() for _ in range(num)]
+    # The nodes out of the tree are kept at the start of the arrays, with their distance
+    # to the tree and their closest node in the tree
+    outside = nodes.copy()
+    distances = np.full(num, np.inf)
+    parents = np.full(num, -1)
+    distances[0] = 0.0
+    for remaining in range(num, 0, -1):
+        k = int(np.argmin(distances[:remaining]))
+        node = int(outside[k])
+        parent = int(parents[k])
+        if parent >= 0:
+            neighbours[node].add(parent)
+            neighbours[parent].add(node)
+        last = remaining - 1
+        outside[k], distances[k], parents[k] = outside[last], distances[last], parents[last]
+        if last == 0:
+            break
+        latencies = links.latencies[np.full(last, node), outside[:last]]
+        closer = latencies < distances[:last]
+        distances[:last][closer] = latencies[closer]
+        parents[:last][closer] = node
+    for start in range(0, num, PAIRS_CHUNK_SIZE):
+        origins = nodes[start:start + PAIRS_CHUNK_SIZE]
+        latencies = links.latencies[origins[:, None], nodes[None, :]]
+        latencies[np.arange(len(origins)), origins] = np.inf
+        nearest = np.argsort(latencies, axis=1)[:, :degree]
+        for node, candidates in zip(origins.tolist(), nearest.tolist()):
+            for candidate in candidates:
+                if len(neighbours[node]) >= degree:
+                    break
+                neighbours[node].add(candidate)
+                neighbours[candidate].add(node)
+    return _solution(neighbours)
+
+
+def write_pairs_json(path: str, links, name: str):
+    """Writes the `latencies` or `throughputs` of all the links, in the format of
+    `{num}/{run_id}_latencies.json`, without building the dictionary in memory. Each pair is
+    written in one direction, as the simulation uses it in both"""
+    num = links.n
+    values = getattr(links, name)
+    addresses = links.addresses
+    first = True
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('{')
+        for start in range(0, num - 1, PAIRS_CHUNK_SIZE):
+            for origin in range(start, min(start + PAIRS_CHUNK_SIZE, num - 1)):
+                destinations = np.arange(origin + 1, num)
+                row = values[np.full(len(destinations), origin), destinations].tolist()
+                origin_address = addresses[origin]
+                items = ', '.join(
+                    f'"{origin_address}_{addresses[d]}": {v!r}' for d, v in zip(destinations.tolist(), row))
+                f.write(items if first else ', ' + items)
+                first = False
+        f.write('}')
+    os.replace(tmp_path, path)
+
+
+def _write_json(path: str, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def generate_scenario(num: int, run_id=0, folder_path='blocksim/out/', seed=0, locations=5, degree=None,
+                      topologies=TOPOLOGIES, json_links=None, **kwargs):
+    """Generates a scenario with the input layout read by `utils.initialize_node_values`:
+
+    * `{num}/{run_id}_node_properties.json` and the locations in `loc_names.json`
+    * `{num}/{run_id}_coordinates.npz`: the compact link model (`coordinate_links`)
+    * with `json_links`, the pairwise `{num}/{run_id}_latencies.json` and
+      `{num}/{run_id}_throughputs.json`, and their link matrices (`mmap_links`). By default
+      only for networks up to `MAX_JSON_LINKS_NODES` nodes
+    * `{num}/{run_id}_<topology>_solution.json` for each topology: `random_regular`,
+      `small_world` and `mst`
+
+    The scenario only depends on the `seed`. Returns the paths of the files written.
+
+    :param int degree: the number of neighbours of each node. Defaults to the one of the
+        optimisers (`utils.get_average_number_of_neighbours`)
+    :param kwargs: parameters of `generate_nodes` and `generate_links`
+    """
+    random_state = np.random.default_rng(seed)
+    degree = get_average_number_of_neighbours(num) if degree is None else degree
+    json_links = num <= MAX_JSON_LINKS_NODES if json_links is None else json_links
+    folder = os.path.join(folder_path, str(num))
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+
+    node_kwargs = {k: kwargs[k] for k in ('compute_capacity', 'miners') if k in kwargs}
+    link_kwargs = {k: kwargs[k] for k in ('latency_scale', 'bandwidth', 'dimensions') if k in kwargs}
+    node_properties, node_locations = generate_nodes(num, locations, random_state, **node_kwargs)
+    links = generate_links(node_properties, node_locations, random_state, **link_kwargs)
+
+    loc_names_path = os.path.join(folder_path, 'loc_names.json')
+    loc_names = []
+    if os.path.exists(loc_names_path):
+        with open(loc_names_path) as f:
+            loc_names = json.load(f)
+    if len(loc_names) < locations:
+        _write_json(loc_names_path, loc_names + [f'loc{i}' for i in range(len(loc_names), locations)])
+        paths.append(loc_names_path)
+
+    path = os.path.join(folder, f'{run_id}_node_properties.json')
+    _write_json(path, node_properties)
+    paths.append(path)
+    path = os.path.join(folder, f'{run_id}_coordinates.npz')
+    links.save(path)
+    paths.append(path)
+    if json_links:
+        for name in ('latencies', 'throughputs'):
+            path = os.path.join(folder, f'{run_id}_{name}.json')
+            write_pairs_json(path, links, name)
+            paths.append(path)
+        # Saved after the JSON files, so `LinkMatrices.cached` does not rebuild them
+        path = os.path.join(folder, f'{run_id}_links')
+        links.to_matrices().save(path)
+        paths.append(path)
+
+    builders = {
+        'random_regular': lambda: random_regular_topology(num, degree, random_state),
+        'small_world': lambda: small_world_topology(num, degree, random_state),
+        'mst': lambda: mst_topology(links, degree)
+    }
+    for topology in topologies:
+        if topology not in builders:
+            raise ValueError(f'Unknown topology: {topology}')
+        path = os.path.join(folder, f'{run_id}_{topology}_solution.json')
+        _write_json(path, builders[topology]())
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generates synthetic scenarios for the simulator')
+    parser.add_argument('nodes', type=int, nargs='+', help='number of nodes of each scenario')
+    parser.add_argument('--runs', type=int, default=1, help='number of scenarios (run ids) of each size')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first scenario')
+    parser.add_argument('--folder', default='blocksim/out/', help='folder of the scenarios')
+    parser.add_argument('--locations', type=int, default=5)
+    parser.add_argument('--degree', type=int, default=None, help='number of neighbours of each node')
+    parser.add_argument('--topologies', nargs='+', choices=TOPOLOGIES, default=list(TOPOLOGIES))
+    parser.add_argument('--json-links', dest='json_links', action='store_true', default=None,
+                        help='write the pairwise latencies and throughputs')
+    parser.add_argument('--no-json-links', dest='json_links', action='store_false')
+    args = parser.parse_args(argv)
+    for num in args.nodes:
+        for run_id in range(args.runs):
+            # Each scenario has its own seed, so a scenario does not depend on the others
+            seed = args.seed + 1000003 * num + run_id
+            paths = generate_scenario(
+                num, run_id, args.folder, seed, args.locations, args.degree, args.topologies, args.json_links)
+            print(f'Scenario {num}/{run_id} (seed {seed}): {len(paths)} files written')
+
+
+if __name__ == '__main__':
+    main()
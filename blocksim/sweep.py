@@ -0,0 +1,284 @@
+import argparse
+import glob
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import time
+import traceback
+import numpy as np
+from blocksim import main as model
+from blocksim.workers import warm_pool
+
+# Input files of the simulation, read from the working directory (see `main.run_model`)
+INPUT_PARAMETERS = (
+    'input-parameters/config.json',
+    'input-parameters/latency.json',
+    'input-parameters/throughput-received.json',
+    'input-parameters/throughput-sent.json',
+    'input-parameters/delays.json')
+# Parameters of a job that are arguments of `main.run_model`. The other parameters, except
+# `av_neighbours`, replace values of the section of the blockchain in the configuration
+RUN_MODEL_PARAMETERS = set(inspect.signature(model.run_model).parameters) - {'config_overrides'}
+DEFAULTS = {'run_id': 0, 'num_nodes': model.NETWORK_SIZE, 'algo': 'mst', 'av_neighbours': model.AV_NEIGHBOURS}
+
+_code_version = None
+
+
+def expand_grid(grid: dict, base: dict = None) -> list:
+    """The jobs of a grid search: one job for each combination of the values of the parameters.
+
+    :param dict grid: the values of each parameter, e.g. ``{'algo': ['mst', 'RNS'], 'av_neighbours': [6, 9]}``
+    :param dict base: the parameters shared by all the jobs
+    """
+    names = list(grid)
+    return [dict(base or {}, **dict(zip(names, values))) for values in itertools.product(*grid.values())]
+
+
+def random_search(space: dict, samples: int, seed=0, base: dict = None) -> list:
+    """The jobs of a random search: `samples` jobs with values drawn from `space`.
+
+    Each parameter of `space` is a list of values, to choose one, or a dictionary
+    ``{'low': a, 'high': b}``, to draw a uniform value (an integer when both limits are
+    integers). The same seed gives the same jobs, so a search can be extended with more
+    samples without changing the jobs already run.
+    """
+    random_state = np.random.default_rng(seed)
+    jobs = []
+    for _ in range(samples):
+        job = dict(base or {})
+        for name, values in space.items():
+            if isinstance(values, dict):
+                low, high = values['low'], values['high']
+                if isinstance(low, int) and isinstance(high, int):
+                    job[name] = int(random_state.integers(low, high + 1))
+                else:
+                    job[name] = float(random_state.uniform(low, high))
+            else:
+                job[name] = values[int(random_state.integers(0, len(values)))]
+        jobs.append(job)
+    return jobs
+
+
+def load_spec(path: str) -> list:
+    """Reads the jobs of a sweep from a JSON file with the parameters shared by the jobs
+    (``base``) and a ``grid`` (see `expand_grid`) or a ``random`` space with its number of
+    ``samples`` and ``seed`` (see `random_search`)"""
+    with open(path) as f:
+        spec = json.load(f)
+    base = spec.get('base', {})
+    if 'grid' in spec:
+        return expand_grid(spec['grid'], base)
+    if 'random' in spec:
+        return random_search(spec['random'], spec['samples'], spec.get('seed', 0), base)
+    raise ValueError(f'{path} has no grid or random search')
+
+
+def code_version() -> str:
+    """Hash of the source code of the simulator"""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        package = os.path.dirname(os.path.abspath(__file__))
+        for path in sorted(glob.glob(os.path.join(package, '**', '*.py'), recursive=True)):
+            digest.update(os.path.relpath(path, package).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def _file_hash(path: str):
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def effective_job(job: dict) -> dict:
+    """The parameters of a job with the defaults. The seed defaults to the run id, so the runs
+    of a scenario share their random inputs"""
+    job = dict(DEFAULTS, **job)
+    job.setdefault('seed', job['run_id'])
+    return job
+
+
+def _run_arguments(job: dict):
+    """The algorithm, if the neighbours are random (RNS), the arguments of `run_model` and the
+    configuration overrides of a job"""
+    arguments = {name: value for name, value in job.items() if name in RUN_MODEL_PARAMETERS}
+    overrides = {name: value for name, value in job.items()
+                 if name not in RUN_MODEL_PARAMETERS and name != 'av_neighbours'}
+    rns = arguments['algo'] == 'RNS'
+    if rns:
+        # As in `main`, RNS reads the solution files of another algorithm, which are not used
+        arguments['algo'] = 'BasePSO'
+    return rns, arguments, overrides
+
+
+def job_inputs(job: dict) -> dict:
+    """All the effective inputs of a job: its parameters, the configuration with the overrides,
+    the hashes of the input files and of the code"""
+    job = effective_job(job)
+    _, arguments, overrides = _run_arguments(job)
+    with open(INPUT_PARAMETERS[0]) as f:
+        config = json.load(f)
+    if arguments.get('blockchain') is not None:
+        config['blockchain'] = arguments['blockchain']
+    config[config['blockchain']].update(overrides)
+    folder = arguments.get('folder_path', 'blocksim/out/')
+    prefix = f'{folder}/{arguments["num_nodes"]}/{arguments["run_id"]}'
+    files = list(INPUT_PARAMETERS[1:]) + [
+        f'{folder}/loc_names.json',
+        f'{prefix}_node_properties.json',
+        f'{prefix}_latencies.json',
+        f'{prefix}_throughputs.json',
+        f'{prefix}_coordinates.npz',
+        f'{prefix}_{arguments["algo"]}_solution.json']
+    if arguments.get('transaction_trace'):
+        files.append(arguments['transaction_trace'])
+    return {
+        'job': job,
+        'config': config,
+        'files': {os.path.normpath(path): _file_hash(path) for path in files},
+        'code': code_version()
+    }
+
+
+def job_key(job: dict) -> str:
+    """The key of the results of a job in the cache: the hash of its effective inputs"""
+    inputs = json.dumps(job_inputs(job), sort_keys=True, default=str)
+    return hashlib.sha256(inputs.encode()).hexdigest()
+
+
+def run_job(job: dict):
+    """Runs the simulation of a job. Returns its metrics"""
+    job = effective_job(job)
+    rns, arguments, overrides = _run_arguments(job)
+    model.RNS = rns
+    model.AV_NEIGHBOURS = job['av_neighbours']
+    return model.run_model(config_overrides=overrides, **arguments)
+
+
+class Sweep:
+    """Runs the jobs of a parameter sweep (see `expand_grid`, `random_search` and `load_spec`),
+    with a cache of their results.
+
+    The results of a job are saved in `cache_dir` under its key, the hash of all its effective
+    inputs (see `job_key`), as soon as it finishes. The jobs with results in the cache are not
+    run again, so a sweep that is interrupted, or extended with more values, only runs the
+    missing jobs; a change of the configuration, the input files or the code runs them again.
+
+    The other jobs run in a pool of `processes` processes (by default the number of CPUs). Each
+    job runs in a new process, as the simulator keeps its state in module variables, forked
+    from this process once it is warm (see `blocksim.workers.warm_pool`).
+
+    :param list jobs: the parameters of each job
+    :param str cache_dir: the folder of the cache
+    """
+
+    def __init__(self, jobs: list, cache_dir='sweeps/cache', processes: int = None):
+        self.jobs = jobs
+        self.cache_dir = cache_dir
+        self.processes = processes or os.cpu_count()
+        self.keys = [job_key(job) for job in jobs]
+        self.failures = {}
+
+    def _path(self, key: str):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json')
+
+    def cached(self, key: str):
+        """The results of a job in the cache, or None"""
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, key: str, result: dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a temporary file first, so an interrupted write does not leave a partial result
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(result, f, default=_to_json)
+        os.replace(temporary, path)
+
+    def pending(self) -> dict:
+        """The jobs without results in the cache, by key"""
+        return {key: job for key, job in zip(self.keys, self.jobs) if self.cached(key) is None}
+
+    def run(self) -> list:
+        """Runs the missing jobs. Returns the results of all the jobs, in order (None for the
+        jobs that failed)"""
+        pending = self.pending()
+        print(f'Sweep: {len(self.jobs)} jobs, {len(self.jobs) - len(pending)} in the cache, {len(pending)} to run')
+        tasks = list(pending.items())
+        if not tasks:
+            return [self.cached(key) for key in self.keys]
+        # Even a single job runs in a forked process, so it does not change the module
+        # variables of this process
+        pool = warm_pool(min(self.processes, len(tasks)), maxtasksperchild=1)
+        finished = pool.imap_unordered(_run_task, tasks)
+        try:
+            for count, (key, result, error) in enumerate(finished, 1):
+                if error is None:
+                    self._save(key, result)
+                    self.failures.pop(key, None)
+                else:
+                    self.failures[key] = error
+                print(f'Sweep: {count}/{len(tasks)} jobs run'
+                      f'{"" if error is None else f", job {key[:12]} failed: {error.splitlines()[-1]}"}')
+        finally:
+            pool.terminate()
+        return [self.cached(key) for key in self.keys]
+
+
+def _run_task(task):
+    key, job = task
+    start = time.perf_counter()
+    try:
+        metrics = run_job(job)
+    except Exception:
+        return key, None, traceback.format_exc()
+    return key, {
+        'key': key,
+        'job': effective_job(job),
+        'metrics': metrics,
+        'wall_s': time.perf_counter() - start
+    }, None
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs a parameter sweep, with a cache of the results')
+    parser.add_argument('spec', help='JSON file of the sweep (see `load_spec`)')
+    parser.add_argument('--cache', default='sweeps/cache', help='folder of the results cache')
+    parser.add_argument('--processes', type=int, default=None, help='parallel jobs (by default the number of CPUs)')
+    parser.add_argument('--output', default=None, help='JSON file of the results of all the jobs')
+    parser.add_argument('--dry-run', action='store_true', help='only list the jobs and if they are in the cache')
+    args = parser.parse_args(argv)
+    sweep = Sweep(load_spec(args.spec), args.cache, args.processes)
+    if args.dry_run:
+        pending = sweep.pending()
+        for key, job in zip(sweep.keys, sweep.jobs):
+            print(f'{key[:12]} {"run" if key in pending else "cached"} {json.dumps(job, sort_keys=True)}')
+        return 0
+    results = sweep.run()
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=_to_json)
+    return 1 if sweep.failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
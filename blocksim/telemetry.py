@@ -0,0 +1,127 @@
+import json
+import os
+import resource
+import sys
+import time
+
+
+def _rss_MB():
+    """The current resident memory of the process, or its peak where it is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class TelemetryMonitor:
+    """Reports the progress of a running simulation, every `interval` simulated seconds, as a
+    SimPy process of the world (see `SimulationWorld.start_telemetry`).
+
+    Each sample has the simulated time and the progress of the run, the simulated seconds per
+    wall second, the SimPy events processed per wall second, the size of the event queue, the
+    live processes, the minimum, median and maximum chain height of the nodes, the transactions
+    waiting in the queues of the miners and the RSS of the process. The samples are written to
+    the standard error, or as JSON lines to `output`.
+
+    A sample only reads the state of the simulation, so it does not change the results. The
+    live processes are the processes created after the monitor starts that have not finished;
+    they are counted when they start and when they finish, which is cheaper than keeping them.
+
+    A run can be aborted from `on_sample`, which is called with each sample and stops the
+    simulation when it returns a reason (see `SimulationWorld.stop`), or after `max_wall_time`
+    seconds.
+
+    :param world: the `SimulationWorld`
+    :param float interval: simulated seconds between samples
+    :param list nodes: the nodes of the simulation
+    :param str output: JSON lines file of the samples. By default they are written to the standard error
+    """
+
+    def __init__(self, world, interval: float, nodes: list, output: str = None, on_sample=None,
+                 max_wall_time: float = None):
+        self.world = world
+        self.env = world.env
+        self.interval = interval
+        self.nodes = nodes
+        self.output = output
+        self.on_sample = on_sample
+        self.max_wall_time = max_wall_time
+        self.samples = 0
+        self.started_processes = 0
+        self.finished_processes = 0
+        self._track_processes()
+
+    def _track_processes(self):
+        process = self.env.process
+
+        def finished(event):
+            self.finished_processes += 1
+
+        def tracked_process(generator):
+            new = process(generator)
+            self.started_processes += 1
+            new.callbacks.append(finished)
+            return new
+        self.env.process = tracked_process
+
+    def _processed_events(self):
+        # Every scheduled event takes an id; the ones still in the queue are not processed.
+        # Taking an id does not change the order of the events
+        return next(self.env._eid) - len(self.env._queue)
+
+    def sample(self) -> dict:
+        """Reads the state of the simulation"""
+        env = self.env
+        now = time.perf_counter()
+        events = self._processed_events()
+        wall = now - self._last_wall
+        heights = sorted(node.chain.head.header.number for node in self.nodes)
+        elapsed = env.now - self.world.start_time
+        sample = {
+            'sim_time': elapsed,
+            'progress': elapsed / self.world.duration if self.world.duration else 1.0,
+            'wall_time': now - self._start_wall,
+            'speed': (env.now - self._last_sim) / wall if wall > 0 else 0.0,
+            'events_per_sec': (events - self._last_events) / wall if wall > 0 else 0.0,
+            'queue_size': len(env._queue),
+            'live_processes': self.started_processes - self.finished_processes,
+            'min_height': heights[0] if heights else 0,
+            'median_height': heights[len(heights) // 2] if heights else 0,
+            'max_height': heights[-1] if heights else 0,
+            'mempool_size': sum(node.transaction_queue.size() for node in self.nodes if node.is_mining),
+            'rss_MB': _rss_MB()
+        }
+        self._last_wall = now
+        self._last_sim = env.now
+        self._last_events = events
+        return sample
+
+    def _write(self, sample: dict):
+        if self.output is None:
+            print(
+                f'[telemetry] t={sample["sim_time"]:.0f}s ({100 * sample["progress"]:.1f}%) '
+                f'speed={sample["speed"]:.1f}x events/s={sample["events_per_sec"]:.0f} '
+                f'queue={sample["queue_size"]} processes={sample["live_processes"]} '
+                f'height={sample["min_height"]}/{sample["median_height"]}/{sample["max_height"]} '
+                f'mempool={sample["mempool_size"]} rss={sample["rss_MB"]:.0f}MB',
+                file=sys.stderr, flush=True)
+        else:
+            with open(self.output, 'a') as f:
+                f.write(json.dumps(sample) + '\n')
+
+    def run(self):
+        """The SimPy process of the monitor"""
+        self._start_wall = self._last_wall = time.perf_counter()
+        self._last_sim = self.env.now
+        self._last_events = self._processed_events()
+        while True:
+            yield self.env.timeout(self.interval)
+            sample = self.sample()
+            self.samples += 1
+            self._write(sample)
+            reason = self.on_sample(sample) if self.on_sample is not None else None
+            if reason is None and self.max_wall_time is not None and sample['wall_time'] > self.max_wall_time:
+                reason = f'wall time limit of {self.max_wall_time} seconds'
+            if reason:
+                self.world.stop(reason)
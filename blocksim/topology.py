@@ -0,0 +1,285 @@
+import multiprocessing
+import os
+from heapq import heappop, heappush
+from math import ceil
+import numpy as np
+from blocksim.links import LinkMatrices
+from blocksim.utils import get_distribution_mean, kB_to_MB, sim_data
+
+# Scorer used by the worker processes of `TopologyScorer.score_many`
+_scorer = None
+
+
+def request_message_sizes(config: dict):
+    """Returns the size (MB) of the messages needed to request a new block from a neighbour,
+    and if the block is validated before sending the message (see `FastForward`).
+    The blocks do not have transactions"""
+    blockchain = config['blockchain']
+    message_size = config[blockchain]['message_size_kB']
+    if blockchain == 'bitcoin':
+        header_size = message_size['header']
+        return [
+            (kB_to_MB(header_size + message_size['inv_vector']), False),
+            (kB_to_MB(header_size + message_size['inv_vector']), False),
+            (kB_to_MB(header_size + message_size['block_base']), True)]
+    return [
+        (kB_to_MB(message_size['hash_size']), False),
+        (kB_to_MB(message_size['get_headers']), False),
+        (kB_to_MB(message_size['header']), True),
+        (kB_to_MB(message_size['hash_size']), False),
+        (kB_to_MB(message_size['block_bodies']), False)]
+
+
+class TopologyScorer:
+    """Scores candidate topologies (neighbour solutions) by the expected block propagation latency.
+
+    A solution has the same format as `sim_data["solutions"]`: ``{node_id: [neighbour ids]}``.
+    As in `utils.get_optimum_neighbours`, a node is linked to its neighbours and to the nodes that
+    selected it as neighbour.
+
+    The weight of a link is the expected time to request a new block from a neighbour: the
+    latency, upload and download delay of each message and the mean block validation delay.
+    The propagation times from each miner are the shortest paths over the links, assuming
+    that the nodes relay the blocks (`FastForward` with `relay_blocks`). The latency of a
+    block is the time needed to reach the `alpha` coverage, as in
+    `ReportEngine._get_network_wide_latency`, and the score of a solution is the average
+    over the miners, weighted by their hashrate. The score is infinite when the coverage
+    is not reached. Lower scores are better.
+
+    :param LinkMatrices links: the latency and throughput between the nodes
+    :param dict config: the simulation configuration (`env.config`)
+    :param dict delays: the measured delays of the blockchain (`env.delays`)
+    :param hashrates: hashrate of each node (zero for non miners). If None, all the nodes mine equally
+    :param float alpha: the percentage of nodes which must have the block
+    """
+
+    def __init__(self, links: LinkMatrices, config: dict, delays: dict, hashrates=None, alpha=0.8):
+        self.links = links
+        self.alpha = alpha
+        messages = request_message_sizes(config)
+        messages_size = sum(size for size, _ in messages)
+        validation_delay = get_distribution_mean(delays['block_validation'])
+        self.weights = (len(messages) * links.latencies
+                        + links.transfer_delays(2 * messages_size)
+                        + validation_delay)
+        hashrates = np.ones(links.n) if hashrates is None else np.asarray(hashrates, dtype=float)
+        self.miners = np.flatnonzero(hashrates > 0)
+        self.miners_share = hashrates[self.miners] / hashrates[self.miners].sum()
+        # ReportEngine takes the receive time of the target node, excluding the miner. In the
+        # rows of the shortest paths, the miner is the first node (at distance zero)
+        target_num_nodes = ceil(alpha * (links.n - 1)) - 1
+        self._coverage_column = max(target_num_nodes, 1)
+
+    @classmethod
+    def from_world(cls, world, data: dict = None, alpha=0.8):
+        """Creates the scorer for the scenario read by `utils.initialize_node_values`, with the
+        configuration of the `world`. The hashrate of the nodes is their compute capacity"""
+        data = sim_data if data is None else data
+        node_properties = data['node_properties']
+        hashrates = [
+            node_properties[k]['compute_capacity'] if node_properties[k]['is_mining'] else 0
+            for k in sorted(node_properties, key=int)]
+        return cls(LinkMatrices.from_sim_data(data), world.env.config, world.env.delays, hashrates, alpha)
+
+    def adjacency(self, solution: dict):
+        """Returns the sparse matrix of the link weights of a solution"""
+        n = self.links.n
+        origins = []
+        destinations = []
+        for node_id, neighbours in solution.items():
+            origins.extend([int(node_id)] * len(neighbours))
+            destinations.extend(neighbours)
+        origins = np.asarray(origins, dtype=int)
+        destinations = np.asarray(destinations, dtype=int)
+        # Links are used in both directions. Repeated links are removed
+        edges = np.unique(np.concatenate((origins * n + destinations, destinations * n + origins)))
+        origins, destinations = np.divmod(edges, n)
+        weights = self.weights[origins, destinations]
+        usable = (origins != destinations) & np.isfinite(weights)
+        from scipy.sparse import csr_matrix
+        return csr_matrix(
+            (weights[usable], (origins[usable], destinations[usable])), shape=(n, n))
+
+    def propagation_times(self, solution: dict):
+        """Returns the propagation time from each miner (rows) to each node (columns)"""
+        from scipy.sparse.csgraph import shortest_path
+        return shortest_path(self.adjacency(solution), method='D', indices=self.miners)
+
+    def score(self, solution: dict) -> float:
+        """Expected block propagation latency of a solution, to the `alpha` coverage"""
+        times = self.propagation_times(solution)
+        column = self._coverage_column
+        latencies = np.partition(times, column, axis=1)[:, column]
+        return float(np.dot(self.miners_share, latencies))
+
+    def score_many(self, solutions: list, processes: int = None):
+        """Scores a list of solutions, in parallel in `processes` worker processes (defaults
+        to the number of CPUs). Returns an array with the score of each solution"""
+        global _scorer
+        processes = processes or os.cpu_count()
+        if processes == 1 or len(solutions) < 2 or not hasattr(os, 'fork'):
+            return np.array([self.score(solution) for solution in solutions])
+        # The workers are forked, so they share the link matrices without copying them
+        _scorer = self
+        try:
+            context = multiprocessing.get_context('fork')
+            chunksize = max(1, len(solutions) // (4 * processes))
+            with context.Pool(processes) as pool:
+                scores = pool.map(_score_solution, solutions, chunksize)
+        finally:
+            _scorer = None
+        return np.array(scores)
+
+
+def _score_solution(solution: dict):
+    return _scorer.score(solution)
+
+
+class IncrementalTopology:
+    """Keeps the score of a solution up to date while its links change, for optimisers that
+    mutate a few neighbours at a time.
+
+    The shortest path trees from each miner are kept, and updated with a dynamic single source
+    shortest path algorithm when a link is added or removed, instead of computing all the paths
+    again. An added link only propagates the distances it improves. A removed link only resets
+    the nodes below it in the shortest path trees, which are then reconnected through their
+    other links (Ramalingam and Reps). The work is proportional to the nodes affected by the
+    change, and only the coverage latency of the affected miners is computed again.
+
+    :param TopologyScorer scorer: the scorer, with the link weights and the miners
+    :param dict solution: the initial solution, in the `sim_data["solutions"]` format
+    """
+
+    def __init__(self, scorer: TopologyScorer, solution: dict):
+        self._scorer = scorer
+        self._weights = scorer.weights
+        self._solution = {int(node_id): list(neighbours) for node_id, neighbours in solution.items()}
+        # Number of times each link is selected (by any of its two nodes)
+        self._link_count = {}
+        # Weight of the links from (`_adjacency`) and to (`_incoming`) each node
+        self._adjacency = [{} for _ in range(scorer.links.n)]
+        self._incoming = [{} for _ in range(scorer.links.n)]
+        self._distances = None
+        for node_id, neighbours in self._solution.items():
+            for neighbour in neighbours:
+                self._count_link(node_id, neighbour, 1)
+        from scipy.sparse.csgraph import shortest_path
+        self._distances, self._predecessors = shortest_path(
+            scorer.adjacency(solution), method='D', indices=scorer.miners, return_predecessors=True)
+        self._latencies = np.array([self._coverage_latency(row) for row in range(len(scorer.miners))])
+
+    @property
+    def score(self) -> float:
+        return float(np.dot(self._scorer.miners_share, self._latencies))
+
+    @property
+    def propagation_times(self):
+        """The propagation time from each miner (rows) to each node (columns)"""
+        return self._distances
+
+    @property
+    def solution(self) -> dict:
+        return {node_id: list(neighbours) for node_id, neighbours in self._solution.items()}
+
+    def add_neighbour(self, node_id: int, neighbour: int) -> float:
+        """Adds `neighbour` to the neighbours of `node_id`. Returns the new score"""
+        self._solution.setdefault(node_id, []).append(neighbour)
+        self._count_link(node_id, neighbour, 1)
+        return self.score
+
+    def remove_neighbour(self, node_id: int, neighbour: int) -> float:
+        """Removes `neighbour` from the neighbours of `node_id`. Returns the new score"""
+        self._solution[node_id].remove(neighbour)
+        self._count_link(node_id, neighbour, -1)
+        return self.score
+
+    def _count_link(self, a: int, b: int, increment: int):
+        if a == b:
+            return
+        key = (a, b) if a < b else (b, a)
+        count = self._link_count.get(key, 0) + increment
+        if count > 0:
+            self._link_count[key] = count
+        else:
+            del self._link_count[key]
+        # Only the first selection adds the link and only the last one removes it. The weight of
+        # each direction is the one of `TopologyScorer.adjacency`
+        for origin, destination in ((a, b), (b, a)):
+            weight = self._weights[origin, destination]
+            if not np.isfinite(weight):
+                continue
+            if count == 1 and increment > 0:
+                self._adjacency[origin][destination] = weight
+                self._incoming[destination][origin] = weight
+                if self._distances is not None:
+                    self._insert_link(origin, destination, weight)
+            elif count == 0:
+                del self._adjacency[origin][destination]
+                del self._incoming[destination][origin]
+                self._delete_link(origin, destination)
+
+    def _coverage_latency(self, row: int) -> float:
+        column = self._scorer._coverage_column
+        return np.partition(self._distances[row], column)[column]
+
+    def _insert_link(self, a: int, b: int, weight: float):
+        """Updates the paths with the link from `a` to `b`"""
+        for row in range(len(self._distances)):
+            distances = self._distances[row]
+            if distances[a] + weight < distances[b] and self._propagate(row, [(distances[a] + weight, b, a)]):
+                self._latencies[row] = self._coverage_latency(row)
+
+    def _delete_link(self, a: int, b: int):
+        """Updates the paths without the link from `a` to `b`"""
+        for row in range(len(self._distances)):
+            predecessors = self._predecessors[row]
+            if predecessors[b] != a:
+                # The link is not in the shortest path tree of this miner
+                continue
+            affected = self._subtree(row, b)
+            distances = self._distances[row]
+            distances[affected] = np.inf
+            predecessors[affected] = -9999
+            # Reconnect the affected nodes through the links to the rest of the tree
+            seeds = []
+            for node in affected:
+                for neighbour, weight in self._incoming[node].items():
+                    distance = distances[neighbour] + weight
+                    if distance < np.inf:
+                        seeds.append((distance, node, neighbour))
+            self._propagate(row, seeds)
+            self._latencies[row] = self._coverage_latency(row)
+
+    def _subtree(self, row: int, root: int) -> list:
+        """Nodes below `root` (included) in the shortest path tree of a miner"""
+        predecessors = self._predecessors[row]
+        subtree = [root]
+        for node in subtree:
+            for neighbour in self._adjacency[node]:
+                if predecessors[neighbour] == node:
+                    subtree.append(neighbour)
+        return subtree
+
+    def _propagate(self, row: int, seeds: list) -> bool:
+        """Dijkstra from `seeds` (distance, node, predecessor), only through the nodes whose
+        distance improves. Returns if any distance changed"""
+        distances = self._distances[row]
+        predecessors = self._predecessors[row]
+        heap = []
+        for distance, node, predecessor in seeds:
+            if distance < distances[node]:
+                distances[node] = distance
+                predecessors[node] = predecessor
+                heappush(heap, (distance, node))
+        changed = bool(heap)
+        while heap:
+            distance, node = heappop(heap)
+            if distance > distances[node]:
+                continue
+            for neighbour, weight in self._adjacency[node].items():
+                new_distance = distance + weight
+                if new_distance < distances[neighbour]:
+                    distances[neighbour] = new_distance
+                    predecessors[neighbour] = node
+                    heappush(heap, (new_distance, neighbour))
+        return changed
@@ -0,0 +1,290 @@
+import json
+import struct
+import zlib
+from math import ceil
+import numpy as np
+
+# Kinds of the trace records
+SEND = 0
+RECEIVE = 1
+BLOCK_CREATED = 2
+HEAD_CHANGED = 3
+MEMPOOL_ADD = 4
+MEMPOOL_REMOVE = 5
+KINDS = ('send', 'receive', 'block_created', 'head_changed', 'mempool_add', 'mempool_remove')
+
+# Fixed-width record of the trace. Depending on the kind:
+#   send / receive: `node` sends to (receives from) `peer` a message with type tag `tag`
+#       and `size` MB
+#   block_created / head_changed: the block with hash `key` and number `number` is created by
+#       (is the head of) `node`
+#   mempool_add / mempool_remove: the transaction with hash `key` is added to (taken from)
+#       the transaction queue of `node`
+# The keys are the first 64 bits of the hashes. The nodes are identified by their number
+TRACE_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('kind', 'u1'),
+    ('tag', 'u1'),
+    ('node', '<i4'),
+    ('peer', '<i4'),
+    ('key', '<u8'),
+    ('number', '<i8'),
+    ('size', '<f4')])
+
+MAGIC = b'BSTRACE1'
+# Chunk types of the trace file
+_RECORDS = 0
+_METADATA = 1
+_CHUNK_HEADER = struct.Struct('<BI')
+# Records written in each chunk
+CHUNK_SIZE = 65536
+
+
+def hash_key(block_hash: str) -> int:
+    """The key of a hash in the trace: its first 64 bits"""
+    return int(block_hash[:16], 16)
+
+
+class EventTracer:
+    """Writes the events of a simulation to a binary trace file, to compute metrics after the run
+    without simulating again (see `TraceReplay`).
+
+    The records (`TRACE_DTYPE`) are kept in a buffer and written in chunks of `chunk_size`
+    records, compressed with zlib. The metadata of the run (the node addresses and the names of
+    the message types) is written when the tracer is closed.
+
+    The tracer is enabled by setting it in `env.tracer`; the models record their events when it
+    is set (`Connection.put`, `Node.listening_node`, `Network._build_new_block`,
+    `Chain.add_block` and `TransactionQueue`).
+
+    :param str path: the trace file
+    :param env: the SimPy environment of the simulation
+    :param int chunk_size: number of records of each chunk
+    :param int level: zlib compression level
+    """
+
+    def __init__(self, path: str, env, chunk_size=CHUNK_SIZE, level=1):
+        self.path = path
+        self.env = env
+        self.level = level
+        self._buffer = np.zeros(chunk_size, dtype=TRACE_DTYPE)
+        self._size = 0
+        self._message_ids = {}
+        self.records = 0
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+
+    def _record(self, kind, tag, node, peer, key, number, size):
+        self._buffer[self._size] = (self.env.now, kind, tag, node, peer, key, number, size)
+        self._size += 1
+        if self._size == len(self._buffer):
+            self.flush()
+
+    def message_sent(self, envelope):
+        msg = envelope.msg
+        self._message_ids[msg.tag] = msg.id
+        self._record(SEND, msg.tag, envelope.origin.node_id_num, envelope.destination.node_id_num, 0, 0, msg.size)
+
+    def message_received(self, envelope):
+        msg = envelope.msg
+        self._record(RECEIVE, msg.tag, envelope.destination.node_id_num, envelope.origin.node_id_num, 0, 0,
+                     msg.size)
+
+    def block_created(self, node, block):
+        header = block.header
+        self._record(BLOCK_CREATED, 0, node.node_id_num, -1, hash_key(header.hash), header.number, 0)
+
+    def head_changed(self, node, block):
+        header = block.header
+        self._record(HEAD_CHANGED, 0, node.node_id_num, -1, hash_key(header.hash), header.number, 0)
+
+    def mempool_added(self, node, tx):
+        self._record(MEMPOOL_ADD, 0, node.node_id_num, -1, hash_key(tx.hash), 0, 0)
+
+    def mempool_removed(self, node, tx):
+        self._record(MEMPOOL_REMOVE, 0, node.node_id_num, -1, hash_key(tx.hash), 0, 0)
+
+    def _write_chunk(self, chunk_type, data: bytes):
+        payload = zlib.compress(data, self.level)
+        self._file.write(_CHUNK_HEADER.pack(chunk_type, len(payload)))
+        self._file.write(payload)
+
+    def flush(self):
+        """Writes the buffered records to the trace file"""
+        if self._size:
+            self._write_chunk(_RECORDS, self._buffer[:self._size].tobytes())
+            self.records += self._size
+            self._size = 0
+
+    def close(self, nodes: dict = None, **metadata):
+        """Writes the buffered records and the metadata, and closes the trace file.
+
+        :param dict nodes: the nodes of the simulation, to save their addresses
+        :param metadata: other values saved in the metadata (e.g. the simulation parameters)
+        """
+        self.flush()
+        metadata.update({
+            'records': self.records,
+            'message_ids': {str(tag): msg_id for tag, msg_id in self._message_ids.items()},
+            'addresses': {} if nodes is None else {str(node.node_id_num): node.address for node in nodes.values()}
+        })
+        self._write_chunk(_METADATA, json.dumps(metadata).encode('utf-8'))
+        self._file.close()
+        print(f'Trace: {self.records} records written to {self.path}')
+
+
+def iter_chunks(path: str):
+    """Reads a trace file. Yields the arrays of records of each chunk and, at the end, the
+    metadata dictionary (when the tracer was closed)"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a trace file')
+        while True:
+            header = f.read(_CHUNK_HEADER.size)
+            if len(header) < _CHUNK_HEADER.size:
+                return
+            chunk_type, length = _CHUNK_HEADER.unpack(header)
+            data = zlib.decompress(f.read(length))
+            if chunk_type == _RECORDS:
+                yield np.frombuffer(data, dtype=TRACE_DTYPE)
+            else:
+                yield json.loads(data)
+
+
+def read_trace(path: str):
+    """Reads all the records of a trace file. Returns the records and the metadata"""
+    chunks = []
+    metadata = {}
+    for chunk in iter_chunks(path):
+        if isinstance(chunk, dict):
+            metadata = chunk
+        else:
+            chunks.append(chunk)
+    records = np.concatenate(chunks) if chunks else np.zeros(0, dtype=TRACE_DTYPE)
+    return records, metadata
+
+
+class TraceReplay:
+    """Computes the metrics of a simulation from its trace (see `EventTracer`), with vectorised
+    NumPy operations over the records. New metrics can be computed from `records` without
+    running the simulation again.
+
+    :param str path: the trace file
+    """
+
+    def __init__(self, path: str):
+        self.records, self.metadata = read_trace(path)
+        self.addresses = {int(k): v for k, v in self.metadata.get('addresses', {}).items()}
+        self.message_ids = {int(k): v for k, v in self.metadata.get('message_ids', {}).items()}
+        nodes = self.records['node']
+        self.number_of_nodes = len(self.addresses) or (int(nodes.max()) + 1 if len(nodes) else 0)
+        self._kinds = self.records['kind']
+
+    def select(self, kind: int):
+        """The records of a kind"""
+        return self.records[self._kinds == kind]
+
+    def message_stats(self):
+        """The number and size (MB) of the messages sent and received of each type.
+        Returns ``{message id: {'sent': n, 'sent_MB': x, 'received': n, 'received_MB': x}}``"""
+        stats = {}
+        for kind, name in ((SEND, 'sent'), (RECEIVE, 'received')):
+            records = self.select(kind)
+            tags, index = np.unique(records['tag'], return_inverse=True)
+            counts = np.bincount(index, minlength=len(tags))
+            sizes = np.bincount(index, weights=records['size'], minlength=len(tags))
+            for tag, count, size in zip(tags.tolist(), counts.tolist(), sizes.tolist()):
+                values = stats.setdefault(self.message_ids.get(tag, tag), {})
+                values[name] = count
+                values[f'{name}_MB'] = size
+        return stats
+
+    def message_rate(self, interval=60.0, kind=SEND):
+        """The number of messages of each `interval` (seconds) of the simulation. Returns the
+        start of the intervals and the counts"""
+        times = self.select(kind)['time']
+        if len(times) == 0:
+            return np.zeros(0), np.zeros(0, dtype=int)
+        start = self.records['time'].min()
+        bins = ((times - start) // interval).astype(np.int64)
+        counts = np.bincount(bins)
+        return start + interval * np.arange(len(counts)), counts
+
+    def first_head_times(self):
+        """The first time each node had each block as the head of its chain. Returns the
+        arrays of block keys, nodes and times, sorted by block and time"""
+        heads = self.select(HEAD_CHANGED)
+        order = np.lexsort((heads['time'], heads['node'], heads['key']))
+        heads = heads[order]
+        first = np.ones(len(heads), dtype=bool)
+        first[1:] = (heads['key'][1:] != heads['key'][:-1]) | (heads['node'][1:] != heads['node'][:-1])
+        heads = heads[first]
+        order = np.lexsort((heads['time'], heads['key']))
+        heads = heads[order]
+        return heads['key'], heads['node'], heads['time']
+
+    def block_latencies(self, alpha=0.8, receivers_only=True):
+        """Time needed by each created block to be the head of `alpha` of the nodes, excluding
+        its miner. As the network-wide latency of `ReportEngine`, the coverage is over the nodes
+        that received the block; with `receivers_only=False` it is over all the nodes. Returns
+        the block keys and their latencies (infinite when the coverage is not reached)"""
+        created = self.select(BLOCK_CREATED)
+        latencies = np.full(len(created), np.inf)
+        if len(created) == 0:
+            return created['key'], latencies
+        order = np.argsort(created['key'], kind='stable')
+        created_keys = created['key'][order]
+        miners = created['node'][order]
+        keys, nodes, times = self.first_head_times()
+        position = np.minimum(np.searchsorted(created_keys, keys), len(created_keys) - 1)
+        receivers = (created_keys[position] == keys) & (nodes != miners[position])
+        keys = keys[receivers]
+        times = times[receivers]
+        blocks, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+        if receivers_only:
+            targets = np.maximum(np.ceil(alpha * counts).astype(np.int64), 1)
+        else:
+            targets = np.full(len(blocks), max(ceil(alpha * (self.number_of_nodes - 1)), 1))
+        reached = counts >= targets
+        coverage_times = np.full(len(blocks), np.inf)
+        coverage_times[reached] = times[starts[reached] + targets[reached] - 1]
+        if len(blocks):
+            position = np.minimum(np.searchsorted(blocks, created['key']), len(blocks) - 1)
+            found = blocks[position] == created['key']
+            latencies[found] = coverage_times[position[found]] - created['time'][found]
+        return created['key'], latencies
+
+    def reorgs(self):
+        """The number of times each node replaced its head by a block with the same or a lower
+        number (a chain reorganisation)"""
+        heads = self.select(HEAD_CHANGED)
+        order = np.lexsort((heads['time'], heads['node']))
+        heads = heads[order]
+        same_node = heads['node'][1:] == heads['node'][:-1]
+        reorg = same_node & (heads['number'][1:] <= heads['number'][:-1])
+        return np.bincount(heads['node'][1:][reorg], minlength=self.number_of_nodes)
+
+    def transaction_latencies(self):
+        """The time between the first insertion of each transaction in a transaction queue and
+        the first time a miner takes it to build a block. Returns the transaction keys and
+        their latencies (infinite for the transactions never taken)"""
+        added = self.select(MEMPOOL_ADD)
+        removed = self.select(MEMPOOL_REMOVE)
+        keys, first_added = _first_times(added)
+        removed_keys, first_removed = _first_times(removed)
+        latencies = np.full(len(keys), np.inf)
+        if len(removed_keys):
+            position = np.minimum(np.searchsorted(removed_keys, keys), len(removed_keys) - 1)
+            found = removed_keys[position] == keys
+            latencies[found] = first_removed[position[found]] - first_added[found]
+        return keys, latencies
+
+
+def _first_times(records):
+    """The first time of each key of the records. Returns the sorted keys and their times"""
+    order = np.lexsort((records['time'], records['key']))
+    keys = records['key'][order]
+    times = records['time'][order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return keys[first], times[first]
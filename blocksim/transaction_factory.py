@@ -1,7 +1,7 @@
-import string
-from random import randint, choices
 from blocksim.models.transaction import Transaction
 from blocksim.models.ethereum.transaction import Transaction as ETHTransaction
+from blocksim.utils import rng
+from blocksim.workload import random_signatures
 from blocksim.world import SimulationWorld
 
 
@@ -11,18 +11,28 @@ class TransactionFactory:
     transaction model. Moreover, the created transactions will be broadcasted when simulation
     is running by a random node on a list. Additionally, the user needs to specify the
     number of batches, number of transactions per batch and the interval in seconds between each batch.
+
+    For workloads with a large number of transactions or other arrival processes, see
+    `blocksim.workload.TransactionWorkload`.
     """
 
-    def __init__(self, world:SimulationWorld):
+    def __init__(self, world:SimulationWorld, random_state=None):
         self._world = world
+        self._rng = rng if random_state is None else random_state
 
     def broadcast(self, number_of_batches, transactions_per_batch, interval, nodes_list):
+        self._world.env.process(
+            self._broadcast_batches(number_of_batches, transactions_per_batch, interval, nodes_list))
+
+    def _broadcast_batches(self, number_of_batches, transactions_per_batch, interval, nodes_list):
+        """Creates and broadcasts a batch of transactions every `interval` seconds"""
         for i in range(number_of_batches):
+            if i > 0:
+                yield self._world.env.timeout(interval)
             transactions = []
-            for _i in range(transactions_per_batch):
-                # Generate a random string to a transaction be distinct from others
-                rand_sign = ''.join(
-                    choices(string.ascii_letters + string.digits, k=20))
+            # Generate random strings to a transaction be distinct from others
+            signatures = random_signatures(self._rng, transactions_per_batch)
+            for rand_sign in signatures:
                 if self._world.blockchain == 'bitcoin':
                     tx = Transaction('address', 'address', 140, rand_sign, 50, self._world.env.now)
                 elif self._world.blockchain == 'ethereum':
@@ -32,9 +42,6 @@ class TransactionFactory:
                 transactions.append(tx)
             self._world.env.data['created_transactions'] += len(transactions)
             # Choose a random node to broadcast the transaction
-            self._world.env.process(
-                nodes_list[randint(0, len(nodes_list)-1)].broadcast_transactions(transactions))
-            self._world.env.process(self._set_interval(interval))
-
-    def _set_interval(self, interval):
-        yield self._world.env.timeout(interval)
+            node = nodes_list[int(self._rng.integers(0, len(nodes_list)))]
+            if node.network.is_local(node):
+                self._world.env.process(node.broadcast_transactions(transactions))
@@ -5,7 +5,6 @@ import random
 from ast import literal_eval as make_tuple
 from typing import List, overload
 import numpy as np
-import scipy.stats
 
 
 try:
@@ -19,6 +18,10 @@ except ImportError:
     def keccak_256(value):
         return _sha3.keccak_256(value).digest()
 
+# SciPy distributions resolved by `get_distribution`, by name and parameters
+_distributions = {}
+
+
 @overload
 def get_latency_delay(env, origin: str, destination: str, n=1):
     distribution = env.delays['LATENCIES'][origin][destination]
@@ -32,6 +35,9 @@ def get_latency_delay(env, origin: str, destination: str, n=1):
 
 
 def get_latency_delay(origin: str, destination: str):
+    links = sim_data.get("links")
+    if links is not None:
+        return round(links.get_latency(origin, destination), 6)
     key = f"{origin}_{destination}"
     latency:float = sim_data["latencies"].get(key)
     if latency is None:
@@ -90,11 +96,15 @@ def get_sent_delay(message_size: float, origin: str, destination: str):
     return get_sent_or_received_delay(message_size, origin, destination)
 
 def get_sent_or_received_delay(message_size: float, origin:str, destination:str):
-    key = f"{origin}_{destination}"
-    throughput = sim_data["throughputs"].get(key)
-    if throughput is None:
-        key = f"{destination}_{origin}"
+    links = sim_data.get("links")
+    if links is not None:
+        throughput = links.get_throughput(origin, destination)
+    else:
+        key = f"{origin}_{destination}"
         throughput = sim_data["throughputs"].get(key)
+        if throughput is None:
+            key = f"{destination}_{origin}"
+            throughput = sim_data["throughputs"].get(key)
     delay = (message_size * 8) / throughput
     
     if delay < 0:
@@ -125,15 +135,90 @@ def kB_to_MB(value):
     return value / 1000
 
 
-def get_random_values(distribution: dict, n=1):
+def get_distribution(distribution: dict):
+    """Returns the SciPy distribution of a `distribution` (see `get_random_values`), with its
+    shape parameters, location and scale.
+
+    The distributions are resolved once, as parsing their parameters is slower than drawing a
+    value, and `scipy.stats`, slow to import, is only imported when the first one is resolved."""
+    key = (distribution['name'], distribution['parameters'])
+    resolved = _distributions.get(key)
+    if resolved is None:
+        import scipy.stats
+        param = make_tuple(distribution['parameters'])
+        resolved = _distributions[key] = (getattr(scipy.stats, distribution['name']), param[:-2], param[-2], param[-1])
+    return resolved
+
+
+def get_random_values(distribution: dict, n=1, random_state=None):
     """Receives a `distribution` and outputs `n` random values
-    Distribution format: { \'name\': str, \'parameters\': tuple }"""
-    dist = getattr(scipy.stats, distribution['name'])
-    param = make_tuple(distribution['parameters'])
-    c = dist.rvs(*param[:-2], loc=param[-2], scale=param[-1], size=n)
+    Distribution format: { \'name\': str, \'parameters\': tuple }
+
+    The values are drawn from `random_state` (a NumPy `Generator`) when given, otherwise
+    from the global NumPy random state."""
+    dist, shapes, loc, scale = get_distribution(distribution)
+    c = dist.rvs(*shapes, loc=loc, scale=scale, size=n, random_state=random_state)
     return c
 
 
+def get_distribution_mean(distribution: dict):
+    """Returns the mean of a `distribution`, with the same format as in `get_random_values`"""
+    dist, shapes, loc, scale = get_distribution(distribution)
+    return dist.mean(*shapes, loc=loc, scale=scale)
+
+
+class AliasTable:
+    """Walker/Vose alias table to draw indices proportionally to a list of `weights`.
+
+    The table is built once in O(n) and each draw is O(1), against the O(n) needed to
+    build the cumulative distribution on every `choice` call. A draw needs two uniform
+    values in [0, 1): the first selects a column and the second decides between the
+    column and its alias. Uniform values can be drawn in batches and resolved later with
+    `pick`, even after the table has been rebuilt.
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        n = len(weights)
+        if n == 0 or weights.sum() <= 0:
+            raise ValueError('Alias table needs at least one positive weight')
+        self.n = n
+        self.prob = np.zeros(n)
+        self.alias = np.zeros(n, dtype=int)
+        scaled = weights * n / weights.sum()
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Left overs are (up to rounding errors) columns with probability one
+        for i in large + small:
+            self.prob[i] = 1.0
+        # Plain lists are faster than NumPy arrays to index with a single value
+        self._prob = self.prob.tolist()
+        self._alias = self.alias.tolist()
+
+    def pick(self, u_column: float, u_coin: float) -> int:
+        """Resolves one draw from two uniform values in [0, 1)"""
+        column = int(u_column * self.n)
+        if u_coin < self._prob[column]:
+            return column
+        return self._alias[column]
+
+    def draw(self, rng, size: int) -> np.ndarray:
+        """Draws `size` indices using the NumPy generator `rng`"""
+        columns = rng.integers(0, self.n, size)
+        coins = rng.random(size)
+        return np.where(coins < self.prob[columns], columns, self.alias[columns])
+
+
 def decode_hex(s):
     if isinstance(s, str):
         return bytes.fromhex(s)
@@ -167,17 +252,47 @@ def _read_json_file(file_location:str):
             return json.load(f)
 
 
-def initialize_node_values(folder_path:str="blocksim/out/", run_id=0,algo='BasePSO', num=100):
+def initialize_node_values(folder_path:str="blocksim/out/", run_id=0,algo='BasePSO', num=100, mmap_links=False,
+                           coordinate_links=False):
+    """Reads the scenario of a run into `sim_data`.
+
+    With `mmap_links`, the latencies and throughputs are not read from the JSON files, but from
+    the link matrices saved next to them (`{num}/{run_id}_links/`), as read-only memory maps
+    shared by all the processes of the runs (see `links.LinkMatrices.cached`). The matrices
+    are built from the JSON files the first time.
+
+    With `coordinate_links`, the links are read from the compact link model saved in
+    `{num}/{run_id}_coordinates.npz` (see `links.CoordinateLinks`), for networks too large for
+    the pairwise JSON files."""
     node_properties = dict(_read_json_file(f"{folder_path}/{num}/{run_id}_node_properties.json"))
     loc_names = list(_read_json_file(f"{folder_path}/loc_names.json"))
-    latencies = dict(_read_json_file(f"{folder_path}/{num}/{run_id}_latencies.json"))
-    throughputs = dict(_read_json_file(f"{folder_path}/{num}/{run_id}_throughputs.json"))
     solutions = dict(_read_json_file(f"{folder_path}{num}/{run_id}_{algo}_solution.json"))
+    latencies_path = f"{folder_path}/{num}/{run_id}_latencies.json"
+    throughputs_path = f"{folder_path}/{num}/{run_id}_throughputs.json"
 
     sim_data["node_properties"] = node_properties
     sim_data["loc_names"] = loc_names
-    sim_data["latencies"] = latencies
-    sim_data["throughputs"] = throughputs
+    if coordinate_links:
+        # Imported here, as `links` depends on this module
+        from blocksim.links import CoordinateLinks
+        sim_data["links"] = CoordinateLinks.load(f"{folder_path}/{num}/{run_id}_coordinates.npz")
+        sim_data["latencies"] = None
+        sim_data["throughputs"] = None
+    elif mmap_links:
+        # Imported here, as `links` depends on this module
+        from blocksim.links import LinkMatrices
+        read_data = lambda: {
+            "node_properties": node_properties,
+            "latencies": dict(_read_json_file(latencies_path)),
+            "throughputs": dict(_read_json_file(throughputs_path))}
+        sim_data["links"] = LinkMatrices.cached(
+            f"{folder_path}/{num}/{run_id}_links", [latencies_path, throughputs_path], read_data)
+        sim_data["latencies"] = None
+        sim_data["throughputs"] = None
+    else:
+        sim_data["links"] = None
+        sim_data["latencies"] = dict(_read_json_file(latencies_path))
+        sim_data["throughputs"] = dict(_read_json_file(throughputs_path))
     sim_data["solutions"] = solutions
 
     sim_data["number_of_nodes"] = len(sim_data["node_properties"])
@@ -203,6 +318,20 @@ def get_nodes(node_ids:list):
         nodes.append(node)
     return nodes
 
+def _get_inbound_neighbours(solution:dict):
+    """Returns the ids of the peers which selected each peer as neighbour, in the order of the
+    solution. The index is built once for each solution, instead of searching the whole
+    solution for each peer"""
+    cached = sim_data.get("inbound_neighbours")
+    if cached is None or cached[0] is not solution:
+        inbound = {}
+        for k,v in solution.items():
+            for i in set(v):
+                inbound.setdefault(i, []).append(k)
+        cached = (solution, inbound)
+        sim_data["inbound_neighbours"] = cached
+    return cached[1]
+
 def get_optimum_neighbours(current_node_id:int, nodes_dict:dict):
     solution = sim_data["solutions"]
     neigh_id_list = solution[str(current_node_id)]
@@ -217,25 +346,29 @@ def get_optimum_neighbours(current_node_id:int, nodes_dict:dict):
     
     # get other peers which have selected current peer as neighbour
     all_neigh_list = None
-    for k,v in solution.items():
-        if current_node_id in v:
-            inbound_id_list.append(int(k))
+    for k in _get_inbound_neighbours(solution).get(current_node_id, []):
+        inbound_id_list.append(int(k))
 
-            node = nodes_dict.get(int(k))
-            if node is not None:
-                inbound_neigh.append(nodes_dict[int(k)])
-            all_neigh = set(neighbours + inbound_neigh)
-            all_neigh_list = list(all_neigh)
+        node = nodes_dict.get(int(k))
+        if node is not None:
+            inbound_neigh.append(nodes_dict[int(k)])
+    if inbound_id_list:
+        # Duplicates are removed keeping the order, so the connections do not depend on the
+        # addresses of the nodes in memory
+        all_neigh_list = list(dict.fromkeys(neighbours + inbound_neigh))
     if all_neigh_list is None:
         return neighbours
     return all_neigh_list
 
 
-def get_random_neighbours(num:int, current_node_id:int, nodes_dict:dict):
+def get_random_neighbours(num:int, current_node_id:int, nodes_dict:dict, random_state=None):
+    """Chooses `num` random neighbours of a node. They are drawn from `random_state` (a NumPy
+    `Generator`) when given, otherwise from the global NumPy random state"""
+    randint = np.random.randint if random_state is None else random_state.integers
     sim_data["current_node_id"] = current_node_id
     # neighbour ids
-    a = np.random.randint(0, sim_data["number_of_nodes"], num)
-    a = _check_and_fix_solution(a)
+    a = randint(0, sim_data["number_of_nodes"], num)
+    a = _check_and_fix_solution(a, randint)
     neighbours = []
     for i in a:
         node = nodes_dict.get(i)
@@ -264,7 +397,7 @@ def update_random_neighbours(current_node_id:int, nodes_dict:dict, solution:dict
                 inbound_neigh.append(nodes_dict[int(k)])
     return neighbours + inbound_neigh
 
-def _check_and_fix_solution(solution:np.ndarray):
+def _check_and_fix_solution(solution:np.ndarray, randint=np.random.randint):
     
     solution = solution.astype(int)
     solution = solution.clip(sim_data["lb"][:len(solution)], sim_data["ub"][:len(solution)]) 
@@ -274,7 +407,7 @@ def _check_and_fix_solution(solution:np.ndarray):
         b.remove(sim_data["current_node_id"])
 
     while ((len(solution) - len(b)) > 0):
-        b.add(np.random.randint(0, sim_data["number_of_nodes"], 1)[0])
+        b.add(randint(0, sim_data["number_of_nodes"], 1)[0])
         if b.__contains__(sim_data["current_node_id"]):
             b.remove(sim_data["current_node_id"])
     return np.array(list(b))
@@ -0,0 +1,60 @@
+import importlib
+import json
+import multiprocessing
+from blocksim.utils import get_distribution
+
+# Modules imported by the simulator on first use, imported by `warm_up` before forking
+PRELOAD_MODULES = ('blocksim.main', 'blocksim.world', 'blocksim.node_factory', 'blocksim.models.network',
+                   'blocksim.transaction_factory', 'blocksim.report_engine', 'blocksim.random_streams',
+                   'blocksim.workload', 'scipy.stats', 'scipy.sparse.csgraph')
+# Input files with the probability distributions of the simulation
+DISTRIBUTION_FILES = (
+    'input-parameters/config.json',
+    'input-parameters/delays.json',
+    'input-parameters/latency.json',
+    'input-parameters/throughput-received.json',
+    'input-parameters/throughput-sent.json')
+
+
+def _distributions(value):
+    """The probability distributions (``{'name': str, 'parameters': str}``) in a JSON value"""
+    if isinstance(value, dict):
+        if isinstance(value.get('name'), str) and isinstance(value.get('parameters'), str):
+            yield value
+        else:
+            for item in value.values():
+                yield from _distributions(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _distributions(item)
+
+
+def warm_up(files=DISTRIBUTION_FILES):
+    """Imports the modules that the simulator imports on first use and resolves the
+    distributions of the input `files` (see `utils.get_distribution`), so the processes forked
+    afterwards do not repeat it"""
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+    for path in files:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for distribution in _distributions(data):
+            try:
+                get_distribution(distribution)
+            except (AttributeError, SyntaxError, ValueError):
+                # Not a SciPy distribution; the simulation reports it when it is used
+                pass
+
+
+def warm_pool(processes: int = None, maxtasksperchild: int = None):
+    """Pre-forked worker mode: a pool of processes forked from this process once it is warm
+    (see `warm_up`), so each run starts without importing and parsing its inputs again.
+
+    With ``maxtasksperchild=1`` each run has a new process, forked from the warm parent, as
+    the simulator keeps its state in module variables.
+    """
+    warm_up()
+    return multiprocessing.get_context('fork').Pool(processes, maxtasksperchild=maxtasksperchild)
@@ -0,0 +1,337 @@
+import numpy as np
+from blocksim.models.transaction import Transaction
+from blocksim.models.ethereum.transaction import Transaction as ETHTransaction
+from blocksim.utils import AliasTable, rng
+
+# Number of arrivals drawn at once by the workload generators
+WORKLOAD_CHUNK_SIZE = 4096
+
+
+def random_signatures(random_state, n: int):
+    """Generates `n` random signatures (64 bits as hexadecimal strings) at once,
+    used to make transactions distinct from each other"""
+    values = random_state.integers(0, 2**63, n, dtype=np.int64)
+    return np.char.mod('%016x', values).tolist()
+
+
+class PoissonArrivals:
+    """Poisson arrival process: the time between transactions follows an exponential
+    distribution with mean 1/`rate`.
+
+    :param float rate: average number of transactions per second
+    """
+
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError('The arrival rate must be positive')
+        self.rate = rate
+
+    def arrival_times(self, random_state, start: float, n: int):
+        """Returns the next `n` arrival times after `start`"""
+        return start + np.cumsum(random_state.exponential(1 / self.rate, n))
+
+
+class ConstantArrivals:
+    """Constant rate arrival process: a transaction every 1/`rate` seconds
+
+    :param float rate: number of transactions per second
+    """
+
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError('The arrival rate must be positive')
+        self.rate = rate
+
+    def arrival_times(self, random_state, start: float, n: int):
+        """Returns the next `n` arrival times after `start`"""
+        return start + np.arange(1, n + 1) / self.rate
+
+
+class BurstyArrivals:
+    """On/off Markov modulated Poisson process. Bursts of transactions arriving with
+    `burst_rate` alternate with quiet periods where they arrive with `idle_rate`. The
+    duration of each period follows an exponential distribution.
+
+    :param float burst_rate: transactions per second during a burst
+    :param float idle_rate: transactions per second between bursts (can be zero)
+    :param float mean_burst: average duration of a burst in seconds
+    :param float mean_idle: average duration of a quiet period in seconds
+    """
+
+    def __init__(self, burst_rate: float, idle_rate: float, mean_burst: float, mean_idle: float):
+        if burst_rate <= 0 or idle_rate < 0:
+            raise ValueError('The arrival rates must be positive')
+        self.burst_rate = burst_rate
+        self.idle_rate = idle_rate
+        self.mean_burst = mean_burst
+        self.mean_idle = mean_idle
+        # Current period, kept between chunks
+        self._in_burst = False
+        self._period_start = None
+        self._period_end = None
+
+    def arrival_times(self, random_state, start: float, n: int):
+        """Returns the next `n` arrival times after `start`"""
+        if self._period_end is None:
+            self._period_start = start
+            self._period_end = start + random_state.exponential(self.mean_idle)
+        chunks = []
+        count = 0
+        while count < n:
+            rate = self.burst_rate if self._in_burst else self.idle_rate
+            period_start = max(start, self._period_start)
+            # Given the number of arrivals in a period, they are uniformly distributed
+            k = random_state.poisson(rate * (self._period_end - period_start))
+            if k > 0:
+                times = np.sort(random_state.uniform(period_start, self._period_end, k))
+                if count + k > n:
+                    # The remaining arrivals of this period are returned in the next chunk
+                    times = times[:n - count]
+                    self._period_start = times[-1]
+                    chunks.append(times)
+                    return np.concatenate(chunks)
+                chunks.append(times)
+                count += k
+            self._in_burst = not self._in_burst
+            mean = self.mean_burst if self._in_burst else self.mean_idle
+            self._period_start = self._period_end
+            self._period_end = self._period_end + random_state.exponential(mean)
+        return np.concatenate(chunks)
+
+
+ARRIVAL_PROCESSES = {
+    'poisson': PoissonArrivals,
+    'constant': ConstantArrivals,
+    'bursty': BurstyArrivals
+}
+
+
+class Workload:
+    """Base class of the transaction sources that inject transactions in the running simulation.
+    The subclasses define `run`, the SimPy process that creates and broadcasts the transactions.
+
+    :param world: the simulation world
+    :param dict nodes: the nodes of the simulation, by node id
+    :param dict origin_weights: weight of each node id to be the origin of a transaction. Defaults to the same weight for all the nodes
+    """
+
+    def __init__(self, world, nodes: dict, origin_weights: dict = None, random_state=None):
+        self._world = world
+        self._env = world.env
+        self._node_ids = list(nodes)
+        self._nodes = list(nodes.values())
+        self._rng = rng if random_state is None else random_state
+        if origin_weights is None:
+            self._origins = None
+        else:
+            weights = [origin_weights.get(node_id, 0) for node_id in nodes]
+            self._origins = AliasTable(weights)
+        self.created_transactions = 0
+
+    def _draw_origins(self, n: int):
+        """Draws the index of the origin node of `n` transactions"""
+        if self._origins is None:
+            return self._rng.integers(0, len(self._nodes), n)
+        return self._origins.draw(self._rng, n)
+
+    def _emit(self, origin: int, tx):
+        """Broadcasts `tx` from the node with index `origin`"""
+        self.created_transactions += 1
+        self._env.data['created_transactions'] += 1
+        node = self._nodes[origin]
+        if node.network.is_local(node):
+            self._env.process(node.broadcast_transactions([tx]))
+
+    def discard_samples(self):
+        """Discards the values drawn in advance, e.g. after the random number generator is
+        reseeded. Only the synthetic workloads draw values in advance"""
+
+
+class TransactionWorkload(Workload):
+    """ Streams synthetic transactions into the running simulation, as a SimPy process.
+
+    The arrival times, the origin nodes and the transaction signatures are drawn with NumPy
+    in chunks of `WORKLOAD_CHUNK_SIZE`, and each transaction is only created when it arrives,
+    so the memory used by the generator does not depend on the number of transactions.
+
+    :param world: the simulation world
+    :param dict nodes: the nodes of the simulation, by node id
+    :param arrivals: the arrival process (e.g. `PoissonArrivals`)
+    :param dict origin_weights: weight of each node id to be the origin of a transaction. Defaults to the same weight for all the nodes
+    :param int max_transactions: stops after creating this number of transactions. Defaults to no limit
+    """
+
+    def __init__(self, world, nodes: dict, arrivals, origin_weights: dict = None, max_transactions: int = None,
+                 random_state=None):
+        super().__init__(world, nodes, origin_weights, random_state)
+        self._arrivals = arrivals
+        self._max_transactions = max_transactions
+
+    @classmethod
+    def from_config(cls, world, nodes: dict, **kwargs):
+        """Creates the workload described in the `transaction_workload` section of the
+        blockchain configuration, for example ``{"arrival": "poisson", "rate": 15}``"""
+        config = dict(world.env.config[world.blockchain]['transaction_workload'])
+        arrival = ARRIVAL_PROCESSES[config.pop('arrival')]
+        return cls(world, nodes, arrival(**config), **kwargs)
+
+    def _next_chunk(self, start):
+        n = WORKLOAD_CHUNK_SIZE
+        if self._max_transactions is not None:
+            n = min(n, self._max_transactions - self.created_transactions)
+        times = self._arrivals.arrival_times(self._rng, start, n).tolist()
+        origins = self._draw_origins(n).tolist()
+        signatures = random_signatures(self._rng, n)
+        return zip(times, origins, signatures)
+
+    def _create_transaction(self, signature):
+        if self._world.blockchain == 'bitcoin':
+            return Transaction('address', 'address', 140, signature, 50, self._env.now)
+        gas_limit = self._env.config['ethereum']['tx_gas_limit']
+        return ETHTransaction('address', 'address', 140, signature, self.created_transactions, 2, gas_limit,
+                              self._env.now)
+
+    def discard_samples(self):
+        self._chunk = iter(())
+
+    def run(self):
+        """The SimPy process that creates and broadcasts the transactions"""
+        self._chunk = iter(())
+        while self._max_transactions is None or self.created_transactions < self._max_transactions:
+            arrival = next(self._chunk, None)
+            if arrival is None:
+                self._chunk = self._next_chunk(self._env.now)
+                continue
+            arrival_time, origin, signature = arrival
+            delay = arrival_time - self._env.now
+            if delay > 0:
+                yield self._env.timeout(delay)
+            self._emit(origin, self._create_transaction(signature))
+
+
+# Record of a binary transaction trace. Timestamps are in seconds, the size is in kB and
+# the origin is an identifier of the node in the trace (-1 when it is unknown).
+TRACE_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('gas_price', '<f8'),
+    ('gas_limit', '<u8'),
+    ('size', '<f4'),
+    ('origin', '<i8')
+])
+
+
+def read_trace(path: str, chunk_size: int = WORKLOAD_CHUNK_SIZE):
+    """Reads a transaction trace in chunks of `chunk_size` records, as arrays of `TRACE_DTYPE`.
+
+    Binary traces (``.npy`` files or raw files of `TRACE_DTYPE` records) are memory-mapped, so
+    only the chunk being read is loaded in memory. CSV traces must have a header with the
+    `timestamp`, `gas_price`, `gas_limit` and `size` columns, and optionally `origin`.
+    """
+    if path.endswith('.csv'):
+        yield from _read_csv_trace(path, chunk_size)
+        return
+    if path.endswith('.npy'):
+        records = np.load(path, mmap_mode='r')
+    else:
+        records = np.memmap(path, dtype=TRACE_DTYPE, mode='r')
+    if records.dtype != TRACE_DTYPE:
+        raise TypeError(f'Trace {path} must have records with the following type: {TRACE_DTYPE}')
+    for start in range(0, len(records), chunk_size):
+        yield np.array(records[start:start + chunk_size])
+
+
+def _read_csv_trace(path: str, chunk_size: int):
+    with open(path) as f:
+        columns = f.readline().strip().split(',')
+        missing = set(TRACE_DTYPE.names) - set(columns) - {'origin'}
+        if missing:
+            raise ValueError(f'Trace {path} does not have the columns: {sorted(missing)}')
+        while True:
+            lines = [line for _, line in zip(range(chunk_size), f)]
+            if not lines:
+                return
+            values = np.loadtxt(lines, delimiter=',', ndmin=2)
+            chunk = np.zeros(len(values), dtype=TRACE_DTYPE)
+            chunk['origin'] = -1
+            for i, column in enumerate(columns):
+                if column in TRACE_DTYPE.names:
+                    chunk[column] = values[:, i]
+            yield chunk
+
+
+def convert_trace(csv_path: str, npy_path: str, chunk_size: int = WORKLOAD_CHUNK_SIZE):
+    """Converts a CSV trace to the compact binary format (a ``.npy`` file of `TRACE_DTYPE`
+    records), without loading the whole trace in memory"""
+    with open(csv_path) as f:
+        num_records = sum(1 for _ in f) - 1
+    out = np.lib.format.open_memmap(npy_path, mode='w+', dtype=TRACE_DTYPE, shape=(num_records,))
+    i = 0
+    for chunk in _read_csv_trace(csv_path, chunk_size):
+        out[i:i + len(chunk)] = chunk
+        i += len(chunk)
+    out.flush()
+    del out
+
+
+class TraceWorkload(Workload):
+    """ Replays a transaction trace (e.g. measured on the Ethereum or Bitcoin networks) into
+    the running simulation, as a SimPy process.
+
+    The trace is streamed in chunks with `read_trace`, so traces larger than the memory can be
+    replayed. The records must be sorted by timestamp. The first record arrives when the
+    process starts and the time between records is multiplied by `time_scale`.
+
+    For Ethereum the trace gas price and gas limit are used in the transaction. For Bitcoin the
+    gas price is used as the transaction fee.
+
+    :param world: the simulation world
+    :param dict nodes: the nodes of the simulation, by node id
+    :param str path: the trace file (``.npy``, ``.csv`` or raw binary records)
+    :param float time_scale: factor applied to the time between records (e.g. 0.5 doubles the rate)
+    :param dict origin_map: node id of each trace origin. Records with an unknown origin are sent from a random node
+    :param dict origin_weights: weight of each node id to be the origin of the records with an unknown origin
+    """
+
+    def __init__(self, world, nodes: dict, path: str, time_scale: float = 1.0, origin_map: dict = None,
+                 origin_weights: dict = None, random_state=None):
+        super().__init__(world, nodes, origin_weights, random_state)
+        self._path = path
+        self._time_scale = time_scale
+        self._origin_map = origin_map or {}
+        self._node_index = {node_id: i for i, node_id in enumerate(self._node_ids)}
+
+    def _map_origins(self, trace_origins: np.ndarray):
+        """Maps the trace origins to node indexes, drawing the ones not in `origin_map`"""
+        origins = self._draw_origins(len(trace_origins))
+        if self._origin_map:
+            for i, trace_origin in enumerate(trace_origins.tolist()):
+                node_id = self._origin_map.get(trace_origin)
+                if node_id is not None:
+                    origins[i] = self._node_index[node_id]
+        return origins.tolist()
+
+    def _create_transaction(self, record_index, gas_price, gas_limit, size):
+        signature = f'{record_index:016x}'
+        if self._world.blockchain == 'bitcoin':
+            return Transaction('address', 'address', 140, signature, gas_price, self._env.now, size=size)
+        return ETHTransaction('address', 'address', 140, signature, record_index, gas_price, gas_limit,
+                              self._env.now, size=size)
+
+    def run(self):
+        """The SimPy process that replays the trace"""
+        start = self._env.now
+        first_timestamp = None
+        record_index = 0
+        for chunk in read_trace(self._path):
+            if first_timestamp is None:
+                first_timestamp = chunk['timestamp'][0]
+            times = (start + (chunk['timestamp'] - first_timestamp) * self._time_scale).tolist()
+            origins = self._map_origins(chunk['origin'])
+            records = zip(times, origins, chunk['gas_price'].tolist(), chunk['gas_limit'].tolist(),
+                          chunk['size'].tolist())
+            for arrival_time, origin, gas_price, gas_limit, size in records:
+                delay = arrival_time - self._env.now
+                if delay > 0:
+                    yield self._env.timeout(delay)
+                self._emit(origin, self._create_transaction(record_index, gas_price, gas_limit, size))
+                record_index += 1
@@ -2,6 +2,9 @@ import json
 from datetime import datetime
 import simpy
 from schema import Schema, SchemaError
+from simpy.core import StopSimulation
+from blocksim.instrumentation import NoInstrumentation
+from blocksim.telemetry import TelemetryMonitor
 
 
 class SimulationWorld:
@@ -15,6 +18,10 @@ class SimulationWorld:
     :param dict validate_tx_distribution: Probability distribution to represent the transaction validation delay
     :param dict validate_block_distribution: Probability distribution to represent the block validation delay
 
+    The blockchain is read from the configuration file, unless it is given in `blockchain`.
+    `config_overrides` replaces values of the section of the blockchain in the configuration,
+    e.g. ``{'block_gas_limit': 4200000}``.
+
     Each distribution is represented as dictionary, with the following schema:
     ``{ 'name': str, 'parameters': tuple }``
 
@@ -33,16 +40,30 @@ class SimulationWorld:
                  measured_latency: str,
                  measured_throughput_received: str,
                  measured_throughput_sent: str,
-                 measured_delays: str):
+                 measured_delays: str,
+                 blockchain: str = None,
+                 config_overrides: dict = None):
         self._measured_delays = self._read_json_file(measured_delays)
         self._sim_duration = sim_duration
         self._initial_time = initial_time
         self._config = self._read_json_file(config_file)
+        if blockchain is not None:
+            self._config['blockchain'] = blockchain
+        if config_overrides:
+            self._config[self._config['blockchain']].update(config_overrides)
         self._measured_latency = measured_latency
         self._measured_throughput_received = measured_throughput_received
         self._measured_throughput_sent = measured_throughput_sent
         # Set the SimPy Environment
         self._env = simpy.Environment(initial_time=self._initial_time)
+        # Reason of a simulation stopped before the end (see `stop`)
+        self.stop_reason = None
+        # The nodes are not instrumented, unless it is replaced (see `blocksim.instrumentation`)
+        self._env.instrumentation = NoInstrumentation()
+        # Events are not traced, unless a tracer is set (see `blocksim.trace.EventTracer`)
+        self._env.tracer = None
+        # The chains do not notify a convergence controller (see `blocksim.convergence`)
+        self._env.convergence = None
         self._set_configs()
         self._set_delays()
         self._set_latencies()
@@ -70,9 +91,52 @@ class SimulationWorld:
     def env(self):
         return self._env
 
-    def start_simulation(self):
-        end = self._initial_time + self._sim_duration
-        self._env.run(until=end)
+    @property
+    def start_time(self):
+        return self._initial_time
+
+    @property
+    def duration(self):
+        return self._sim_duration
+
+    @property
+    def end_time(self):
+        return self._initial_time + self._sim_duration
+
+    def start_simulation(self, checkpoint_interval: float = None, on_checkpoint=None):
+        """Runs the simulation until the end. With a `checkpoint_interval` (in simulated seconds)
+        the simulation is paused at each interval to call `on_checkpoint` with the world
+        (e.g. see `blocksim.checkpoint.Checkpointer`). Pausing does not change the order of the events.
+
+        The simulation ends before the end when it is stopped (see `stop`)."""
+        end = self.end_time
+        if checkpoint_interval is None:
+            self._env.run(until=end)
+            return
+        checkpoint = self._env.now
+        while checkpoint < end and self.stop_reason is None:
+            checkpoint = min(checkpoint + checkpoint_interval, end)
+            self._env.run(until=checkpoint)
+            if checkpoint < end and on_checkpoint is not None and self.stop_reason is None:
+                on_checkpoint(self)
+
+    def stop(self, reason: str):
+        """Stops the running simulation after the current event, recording the `reason` in
+        `stop_reason`"""
+        print(f'World at {self._env.now}: simulation stopped, {reason}')
+        self.stop_reason = reason
+        stop = self._env.event()
+        stop.callbacks.append(StopSimulation.callback)
+        stop.succeed(reason)
+
+    def start_telemetry(self, interval: float, nodes: list, output: str = None, on_sample=None,
+                        max_wall_time: float = None):
+        """Starts a process that reports the progress of the simulation every `interval`
+        simulated seconds (see `blocksim.telemetry.TelemetryMonitor`). The processes started
+        before the monitor are not counted as live processes."""
+        monitor = TelemetryMonitor(self, interval, nodes, output, on_sample, max_wall_time)
+        self._env.process(monitor.run())
+        return monitor
 
     def _set_configs(self):
         """Injects the different configuration variables to the environment variable to be
@@ -0,0 +1,38 @@
+import contextlib
+import os
+import pytest
+from blocksim.scenario_generator import generate_scenario
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Nodes of the scenario simulated by the tests
+NODES = 40
+
+
+@pytest.fixture(scope='session')
+def scenarios(tmp_path_factory):
+    """Folder of the scenarios of the tests, with the run ids 0 and 1"""
+    folder = str(tmp_path_factory.mktemp('scenarios')) + '/'
+    for run_id in (0, 1):
+        generate_scenario(NODES, run_id, folder, seed=run_id, topologies=('mst',))
+    return folder
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs the test in a temporary working directory with the `input-parameters` of the
+    repository, so the reports of the simulations are not written to the repository"""
+    os.symlink(os.path.join(REPOSITORY, 'input-parameters'), tmp_path / 'input-parameters')
+    (tmp_path / 'reports').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def run(scenarios, workdir):
+    """Runs a simulation of the scenario of the tests, without its logs"""
+    from blocksim.main import run_model
+
+    def run(run_id=0, duration=1800, **kwargs):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return run_model(run_id, 'mst', NODES, duration=duration, folder_path=scenarios, **kwargs)
+    return run
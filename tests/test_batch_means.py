@@ -0,0 +1,26 @@
+import numpy as np
+from blocksim.batch_means import batch_means, mser_truncation
+
+
+def test_mser_detects_transient():
+    random_state = np.random.default_rng(1)
+    # A warm-up decaying from 20 to the steady state of mean 5, in about 200 observations
+    series = 5 + 15 * np.exp(-np.arange(2000) / 40) + random_state.normal(0, 1, 2000)
+    assert 80 <= mser_truncation(series) <= 300
+    assert mser_truncation(random_state.normal(5, 1, 2000)) < 100
+
+
+def test_batch_means_covers_known_mean():
+    random_state = np.random.default_rng(2)
+    covered = 0
+    for _ in range(100):
+        # AR(1) series of mean 3, autocorrelated as the latencies of consecutive blocks
+        noise = random_state.normal(0, 1, 4000)
+        series = np.empty(4000)
+        series[0] = 3
+        for i in range(1, 4000):
+            series[i] = 3 + 0.7 * (series[i - 1] - 3) + noise[i]
+        result = batch_means(series, batches=20)
+        covered += abs(result['mean'] - 3) <= result['half_width']
+    # The 95% interval covers the mean in about 95 of the 100 runs
+    assert covered >= 88
@@ -0,0 +1,70 @@
+import os
+import pytest
+import simpy
+from blocksim.options import Checkpoints, Replicas
+from test_reproducibility import same_metrics
+
+
+def children():
+    with open(f'/proc/self/task/{os.getpid()}/children') as f:
+        return f.read().split()
+
+
+@pytest.fixture
+def crash(monkeypatch, tmp_path):
+    """Kills the simulation process once it has simulated 450 seconds. With `once`, only the
+    first process that gets there crashes"""
+    def crash(once=True):
+        marker = tmp_path / 'crashed'
+        step = simpy.Environment.step
+        start = []
+
+        def crashing_step(env):
+            if not start:
+                start.append(env.now)
+            if env.now >= start[0] + 450 and not (once and marker.exists()):
+                marker.touch()
+                os._exit(1)
+            step(env)
+        monkeypatch.setattr(simpy.Environment, 'step', crashing_step)
+        return marker
+    return crash
+
+
+def test_checkpoints_same_as_run(run):
+    same_metrics(run(seed=3, duration=900, checkpoints=Checkpoints(300)), run(seed=3, duration=900))
+
+
+def test_seeded_replicas_differ(run):
+    first, second, repeated = run(seed=3, duration=900, replicas=Replicas([5, 6, 5], 300))
+    assert first['av_block_latency'] != second['av_block_latency']
+    same_metrics(first, repeated)
+
+
+def test_resumed_after_crash(run, crash):
+    expected = run(seed=3, duration=900)
+    marker = crash()
+    pid = os.getpid()
+    metrics = run(seed=3, duration=900, checkpoints=Checkpoints(300))
+    assert marker.exists()
+    # Only the calling process returns, and no snapshot is left
+    assert os.getpid() == pid
+    assert children() == []
+    same_metrics(metrics, expected)
+
+
+def test_repeated_crashes_raise(run, crash):
+    crash(once=False)
+    pid = os.getpid()
+    with pytest.raises(RuntimeError, match='crashed'):
+        run(seed=3, duration=900, checkpoints=Checkpoints(300))
+    assert os.getpid() == pid
+    assert children() == []
+
+
+def test_report_errors_not_retried(run, workdir):
+    # The reports cannot be written, so the process that finishes the simulation fails
+    os.rmdir(workdir / 'reports')
+    with pytest.raises(FileNotFoundError):
+        run(seed=3, duration=900, checkpoints=Checkpoints(300))
+    assert children() == []
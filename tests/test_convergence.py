@@ -0,0 +1,14 @@
+from blocksim.options import Convergence, OnWorld
+from blocksim.report_engine import ReportEngine
+
+
+def test_samples_blocks_of_longest_chain(run):
+    worlds = []
+    # The rule never holds, so the simulation runs until the end
+    run(seed=2, duration=7200,
+        observers=[OnWorld(worlds.append), Convergence(settle_time=600, warmup_blocks=0, min_blocks=10**6)])
+    controller = worlds[0].env.convergence
+    report = ReportEngine(controller.nodes, worlds[0].env.data)
+    # The blocks of the forks are not sampled, so there is at most one sample for each block
+    # of the report (the genesis has no latency)
+    assert 0 < len(controller.latencies) < len(report.block_num_hash)
@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_fast_forward_close_to_simulation(run, seed):
+    simulated = run(seed=seed)
+    fast_forward = run(seed=seed, fast_forward=True)
+    assert fast_forward.keys() == {'av_block_latency', 'av_finality_time'}
+    assert fast_forward['av_block_latency'] == pytest.approx(simulated['av_block_latency'], rel=0.05)
+    # The same blocks are mined at the same times, and reach the nodes in almost the same order
+    assert fast_forward['av_finality_time'] == pytest.approx(simulated['av_finality_time'], rel=0.01)
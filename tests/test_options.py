@@ -0,0 +1,12 @@
+import pytest
+from blocksim.options import Checkpoints, Partitions, Replicas, check_options
+
+
+def test_unsupported_features_raise():
+    with pytest.raises(ValueError, match='Partitions does not support fast_forward'):
+        check_options([Partitions(2)], {'partitions', 'fast_forward'})
+    with pytest.raises(ValueError, match='Checkpoints does not support ensemble'):
+        check_options([Checkpoints(600)], {'checkpoints', 'ensemble'})
+    with pytest.raises(ValueError, match='Replicas does not support partitions'):
+        check_options([Replicas([1, 2], 600)], {'replicas', 'partitions'})
+    check_options([Checkpoints(600), Replicas([1, 2], 600)], {'checkpoints', 'replicas', 'fast_forward'})
@@ -0,0 +1,10 @@
+import pytest
+from blocksim.options import Partitions
+from test_reproducibility import same_metrics
+
+
+@pytest.mark.parametrize('partitions, by', [(2, 'location'), (3, 'location'), (3, 'graph')])
+def test_partitioned_same_as_sequential(run, partitions, by):
+    partitioned = run(seed=1, duration=900, partitions=Partitions(partitions, by))
+    sequential = run(seed=1, duration=900)
+    same_metrics(partitioned, sequential)
@@ -0,0 +1,15 @@
+import numpy as np
+
+
+def same_metrics(a: dict, b: dict):
+    assert a.keys() == b.keys()
+    for metric in a:
+        assert np.array_equal(a[metric], b[metric], equal_nan=True), metric
+
+
+def test_same_seed_same_metrics(run):
+    same_metrics(run(seed=5), run(seed=5))
+
+
+def test_different_seeds_differ(run):
+    assert run(seed=5)['av_block_latency'] != run(seed=6)['av_block_latency']
@@ -0,0 +1,24 @@
+import pytest
+from blocksim.results_db import ResultsDB, import_reports
+
+
+def test_algo_filters_any_case(tmp_path):
+    db = ResultsDB(str(tmp_path / 'results.db'))
+    db.add_run('mst', 100, {'av_block_latency': 1.0}, run_id=0)
+    db.add_run('BasePSO', 100, {'av_block_latency': 2.0}, run_id=0)
+    assert list(db.values('av_block_latency', algo='MST')) == [1.0]
+    assert list(db.values('av_block_latency', algo='base_pso')) == [2.0]
+    assert sorted(db.values('av_block_latency', algo=['MST', 'BasePSO'])) == [1.0, 2.0]
+    db.close()
+
+
+def test_absolute_times_not_imported(tmp_path):
+    reports = tmp_path / 'reports' / '100'
+    reports.mkdir(parents=True)
+    (reports / '100_mst_1_latencies.csv').write_text('1,2.5\n2,1666966355.78\n3,3.5\n')
+    db = ResultsDB(str(tmp_path / 'results.db'))
+    with pytest.warns(UserWarning, match='1 values are absolute times'):
+        assert import_reports(db, str(tmp_path / 'reports')) == (1, 1)
+    assert sorted(db.values('av_block_latency', detail=True)) == [2.5, 3.5]
+    assert list(db.values('av_block_latency')) == [3.0]
+    db.close()
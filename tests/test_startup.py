@@ -0,0 +1,15 @@
+import subprocess
+import sys
+from conftest import REPOSITORY
+
+HEAVY_MODULES = ('numpy', 'scipy', 'simpy', 'schema', 'Crypto', 'sha3', 'sqlite3', 'multiprocessing',
+                 'tracemalloc', 'blocksim.world', 'blocksim.utils', 'blocksim.report_engine')
+
+
+def test_import_main_is_lazy():
+    # In a new interpreter, as the modules imported by the tests would be in `sys.modules`
+    script = ('import sys, blocksim.main\n'
+              f'print(" ".join(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))')
+    output = subprocess.run([sys.executable, '-c', script], cwd=REPOSITORY, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.split() == []
@@ -0,0 +1,33 @@
+import os
+from blocksim import main
+from blocksim.sweep import Sweep, job_key
+from conftest import NODES
+
+
+def test_job_key_changes_with_inputs(workdir):
+    folder = workdir / 'scenario'
+    folder.mkdir()
+    properties = folder / f'{NODES}/0_node_properties.json'
+    properties.parent.mkdir()
+    properties.write_text('{}')
+    job = {'num_nodes': NODES, 'folder_path': str(folder), 'run_id': 0}
+    key = job_key(job)
+    assert job_key(dict(job)) == key
+    assert job_key(dict(job, seed=1)) != key
+    assert job_key(dict(job, block_gas_limit=4200000)) != key
+    properties.write_text('{"changed": true}')
+    assert job_key(job) != key
+
+
+def test_sweep_skips_cached_jobs(workdir, scenarios, capsys):
+    base = {'num_nodes': NODES, 'folder_path': scenarios, 'duration': 300, 'av_neighbours': 5}
+    sweep = Sweep([dict(base, run_id=0), dict(base, run_id=1)], str(workdir / 'cache'), processes=1)
+    sweep._save(sweep.keys[0], {'key': sweep.keys[0], 'metrics': 'cached'})
+    cached, result = sweep.run()
+    assert cached['metrics'] == 'cached'
+    assert result['job']['run_id'] == 1 and 'av_block_latency' in result['metrics']
+    assert '1 in the cache, 1 to run' in capsys.readouterr().out
+    # The job runs in a forked process, which does not change the module variables of this one
+    assert main.AV_NEIGHBOURS == 9
+    assert os.path.isfile(sweep._path(sweep.keys[1]))
+    assert Sweep(sweep.jobs, sweep.cache_dir).pending() == {}
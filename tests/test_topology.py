@@ -0,0 +1,41 @@
+import json
+import os
+import numpy as np
+import pytest
+from blocksim.links import LinkMatrices
+from blocksim.topology import IncrementalTopology, TopologyScorer
+from conftest import REPOSITORY
+
+NODES = 30
+
+
+@pytest.fixture
+def scorer():
+    with open(os.path.join(REPOSITORY, 'input-parameters/config.json')) as f:
+        config = json.load(f)
+    with open(os.path.join(REPOSITORY, 'input-parameters/delays.json')) as f:
+        delays = json.load(f)[config['blockchain']]
+    random_state = np.random.default_rng(3)
+    latencies = random_state.uniform(0.01, 0.3, (NODES, NODES))
+    delays_per_MB = 8 / random_state.uniform(5, 100, (NODES, NODES))
+    np.fill_diagonal(latencies, 0.0)
+    np.fill_diagonal(delays_per_MB, 0.0)
+    links = LinkMatrices([f'node{i}' for i in range(NODES)], latencies, delays_per_MB)
+    hashrates = random_state.uniform(1, 10, NODES) * (random_state.random(NODES) < 0.5)
+    return TopologyScorer(links, config, delays, hashrates)
+
+
+def test_incremental_score_same_as_scorer(scorer):
+    random_state = np.random.default_rng(4)
+    solution = {i: [int(j) for j in random_state.choice(NODES, 3, replace=False) if j != i] for i in range(NODES)}
+    topology = IncrementalTopology(scorer, solution)
+    assert topology.score == pytest.approx(scorer.score(solution))
+    for _ in range(300):
+        node_id = int(random_state.integers(NODES))
+        neighbours = topology.solution[node_id]
+        if neighbours and random_state.random() < 0.5:
+            score = topology.remove_neighbour(node_id, neighbours[int(random_state.integers(len(neighbours)))])
+        else:
+            score = topology.add_neighbour(node_id, int(random_state.integers(NODES)))
+        assert score == pytest.approx(scorer.score(topology.solution))
+    assert np.allclose(topology.propagation_times, scorer.propagation_times(topology.solution))
@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from blocksim.models.network import Network
+from blocksim.utils import AliasTable
+
+
+def test_alias_table_frequencies_match_weights():
+    weights = [5, 1, 0, 3, 1]
+    table = AliasTable(weights)
+    draws = table.draw(np.random.default_rng(1), 200000)
+    frequencies = np.bincount(draws, minlength=len(weights)) / len(draws)
+    assert np.allclose(frequencies, np.array(weights) / sum(weights), atol=0.005)
+    uniforms = np.random.default_rng(2).random((100000, 2))
+    picks = np.bincount([table.pick(u_column, u_coin) for u_column, u_coin in uniforms], minlength=len(weights))
+    assert np.allclose(picks / len(uniforms), np.array(weights) / sum(weights), atol=0.01)
+
+
+def test_second_miner_needs_two_hashing_miners():
+    env = SimpleNamespace(config={'blockchain': 'bitcoin'})
+    network = Network(env, 'network', random_state=np.random.default_rng(1))
+    for address, hashrate in (('a', 10), ('b', 0)):
+        network.add_node(SimpleNamespace(address=address, is_mining=True, hashrate=hashrate))
+    network._init_lists()
+    with pytest.raises(ValueError, match='at least two miners'):
+        network._select_second_miner(0)
+    network.set_hashrate(network.get_node('b'), 5)
+    network._init_lists()
+    assert network._select_second_miner(0) == 1
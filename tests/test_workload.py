@@ -0,0 +1,28 @@
+import numpy as np
+from blocksim.workload import TRACE_DTYPE, convert_trace, read_trace
+
+
+def test_converted_trace_same_as_csv(tmp_path):
+    csv_path = str(tmp_path / 'trace.csv')
+    with open(csv_path, 'w') as f:
+        f.write('timestamp,gas_price,gas_limit,size,origin\n')
+        for i in range(25):
+            f.write(f'{1.5 * i},{20e9 + i},{21000 + i},{0.25 * i},{i % 4 - 1}\n')
+    npy_path = str(tmp_path / 'trace.npy')
+    convert_trace(csv_path, npy_path, chunk_size=7)
+    csv_chunks = list(read_trace(csv_path, chunk_size=10))
+    npy_chunks = list(read_trace(npy_path, chunk_size=10))
+    assert [len(chunk) for chunk in npy_chunks] == [10, 10, 5]
+    records = np.concatenate(npy_chunks)
+    assert records.dtype == TRACE_DTYPE
+    assert np.array_equal(records, np.concatenate(csv_chunks))
+    assert list(records['origin'][:4]) == [-1, 0, 1, 2]
+    assert records['gas_limit'][24] == 21024 and records['timestamp'][24] == 36.0
+
+
+def test_csv_trace_without_origin(tmp_path):
+    csv_path = str(tmp_path / 'trace.csv')
+    with open(csv_path, 'w') as f:
+        f.write('timestamp,gas_price,gas_limit,size\n0,1,21000,0.5\n2,1,21000,0.5\n')
+    records = np.concatenate(list(read_trace(csv_path)))
+    assert list(records['timestamp']) == [0, 2] and list(records['origin']) == [-1, -1]